@@ -0,0 +1,90 @@
+"""Benchmark for adapting Anthropic requests to AI Gateway.
+
+Prepares the options of a 200-turn, ~2 MB conversation (long tool results and base64 images included), and
+reports the time and peak memory per request of the copy-on-write adaptation against deep copying the
+options first, which is what `_prepare_options` used to do.
+
+    python benchmarks/bench_anthropic_prepare_options.py
+"""
+
+import base64
+import json
+import os
+import time
+import tracemalloc
+from copy import deepcopy
+
+from anthropic._models import FinalRequestOptions
+
+os.environ.setdefault("MESH_DEPENDENCY_AI_GATEWAY_BASE_URL", "http://localhost")
+
+from handy_utils.utils.anthropic_provider import AsyncAnthropicVertexAIGateway  # noqa: E402
+
+TURNS = 200
+ITERATIONS = 20
+
+
+def build_options() -> FinalRequestOptions:
+    image = base64.b64encode(os.urandom(6 * 1024)).decode()
+    messages = []
+    for turn in range(TURNS):
+        if turn % 2:
+            messages.append({"role": "assistant", "content": [{"type": "text", "text": "Looking into it. " * 100}]})
+        elif turn % 10 == 0:
+            content = [
+                {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": image}},
+                {"type": "text", "text": "What is in this plot?"},
+            ]
+            messages.append({"role": "user", "content": content})
+        else:
+            messages.append({"role": "user", "content": "tool output line\n" * 1000})
+    return FinalRequestOptions.construct(
+        method="post",
+        url="/v1/messages",
+        json_data={"model": "claude", "max_tokens": 1024, "messages": messages},
+    )
+
+
+async def prepare_copy_on_write(client: AsyncAnthropicVertexAIGateway, options: FinalRequestOptions):
+    return await client._prepare_options(options.model_copy())
+
+
+async def prepare_deepcopy(client: AsyncAnthropicVertexAIGateway, options: FinalRequestOptions):
+    return await client._prepare_options(deepcopy(options))
+
+
+def run(coro):
+    """Run a coroutine that never awaits, without the overhead of an event loop."""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine awaited")
+
+
+def measure(prepare, client: AsyncAnthropicVertexAIGateway, options: FinalRequestOptions) -> tuple[float, int]:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        run(prepare(client, options))
+    elapsed_ms = (time.perf_counter() - start) / ITERATIONS * 1e3
+
+    tracemalloc.start()
+    run(prepare(client, options))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak
+
+
+def main():
+    client = AsyncAnthropicVertexAIGateway(prompt_caching_strategy="last_4")
+    options = build_options()
+    size = len(json.dumps(options.json_data))
+    print(f"{TURNS} turns, {size / 1024 / 1024:.1f} MB conversation")
+    print(f"{'strategy':<16} {'ms / request':>14} {'peak bytes':>14}")
+    for name, prepare in [("deepcopy", prepare_deepcopy), ("copy-on-write", prepare_copy_on_write)]:
+        elapsed_ms, peak = measure(prepare, client, options)
+        print(f"{name:<16} {elapsed_ms:>14.2f} {peak:>14,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Benchmark for uploading many pages to Confluence.
+
+Updates pages of a space on a local fake Confluence answering after a fixed latency, once with a synchronous
+`atlassian.Confluence` client per page (as publishing used to, 4 pages at a time) and once with `ConfluenceClient`,
+and reports the wall time and number of requests of each.
+
+    python benchmarks/bench_confluence_upload.py
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import yaml
+
+from handy_utils.configuration import get_config_path
+
+SPACE_PAGES = 1000
+UPLOADS = 100
+LATENCY = 0.02
+CONCURRENCY = 4
+
+
+class FakeConfluence(BaseHTTPRequestHandler):
+    pages = {str(i): {"id": str(i), "title": f"Page {i}", "version": 1, "body": ""} for i in range(SPACE_PAGES)}
+    requests = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.reply()
+
+    do_PUT = do_GET
+
+    @staticmethod
+    def get_content(page: dict, expand: str = "") -> dict:
+        content = {"id": page["id"], "type": "page", "title": page["title"], "version": {"number": page["version"]}}
+        if "body.storage" in expand:
+            content["body"] = {"storage": {"value": page["body"]}}
+        return content
+
+    def reply(self):
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with self.lock:
+            FakeConfluence.requests += 1
+        time.sleep(LATENCY)
+        path = url.path.removeprefix("/wiki").removeprefix("/rest/api/content").strip("/")
+        if url.path.endswith("/history"):
+            data = {"lastUpdated": {"number": self.pages[path.split("/")[0]]["version"]}}
+        elif path:
+            if self.command == "PUT":
+                update = json.loads(body)
+                self.pages[path].update(version=update["version"]["number"], body=update["body"]["storage"]["value"])
+            data = self.get_content(self.pages[path], query.get("expand", ""))
+        else:
+            pages = [page for page in self.pages.values() if query.get("title", page["title"]) == page["title"]]
+            start, limit = int(query.get("start", 0)), int(query.get("limit", 25))
+            data = {"results": [self.get_content(page) for page in pages[start : start + limit]], "_links": {}}
+            if start + limit < len(pages):
+                data["_links"] = {
+                    "context": "/wiki",
+                    "next": f"/rest/api/content?{urlencode({**query, 'start': start + limit})}",
+                }
+        content = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def upload_sync(url: str, text: str, title: str) -> None:
+    from atlassian import Confluence  # type: ignore
+
+    confluence = Confluence(url=f"{url}/", cloud=True, username="user", password="key")
+    page = confluence.get_page_by_title(space="DOC", title=title)
+    confluence.update_page(page_id=page["id"], title=title, body=text, representation="storage")
+
+
+async def upload_async(pages: list[tuple[str, str, None]]) -> None:
+    from handy_utils.convert_to_confluence.confluence_client import ConfluenceClient
+
+    async with ConfluenceClient() as client:
+        await client.upload_pages(pages)
+
+
+def main() -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeConfluence)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["HOME"] = tempfile.mkdtemp()
+    get_config_path().parent.mkdir(parents=True)
+    get_config_path().write_text(
+        yaml.dump(
+            {
+                "openai_api_key": "XXX",
+                "confluence_domain": url,
+                "confluence_space_key": "DOC",
+                "confluence_max_concurrent_uploads": CONCURRENCY,
+                "confluence_requests_per_second": 0,
+            }
+        )
+    )
+    titles = [f"Page {i * SPACE_PAGES // UPLOADS}" for i in range(UPLOADS)]
+
+    print(f"{UPLOADS} page updates in a space of {SPACE_PAGES} pages, {LATENCY * 1000:.0f} ms latency")
+    FakeConfluence.requests = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(CONCURRENCY) as executor:
+        list(executor.map(upload_sync, [url] * UPLOADS, ["<p>sync</p>"] * UPLOADS, titles))
+    print(f"  atlassian-python-api: {time.perf_counter() - start:6.2f}s, {FakeConfluence.requests} requests")
+
+    FakeConfluence.requests = 0
+    start = time.perf_counter()
+    asyncio.run(upload_async([("<p>async</p>", title, None) for title in titles]))
+    print(f"      ConfluenceClient: {time.perf_counter() - start:6.2f}s, {FakeConfluence.requests} requests")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark for converting notebook HTML to Atlassian Storage Format.
+
+Converts ~20 MB of HTML (mostly DataFrame tables, as rendered by nbconvert) and reports the time and peak memory
+of the streaming conversion, with `html.parser` and lxml, against building a BeautifulSoup tree and converting it
+recursively, which is what `convert_html_str_to_asf` used to do.
+
+    python benchmarks/bench_html_to_asf.py
+"""
+
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+from bs4.element import NavigableString, Tag
+
+from handy_utils.convert_to_confluence.html_to_asf import convert_html_str_to_asf, etree
+
+TABLES = 800
+ROWS = 200
+
+
+def build_html() -> str:
+    header = "<tr>" + "".join(f"<th>column_{i}</th>" for i in range(8)) + "</tr>"
+    rows = "".join(
+        f"<tr><th>{row}</th>" + "".join(f"<td>{row * i / 7:.4f}</td>" for i in range(7)) + "</tr>\n"
+        for row in range(ROWS)
+    )
+    table = f'<div><table border="1" class="dataframe">\n<thead>{header}</thead>\n<tbody>\n{rows}</tbody></table></div>'
+    cell = '<h2 id="Section">Section<a class="anchor-link" href="#Section">¶</a></h2>\n<p>Some <b>text</b>.</p>\n'
+    return "<html><body>" + "\n".join(cell + table for _ in range(TABLES)) + "</body></html>"
+
+
+def recursive_html_to_asf(el) -> str:
+    """The recursive conversion `convert_html_str_to_asf` used, reduced to the elements in the benchmark."""
+    if isinstance(el, (str, NavigableString)):
+        return str(el)
+    inner = "".join(recursive_html_to_asf(c) for c in el.children)
+    tag = el.name if isinstance(el, Tag) else None
+    if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+        return f"<{tag}>{inner}</{tag}>"
+    elif tag == "p":
+        return f"<p>{inner}</p>"
+    elif tag == "b":
+        return f"<strong>{inner}</strong>"
+    elif tag == "a":
+        if inner == "¶":
+            return ""
+        href = el.attrs.get("href", "")
+        return f'<ac:link><ri:page ri:content-title="{href}"/><ac:plain-text-link-body><![CDATA[{inner}]]></ac:plain-text-link-body></ac:link>'  # noqa: E501
+    return inner
+
+
+def convert_recursive(html: str) -> str:
+    return recursive_html_to_asf(BeautifulSoup(html, "html.parser"))
+
+
+def measure(convert, html: str) -> tuple[str, float, int]:
+    start = time.perf_counter()
+    convert(html)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    output = convert(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, elapsed, peak
+
+
+def main():
+    html = build_html()
+    print(f"{TABLES} tables of {ROWS} rows, {len(html) / 1024 / 1024:.1f} MB of HTML")
+    converters = [
+        ("bs4 recursive", convert_recursive),
+        ("streaming html.parser", convert_html_str_to_asf),
+    ]
+    if etree is not None:
+        converters.append(("streaming lxml", lambda html: convert_html_str_to_asf(html, parser="lxml")))
+    print(f"{'converter':<24} {'seconds':>10} {'peak bytes':>16}")
+    expected = None
+    for name, convert in converters:
+        output, elapsed, peak = measure(convert, html)
+        expected = expected or output
+        assert output == expected, f"{name} output differs"
+        print(f"{name:<24} {elapsed:>10.2f} {peak:>16,}")
+
+
+if __name__ == "__main__":
+    main()
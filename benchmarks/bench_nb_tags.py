@@ -0,0 +1,110 @@
+"""Benchmark for applying nb_tags while rendering notebooks to Confluence.
+
+Renders a notebook of thousands of cells, a fifth of them with ~100 KB base64 images of which half are in removed
+cells, and reports the time and peak memory of the single-pass `NbTagPreprocessor` against the tag loop over the
+cells followed by `TagRemovePreprocessor`, which is what `render_notebook` used to do. Both extract the images into
+attachments with `ImageAttachmentPreprocessor`, so that their outputs can be compared.
+
+    python benchmarks/bench_nb_tags.py
+"""
+
+import base64
+import copy
+import os
+import time
+import tracemalloc
+
+import nbformat
+from nbconvert.exporters import HTMLExporter
+from nbconvert.preprocessors import TagRemovePreprocessor
+from traitlets.config import Config
+
+from handy_utils.convert_to_confluence.convert_to_confluence import get_exporter, template_path
+from handy_utils.convert_to_confluence.html_to_asf import convert_html_str_to_asf
+from handy_utils.convert_to_confluence.preprocessors import ImageAttachmentPreprocessor
+
+CELLS = 3000
+
+
+def build_notebook() -> nbformat.NotebookNode:
+    image = base64.b64encode(os.urandom(75 * 1024)).decode()
+    nb = nbformat.v4.new_notebook()
+    for i in range(CELLS):
+        if i % 3 == 0:
+            nb.cells.append(nbformat.v4.new_markdown_cell(f"## Section {i}\n\nSome **bold** text."))
+        elif i % 5 == 0:
+            tag = "#|nb_tag: skip\n" if i % 10 == 0 else ""
+            output = nbformat.v4.new_output("display_data", data={"image/png": image, "text/plain": "<Figure>"})
+            nb.cells.append(nbformat.v4.new_code_cell(f"{tag}plot({i})", outputs=[output]))
+        else:
+            tag = "#|nb_tag: remove_input\n" if i % 7 == 0 else ""
+            output = nbformat.v4.new_output("stream", text=f"{i}\n")
+            nb.cells.append(nbformat.v4.new_code_cell(f"{tag}x = {i}", outputs=[output]))
+    return nb
+
+
+def get_previous_exporter() -> HTMLExporter:
+    c = Config()
+    c.HTMLExporter.extra_template_basedirs = [template_path]
+    c.HTMLExporter.exclude_input_prompt = True
+    c.HTMLExporter.exclude_output_prompt = True
+    c.HTMLExporter.template_name = "atlassian-confluence"
+    c.HTMLExporter.filters = {"html_to_asf": convert_html_str_to_asf}
+    c.TagRemovePreprocessor.remove_cell_tags = ("remove_cell", "skip")
+    c.TagRemovePreprocessor.remove_all_outputs_tags = ("remove_output",)
+    c.TagRemovePreprocessor.remove_input_tags = ("remove_input",)
+    c.TagRemovePreprocessor.enabled = True
+    exporter = HTMLExporter(config=c)
+    exporter.register_preprocessor(TagRemovePreprocessor(config=c), True)
+    exporter.register_preprocessor(ImageAttachmentPreprocessor(config=c), True)
+    return exporter
+
+
+def render_previous(exporter: HTMLExporter, nb: nbformat.NotebookNode) -> str:
+    for cell in nb.cells:
+        if cell.source.startswith("#|nb_tag:"):
+            c = cell.source.split("\n")[0]
+            cell.source = cell.source.replace(c, "").strip()
+            tag_name = c.replace("#|nb_tag:", "").strip()
+            if "tags" not in cell.metadata:
+                cell.metadata["tags"] = []
+            cell.metadata["tags"].append(tag_name)
+            cell.metadata["tags"] = list(set(cell.metadata["tags"]))
+    return exporter.from_notebook_node(nb)[0]
+
+
+def render_single_pass(exporter: HTMLExporter, nb: nbformat.NotebookNode) -> str:
+    return exporter.from_notebook_node(nb)[0]
+
+
+def measure(render, exporter: HTMLExporter, nb: nbformat.NotebookNode) -> tuple[str, float, int]:
+    notebooks = [copy.deepcopy(nb), copy.deepcopy(nb)]
+    start = time.perf_counter()
+    render(exporter, notebooks[0])
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    output = render(exporter, notebooks[1])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, elapsed, peak
+
+
+def main():
+    nb = build_notebook()
+    print(f"{CELLS} cells, {len(nbformat.writes(nb)) / 1024 / 1024:.1f} MB notebook")
+    print(f"{'preprocessing':<24} {'seconds':>10} {'peak bytes':>16}")
+    outputs = []
+    for name, render, exporter in [
+        ("tag loop + TagRemove", render_previous, get_previous_exporter()),
+        ("NbTagPreprocessor", render_single_pass, get_exporter()),
+    ]:
+        render(exporter, copy.deepcopy(nb))  # Compile the templates
+        output, elapsed, peak = measure(render, exporter, nb)
+        outputs.append(output)
+        print(f"{name:<24} {elapsed:>10.2f} {peak:>16,}")
+    assert outputs[0] == outputs[1], "outputs differ"
+
+
+if __name__ == "__main__":
+    main()
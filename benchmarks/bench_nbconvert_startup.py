@@ -0,0 +1,78 @@
+"""Benchmark for the startup of `nb2conf`.
+
+Converts a notebook in fresh processes, first with an empty cache of compiled templates and then with the cache
+filled by the first run, and reports the time spent loading (compiling or reading back) the templates separately
+from the time spent converting the notebook.
+
+    python benchmarks/bench_nbconvert_startup.py
+"""
+
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+RUNS = 5
+
+CHILD = """
+import json
+import time
+
+import nbformat
+
+from handy_utils.convert_to_confluence.convert_to_confluence import get_exporter
+
+nb = nbformat.v4.new_notebook()
+for i in range(20):
+    nb.cells.append(nbformat.v4.new_markdown_cell(f"## Section {i}\\n\\nSome **bold** text and a [link](#x)."))
+    nb.cells.append(nbformat.v4.new_code_cell(f"x = {i}", outputs=[nbformat.v4.new_output("stream", text="out\\n")]))
+
+start = time.perf_counter()
+exporter = get_exporter()
+environment = exporter.environment
+get_template = environment.get_template
+compile_time = 0.0
+
+
+def timed_get_template(*args, **kwargs):
+    global compile_time
+    template_start = time.perf_counter()
+    try:
+        return get_template(*args, **kwargs)
+    finally:
+        compile_time += time.perf_counter() - template_start
+
+
+# Templates are loaded, including the ones they extend, through `get_template`
+environment.get_template = timed_get_template
+exporter.from_notebook_node(nb)
+total = time.perf_counter() - start
+print(json.dumps({"compile": compile_time, "convert": total - compile_time}))
+"""
+
+
+def run_child(home: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], env={"HOME": home, "PATH": ""}, capture_output=True, text=True, check=True
+    )
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+def main():
+    print(f"{'templates':<12} {'compile ms':>12} {'convert ms':>12} {'process s':>10}")
+    for cache in ("cold", "cached"):
+        results = []
+        for _ in range(RUNS):
+            with tempfile.TemporaryDirectory() as home:
+                if cache == "cached":
+                    run_child(home)
+                start = time.perf_counter()
+                result = run_child(home)
+                results.append((result["compile"], result["convert"], time.perf_counter() - start))
+        compile_time, convert_time, process_time = (sorted(values)[RUNS // 2] for values in zip(*results))
+        print(f"{cache:<12} {compile_time * 1e3:>12.1f} {convert_time * 1e3:>12.1f} {process_time:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark for rendering a very large notebook to Confluence storage format.
+
+Renders a ~150 MB notebook of embedded plots, half of them in removed cells, in fresh processes and reports the
+time and peak RSS (Linux only) of reading and rendering it in batches of cells straight to the output file, against
+reading it whole with `nbformat.read` and rendering it to a single string, which is what `render_notebook` used to
+do.
+
+    python benchmarks/bench_stream_notebook.py
+"""
+
+import base64
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import nbformat
+
+PLOTS = 400
+PLOT_SIZE = 384 * 1024
+
+CHILD = """
+import importlib
+import re
+import sys
+from pathlib import Path
+
+import nbformat
+
+module = importlib.import_module("handy_utils.convert_to_confluence.convert_to_confluence")
+mode, notebook_path, output_path = sys.argv[1:]
+if mode == "streaming":
+    module.render_notebook(notebook_path, output_path)
+else:
+    with open(notebook_path) as f:
+        nb = nbformat.read(f, as_version=4)
+    body, _ = module.get_exporter().from_notebook_node(nb)
+    Path(output_path).write_text(body)
+# Peak RSS since exec, unlike `ru_maxrss` which includes that of the forked parent
+print(int(re.search(r"VmHWM:\\s+(\\d+) kB", Path("/proc/self/status").read_text())[1]) * 1024)
+"""
+
+
+def build_notebook(path: Path) -> None:
+    nb = nbformat.v4.new_notebook()
+    for i in range(PLOTS):
+        image = base64.b64encode(os.urandom(PLOT_SIZE * 3 // 4)).decode()
+        output = nbformat.v4.new_output("display_data", data={"image/png": image, "text/plain": "<Figure>"})
+        tag = "#|nb_tag: skip\n" if i % 2 else ""
+        nb.cells.append(nbformat.v4.new_markdown_cell(f"## Plot {i}\n\nSome **bold** text."))
+        nb.cells.append(nbformat.v4.new_code_cell(f"{tag}plot({i})", outputs=[output]))
+    nbformat.write(nb, path)
+
+
+def run_child(mode: str, notebook_path: Path, output_path: Path) -> tuple[float, int]:
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, mode, str(notebook_path), str(output_path)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return time.perf_counter() - start, int(output.stdout.splitlines()[-1])
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        notebook_path = Path(tmp_dir) / "notebook.ipynb"
+        build_notebook(notebook_path)
+        print(f"{PLOTS} plots, {notebook_path.stat().st_size / 1024 / 1024:.0f} MB notebook")
+        print(f"{'rendering':<12} {'seconds':>10} {'peak RSS bytes':>16}")
+        outputs = []
+        for mode in ("streaming", "whole"):
+            output_path = Path(tmp_dir) / f"{mode}.html"
+            elapsed, peak = run_child(mode, notebook_path, output_path)
+            outputs.append(output_path.read_text())
+            print(f"{mode:<12} {elapsed:>10.2f} {peak:>16,}")
+        assert outputs[0] == outputs[1], "outputs differ"
+
+
+if __name__ == "__main__":
+    main()
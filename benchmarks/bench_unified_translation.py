@@ -0,0 +1,80 @@
+"""Micro-benchmark for the unified provider request/response translation.
+
+Translates an OpenAI chat request with a 1 MB prompt into the unified gateway format and a 1 MB gateway
+response back into the OpenAI format, reporting µs and peak bytes allocated per round trip for each JSON
+backend that is available.
+
+    python benchmarks/bench_unified_translation.py
+"""
+
+import json
+import os
+import time
+import tracemalloc
+
+from httpx import Request, Response
+
+os.environ.setdefault("MESH_DEPENDENCY_AI_GATEWAY_BASE_URL", "http://localhost")
+
+from handy_utils.utils import json_codec  # noqa: E402
+from handy_utils.utils.unified_provider import UnifiedProviderHttpClient  # noqa: E402
+
+PROMPT_SIZE = 1024 * 1024
+ITERATIONS = 20
+
+
+def build_fixtures() -> tuple[Request, bytes]:
+    prompt = "".join(chr(32 + i % 90) for i in range(PROMPT_SIZE))
+    request = Request(
+        "POST",
+        "http://localhost/chat/completions",
+        content=json.dumps({"model": "gemini-2.5-flash", "messages": [{"role": "user", "content": prompt}]}).encode(),
+    )
+    response_body = json.dumps(
+        {
+            "response_payload": {
+                "id": "1",
+                "object": "chat.completion",
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": [{"type": "text", "text": prompt}]}}
+                ],
+            },
+            "platform_attributes": {"metrics": {"usage": {"input_tokens": 1, "output_tokens": 1, "total_tokens": 2}}},
+        }
+    ).encode()
+    return request, response_body
+
+
+def round_trip(client: UnifiedProviderHttpClient, request: Request, response_body: bytes) -> bytes:
+    mod_req = client._prep_request(request, {"Content-Type": "application/json"})
+    resp = Response(200, content=response_body, request=mod_req)
+    return client._prep_response(resp, mod_req, client.model).content
+
+
+def measure(client: UnifiedProviderHttpClient, request: Request, response_body: bytes) -> tuple[float, int]:
+    round_trip(client, request, response_body)
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        round_trip(client, request, response_body)
+    elapsed_us = (time.perf_counter() - start) / ITERATIONS * 1e6
+
+    tracemalloc.start()
+    round_trip(client, request, response_body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_us, peak
+
+
+def main():
+    client = UnifiedProviderHttpClient()
+    request, response_body = build_fixtures()
+    backends = {"json": None, "orjson": json_codec.orjson} if json_codec.orjson else {"json": None}
+    print(f"{'backend':<10} {'µs / round trip':>16} {'peak bytes allocated':>22}")
+    for name, module in backends.items():
+        json_codec.orjson = module
+        elapsed_us, peak = measure(client, request, response_body)
+        print(f"{name:<10} {elapsed_us:>16,.0f} {peak:>22,}")
+
+
+if __name__ == "__main__":
+    main()
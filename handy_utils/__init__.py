@@ -4,23 +4,32 @@ __author__ = """Akhil Vempali"""
 __email__ = "vempaliakhil96@gmail.com"
 __version__ = "0.4.0"
 
+import functools
 import os
 
-import logfire
-from loguru import logger
 
-LOGFIRE_API_KEY = os.getenv("HANDY_UTILS_LOGFIRE_API_KEY", None)
+@functools.cache
+def configure_logfire() -> None:
+    """Configure Logfire and instrument pydantic-ai.
 
-if LOGFIRE_API_KEY is None:
-    logger.warning(
-        "HANDY_UTILS_LOGFIRE_API_KEY is not set. Logging will not be sent to Logfire. "
-        "Set the environment variable to enable logging."
-    )
+    This is deferred until an LLM-backed command runs so that importing the package (and running
+    lightweight commands such as `config path`) does not pay the Logfire / OpenTelemetry startup cost.
+    """
+    import logfire
+    from loguru import logger
+
+    logfire_api_key = os.getenv("HANDY_UTILS_LOGFIRE_API_KEY", None)
 
-logfire.configure(
-    token=LOGFIRE_API_KEY,
-    scrubbing=False,
-    service_name="handy-utils",
-    console=False,
-)
-logfire.instrument_pydantic_ai()
+    if logfire_api_key is None:
+        logger.warning(
+            "HANDY_UTILS_LOGFIRE_API_KEY is not set. Logging will not be sent to Logfire. "
+            "Set the environment variable to enable logging."
+        )
+
+    logfire.configure(
+        token=logfire_api_key,
+        scrubbing=False,
+        service_name="handy-utils",
+        console=False,
+    )
+    logfire.instrument_pydantic_ai()
@@ -1,11 +1,13 @@
-"""Console script for handy_utils."""
+"""Console script for handy_utils.
 
-import click
+Feature modules pull in heavy dependencies (nbconvert, bs4, pydantic-ai, ...), so they are
+imported inside the command that needs them rather than at the top of this module. This keeps `--help` and
+lightweight commands such as `config path` fast.
+"""
+
+import asyncio
 
-from handy_utils.configuration import generate_config, get_config_path, view_config
-from handy_utils.convert_to_confluence import convert_to_confluence
-from handy_utils.generate_commit import generate_llm_commit_message, perform_commit
-from handy_utils.obsidian_sync import sync_git_repo
+import click
 
 
 @click.group("handy-utils")
@@ -21,11 +23,29 @@ def main():
 @click.option(
     "--additional-message", "-m", type=str, help="Additional message to be used to generate the commit message."
 )
-def generate_commit_command(jira_ticket: str, dry_run: bool, no_prompt: bool, additional_message: str | None):
+@click.option("--no-cache", is_flag=True, help="Generate a new message even if the staged changes were seen before.")
+@click.option(
+    "--candidates",
+    "-k",
+    type=int,
+    default=1,
+    help="Generate this many candidates in parallel and keep the first valid.",
+)
+def generate_commit_command(
+    jira_ticket: str, dry_run: bool, no_prompt: bool, additional_message: str | None, no_cache: bool, candidates: int
+):
     """Generate a commit message for the changes."""
-    commit_message = generate_llm_commit_message(jira_ticket, additional_message)
+    from pydantic_ai.usage import Usage
+
+    from handy_utils.generate_commit import describe_usage, generate_llm_commit_message, perform_commit
+
+    usage = Usage()
+    commit_message = generate_llm_commit_message(
+        jira_ticket, additional_message, use_cache=not no_cache, candidates=candidates, usage=usage
+    )
     click.echo(commit_message)
     if dry_run:
+        click.echo(describe_usage(usage))
         click.echo("Dry run completed.")
         return
     if no_prompt:
@@ -41,19 +61,66 @@ def generate_commit_command(jira_ticket: str, dry_run: bool, no_prompt: bool, ad
         click.echo("Commit not generated.")
 
 
+@click.command("generate-commit-batch")
+@click.argument("repo_paths", nargs=-1, type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--rev-range", "-r", type=str, help="Generate a message for each commit in this `git rev-list` range instead."
+)
+@click.option("--jira-ticket", "-j", type=str, help="Jira ticket number.")
+@click.option(
+    "--additional-message", "-m", type=str, help="Additional message to be used to generate the commit messages."
+)
+@click.option("--concurrency", "-c", type=int, help="Number of messages generated at once.", default=None)
+@click.option("--output", "-o", type=click.File("w"), help="JSONL output file.", default="-")
+def generate_commit_batch_command(
+    repo_paths: tuple[str, ...],
+    rev_range: str | None,
+    jira_ticket: str | None,
+    additional_message: str | None,
+    concurrency: int | None,
+    output,
+):
+    """
+    Generate commit messages for the staged changes of many repositories, or for every commit in a range.
+    Results are written as JSON lines, progress is reported on stderr.
+    """
+    from handy_utils.configuration import load_configuration
+    from handy_utils.generate_commit.batch import get_batch_items, write_batch
+
+    items = get_batch_items(list(repo_paths) or ["."], rev_range)
+    concurrency = concurrency or load_configuration().commit_batch_concurrency
+    failed = asyncio.run(write_batch(items, output, concurrency, jira_ticket, additional_message))
+    if failed:
+        raise SystemExit(1)
+
+
 @click.command("nb2conf")
-@click.argument("notebook_path", type=click.Path(exists=True))
-@click.option("--output-path", type=click.Path(), help="Path to the output html file.", default=None)
+@click.argument("notebook_paths", nargs=-1, required=True)
+@click.option(
+    "--output-path",
+    type=click.Path(),
+    help="Path to the output .html file of a single notebook, or directory mirroring the notebook directories.",
+    default=None,
+)
 @click.option("--dry-run", is_flag=True, help="Dry run the conversion.", default=False)
-def convert_to_confluence_command(notebook_path: str, output_path: str, dry_run: bool):
+@click.option("--workers", "-w", type=int, help="Number of notebooks converted in parallel.", default=None)
+def convert_to_confluence_command(notebook_paths: tuple[str, ...], output_path: str, dry_run: bool, workers: int):
     """
-    Convert a notebook to Confluence. You can add the following tags at the start of each cell
-    to control the conversion: \n
+    Convert notebooks, directories of notebooks or glob patterns to Confluence. You can add the following tags at
+    the start of each cell to control the conversion: \n
     - `#|nb_tag: skip` - skip the cell \n
     - `#|nb_tag: remove_output` - remove the output of the cell \n
     - `#|nb_tag: remove_input` - remove the input of the cell \n
     """
-    convert_to_confluence(notebook_path, output_path, dry_run)
+    from handy_utils.convert_to_confluence.publish import publish_notebooks
+
+    results = publish_notebooks(list(notebook_paths), output_path, dry_run, workers)
+    if not results:
+        raise click.ClickException("No notebooks found.")
+    for result in results:
+        click.echo(f"{result.notebook_path}: {result.status} {result.error or result.url or result.output_path}")
+    if any(result.error for result in results):
+        raise SystemExit(1)
 
 
 @click.command("sync-git-repo")
@@ -61,6 +128,8 @@ def convert_to_confluence_command(notebook_path: str, output_path: str, dry_run:
 @click.option("--commit-msg", type=str, help="Commit message.")
 def sync_git_repo_command(repo_path: str, commit_msg: str):
     """Sync a git repository."""
+    from handy_utils.obsidian_sync import sync_git_repo
+
     return sync_git_repo(repo_path, commit_msg)
 
 
@@ -73,22 +142,29 @@ def config_group():
 @click.command("generate")
 def generate_config_command():
     """Generate a configuration file."""
+    from handy_utils.configuration import generate_config
+
     generate_config()
 
 
 @click.command("view")
 def view_config_command():
     """View the configuration."""
+    from handy_utils.configuration import view_config
+
     click.echo(view_config())
 
 
 @click.command("path")
 def view_config_path_command():
     """View the path to the configuration file."""
+    from handy_utils.configuration import get_config_path
+
     click.echo(get_config_path())
 
 
 main.add_command(generate_commit_command)
+main.add_command(generate_commit_batch_command)
 config_group.add_command(generate_config_command)
 config_group.add_command(view_config_command)
 config_group.add_command(view_config_path_command)
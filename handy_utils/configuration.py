@@ -21,6 +21,29 @@ class Configuration:
     confluence_api_key: str = ""
     confluence_space_key: str = ""
     confluence_username: str = ""
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0
+    http2: bool = False
+    http_connect_timeout: float = 10.0
+    http_read_timeout: float = 900.0
+    gateway_max_retries: int = 5
+    gateway_max_concurrency_per_model: int = 8
+    gateway_requests_per_second: float = 0.0
+    llm_cache_size_limit: int = 2**30
+    llm_cache_ttl: int = 7 * 24 * 60 * 60
+    commit_token_budget: int = 24_000
+    commit_chunk_tokens: int = 6_000
+    commit_max_chunks: int = 32
+    commit_max_concurrency: int = 8
+    commit_chunk_timeout: float = 60.0
+    commit_summary_model: str = "gemini-2.5-flash-lite"
+    commit_max_file_bytes: int = 2**20
+    commit_cache_size_limit: int = 2**26
+    commit_batch_concurrency: int = 4
+    confluence_max_workers: int = 0
+    confluence_max_concurrent_uploads: int = 4
+    confluence_requests_per_second: float = 5.0
 
     def to_yaml(self) -> str:
         """Convert the configuration to a YAML string."""
@@ -32,6 +55,11 @@ def get_config_path() -> Path:
     return Path.home() / ".handy_utils" / "config.yaml"
 
 
+def get_cache_dir() -> Path:
+    """Get the directory holding the on-disk caches."""
+    return Path.home() / ".handy_utils" / "cache"
+
+
 def load_configuration() -> Configuration:
     """Load the configuration from the file."""
     path = get_config_path()
@@ -0,0 +1,257 @@
+"""Async Confluence REST API client on the shared connection pool."""
+
+import asyncio
+import mimetypes
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator
+
+from httpx import AsyncClient, HTTPStatusError, Response, Timeout
+from loguru import logger
+
+from handy_utils.configuration import load_configuration
+from handy_utils.utils.http_client import get_shared_transport
+from handy_utils.utils.resilience import RETRYABLE_ERRORS, RETRYABLE_STATUS_CODES, RetryPolicy, TokenBucket
+
+CONTENT_URL = "/wiki/rest/api/content"
+# Number of results per request when listing pages or attachments
+LIST_LIMIT = 200
+# A conflict on update means the page version is stale, which is resolved by reading it again rather than retrying
+RETRYABLE_CONFLUENCE_STATUS_CODES = RETRYABLE_STATUS_CODES - {409}
+PAGE_PROPERTIES = {
+    "content-appearance-draft": {"value": "fixed-width"},
+    "content-appearance-published": {"value": "fixed-width"},
+}
+
+
+def get_confluence_url() -> str:
+    """Get the base URL of Confluence, from the configured domain or URL."""
+    domain = load_configuration().confluence_domain
+    return domain.rstrip("/") if domain.startswith(("http://", "https://")) else f"https://{domain}"
+
+
+@dataclass
+class PageVersion:
+    """Id, title and current version number of a page."""
+
+    id: str
+    title: str
+    version: int
+
+
+class ConfluenceClient:
+    """Client creating and updating pages and uploading their attachments, use as an async context manager.
+
+    Requests share the process-wide connection pool, run at most `confluence_max_concurrent_uploads` at a time and
+    `confluence_requests_per_second` per second unless a semaphore and token bucket are given, and are retried with
+    backoff when rate limited or failing transiently.
+
+    The id and version of every page looked up, listed, created or updated are cached by title per space, so a page
+    is looked up by title at most once. `load_pages` lists a whole space into the cache, which is cheaper than looking
+    up many pages one by one.
+    """
+
+    def __init__(
+        self,
+        space_key: str | None = None,
+        semaphore: asyncio.Semaphore | None = None,
+        bucket: TokenBucket | None = None,
+        retry_policy: RetryPolicy | None = None,
+    ) -> None:
+        config = load_configuration()
+        self.space_key = space_key or config.confluence_space_key
+        self.semaphore = semaphore or asyncio.Semaphore(config.confluence_max_concurrent_uploads)
+        if bucket is None and config.confluence_requests_per_second:
+            bucket = TokenBucket(config.confluence_requests_per_second)
+        self.bucket = bucket
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.client = AsyncClient(
+            transport=get_shared_transport(),
+            base_url=get_confluence_url(),
+            auth=(config.confluence_username, config.confluence_api_key),
+            timeout=Timeout(config.http_read_timeout, connect=config.http_connect_timeout),
+        )
+        # Space key to page title to page, and page id to page
+        self.pages: dict[str, dict[str, PageVersion]] = {}
+        self.pages_by_id: dict[str, PageVersion] = {}
+        # Space key to the listing of its pages
+        self.listings: dict[str, asyncio.Future] = {}
+
+    async def __aenter__(self) -> "ConfluenceClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        for listing in self.listings.values():
+            listing.cancel()
+        await self.client.aclose()
+
+    async def request(self, method: str, url: str, **kwargs) -> Response:
+        """Send a request under the concurrency and rate limits, retrying transient failures, and raise on errors."""
+        attempt = 0
+        while True:
+            try:
+                async with self.semaphore:
+                    if self.bucket is not None:
+                        await self.bucket.acquire()
+                    resp = await self.client.request(method, url, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.retry_policy.max_retries:
+                    raise
+                delay = self.retry_policy.get_delay(attempt)
+                logger.warning(f"Confluence request {method} {url} failed with {e!r}, retrying in {delay:.2f}s.")
+            else:
+                status = resp.status_code
+                if status not in RETRYABLE_CONFLUENCE_STATUS_CODES or attempt >= self.retry_policy.max_retries:
+                    resp.raise_for_status()
+                    return resp
+                delay = self.retry_policy.get_delay(attempt, resp)
+                logger.warning(
+                    f"Confluence request {method} {url} failed with status {status}, retrying in {delay:.2f}s."
+                )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def iter_results(self, url: str, params: dict) -> AsyncIterator[dict]:
+        """Iterate over the results of a listing, following the pagination."""
+        next_url: str | None = url
+        next_params: dict | None = params
+        while next_url:
+            data = (await self.request("GET", next_url, params=next_params)).json()
+            for result in data["results"]:
+                yield result
+            links = data.get("_links", {})
+            next_url = links.get("context", "/wiki") + links["next"] if "next" in links else None
+            next_params = None
+
+    def cache(self, space_key: str, page: dict) -> PageVersion:
+        """Cache the id and version of a page from its content, as returned with the version expanded."""
+        cached = PageVersion(page["id"], page["title"], page["version"]["number"])
+        previous = self.pages_by_id.get(cached.id)
+        if previous is not None and previous.title != cached.title:
+            self.pages.get(space_key, {}).pop(previous.title, None)
+        self.pages.setdefault(space_key, {})[cached.title] = self.pages_by_id[cached.id] = cached
+        return cached
+
+    def load_pages(self, space_key: str | None = None) -> asyncio.Future:
+        """Start listing every page of a space into the cache, once per space, and return the listing to await."""
+        space_key = space_key or self.space_key
+        if space_key not in self.listings:
+            self.listings[space_key] = asyncio.ensure_future(self.list_pages(space_key))
+        return self.listings[space_key]
+
+    async def list_pages(self, space_key: str) -> None:
+        params = {"spaceKey": space_key, "type": "page", "expand": "version", "limit": LIST_LIMIT}
+        async for page in self.iter_results(CONTENT_URL, params):
+            # Pages created or updated while listing are already cached with a newer version
+            if page["id"] not in self.pages_by_id:
+                self.cache(space_key, page)
+
+    async def get_page(self, title: str, space_key: str | None = None) -> PageVersion | None:
+        """Get a page by title, from the cache or the listing of its space if loaded, or else looking it up."""
+        space_key = space_key or self.space_key
+        if space_key in self.listings:
+            await self.listings[space_key]
+        if title in self.pages.get(space_key, {}) or space_key in self.listings:
+            return self.pages.get(space_key, {}).get(title)
+        params = {"spaceKey": space_key, "title": title, "type": "page", "expand": "version", "limit": 1}
+        results = (await self.request("GET", CONTENT_URL, params=params)).json()["results"]
+        return self.cache(space_key, results[0]) if results else None
+
+    async def get_page_by_id(self, page_id: str, space_key: str | None = None) -> PageVersion:
+        """Get a page by id, from the cache or else from Confluence."""
+        space_key = space_key or self.space_key
+        if space_key in self.listings:
+            await self.listings[space_key]
+        if page_id in self.pages_by_id:
+            return self.pages_by_id[page_id]
+        resp = await self.request("GET", f"{CONTENT_URL}/{page_id}", params={"expand": "version"})
+        return self.cache(space_key, resp.json())
+
+    async def upload_page(
+        self, text: str, page_name: str, page_id: str | None = None, space_key: str | None = None
+    ) -> str:
+        """Create or update a page with a storage format body and return its id.
+
+        The page is looked up by title unless its id is already known. An update that conflicts with an edit made
+        since the page version was read is retried once with the new version.
+        """
+        space_key = space_key or self.space_key
+        page = await (
+            self.get_page(page_name, space_key) if page_id is None else self.get_page_by_id(page_id, space_key)
+        )
+        body = {"storage": {"value": text, "representation": "storage"}}
+        if page is None:
+            data = {
+                "type": "page",
+                "title": page_name,
+                "status": "current",
+                "space": {"key": space_key},
+                "body": body,
+                "metadata": {"properties": {"editor": {"value": "v2"}, **PAGE_PROPERTIES}},
+            }
+            resp = await self.request("POST", f"{CONTENT_URL}/", json=data)
+            return self.cache(space_key, resp.json()).id
+
+        for attempt in range(2):
+            data = {
+                "id": page.id,
+                "type": "page",
+                "title": page_name,
+                "version": {"number": page.version + 1, "minorEdit": False},
+                "body": body,
+                "metadata": {"properties": PAGE_PROPERTIES},
+            }
+            try:
+                resp = await self.request("PUT", f"{CONTENT_URL}/{page.id}", params={"status": "current"}, json=data)
+            except HTTPStatusError as e:
+                if e.response.status_code != 409 or attempt:
+                    raise
+                self.pages_by_id.pop(page.id)
+                page = await self.get_page_by_id(page.id, space_key)
+            else:
+                break
+        return self.cache(space_key, resp.json()).id
+
+    async def upload_pages(self, pages: list[tuple[str, str, str | None]], space_key: str | None = None) -> list[str]:
+        """Create or update many `(text, page_name, page_id)` pages concurrently and return their ids.
+
+        When more than one page has to be looked up by title, the space is listed once instead.
+        """
+        if sum(page_id is None for _, _, page_id in pages) > 1:
+            self.load_pages(space_key)
+        return await asyncio.gather(
+            *(self.upload_page(text, page_name, page_id, space_key) for text, page_name, page_id in pages)
+        )
+
+    async def list_attachment_names(self, page_id: str) -> set[str]:
+        """List the file names of the attachments of a page."""
+        url = f"{CONTENT_URL}/{page_id}/child/attachment"
+        return {attachment["title"] async for attachment in self.iter_results(url, {"limit": LIST_LIMIT})}
+
+    async def upload_attachment(self, page_id: str, path: Path) -> None:
+        content = await asyncio.to_thread(path.read_bytes)
+        mimetype = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        await self.request(
+            "POST",
+            f"{CONTENT_URL}/{page_id}/child/attachment",
+            headers={"X-Atlassian-Token": "no-check"},
+            files={"file": (path.name, content, mimetype)},
+            data={"minorEdit": "true"},
+        )
+
+    async def upload_attachments(self, page_id: str, attachments_dir: Path) -> int:
+        """Upload the files of a directory that the page does not have as attachments yet, concurrently.
+
+        Attachments are named after a hash of their content, so those already on the page are skipped. Returns the
+        number of attachments uploaded.
+        """
+        paths = sorted(attachments_dir.iterdir()) if attachments_dir.is_dir() else []
+        if not paths:
+            return 0
+        existing_names = await self.list_attachment_names(page_id)
+        missing = [path for path in paths if path.name not in existing_names]
+        await asyncio.gather(*(self.upload_attachment(page_id, path) for path in missing))
+        return len(missing)
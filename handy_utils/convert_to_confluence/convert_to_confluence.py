@@ -1,37 +1,117 @@
+import asyncio
+import functools
+import hashlib
 import os
-import re
+import shutil
 import tempfile
 from pathlib import Path
 
+import nbconvert
 import nbformat
-from atlassian import Confluence  # type: ignore
+from jinja2 import Environment, FileSystemBytecodeCache
 from nbconvert.exporters import HTMLExporter
-from nbconvert.preprocessors import TagRemovePreprocessor
 from traitlets.config import Config
 
-from handy_utils.configuration import load_configuration
+from handy_utils.configuration import get_cache_dir, load_configuration
+from handy_utils.convert_to_confluence.confluence_client import ConfluenceClient, get_confluence_url
 from handy_utils.convert_to_confluence.html_to_asf import convert_html_str_to_asf
+from handy_utils.convert_to_confluence.notebook_reader import NotebookReader
+from handy_utils.convert_to_confluence.preprocessors import ImageAttachmentPreprocessor, NbTagPreprocessor
 
-config = load_configuration()
+template_path = os.path.join(os.path.dirname(__file__), "templates")
+# Notebooks are rendered this many characters (of JSON) of cells at a time
+RENDER_BATCH_SIZE = 2**22
 
-c = Config()
 
+class ConfluenceHTMLExporter(HTMLExporter):
+    """HTML exporter keeping its compiled templates on disk, so new processes skip compiling them."""
 
-# Configure the exporter to use our custom template
-template_path = os.path.join(os.path.dirname(__file__), "templates")
-c.HTMLExporter.extra_template_basedirs = [template_path]
-c.HTMLExporter.exclude_input_prompt = True
-c.HTMLExporter.exclude_output_prompt = True
-c.HTMLExporter.template_name = "atlassian-confluence"
-c.HTMLExporter.filters = {"html_to_asf": convert_html_str_to_asf}
+    def _create_environment(self) -> Environment:
+        environment = super()._create_environment()
+        environment.bytecode_cache = FileSystemBytecodeCache(str(get_template_cache_dir()))
+        return environment
+
+
+def get_template_cache_dir() -> Path:
+    """Get the directory of compiled templates for the current templates and nbconvert version.
+
+    Compiled templates of previous templates or nbconvert versions are removed.
+    """
+    key = hashlib.sha256(f"{get_template_hash()}:{nbconvert.__version__}".encode()).hexdigest()[:16]
+    cache_dir = get_cache_dir() / "nbconvert_templates"
+    for stale_dir in cache_dir.glob("*"):
+        if stale_dir.name != key:
+            shutil.rmtree(stale_dir, ignore_errors=True)
+    (cache_dir / key).mkdir(parents=True, exist_ok=True)
+    return cache_dir / key
+
+
+@functools.cache
+def get_exporter() -> HTMLExporter:
+    """Build the Confluence HTML exporter on first use and reuse it for the rest of the process."""
+    c = Config()
+
+    # Configure the exporter to use our custom template
+    c.HTMLExporter.extra_template_basedirs = [template_path]
+    c.HTMLExporter.exclude_input_prompt = True
+    c.HTMLExporter.exclude_output_prompt = True
+    c.HTMLExporter.template_name = "atlassian-confluence"
+    c.HTMLExporter.filters = {"html_to_asf": convert_html_str_to_asf}
+
+    # Apply the nb_tags first, so that removed cells never reach the other preprocessors, and validate the notebook
+    # once after all of them rather than after each one
+    c.HTMLExporter.default_preprocessors = [
+        NbTagPreprocessor,
+        ImageAttachmentPreprocessor,
+        *(
+            preprocessor
+            for preprocessor in HTMLExporter.class_traits()["default_preprocessors"].default()
+            if preprocessor != "nbconvert.preprocessors.TagRemovePreprocessor"
+        ),
+    ]
+    c.HTMLExporter.optimistic_validation = True
+    # The template does not use the pygments stylesheet, which would otherwise be generated for every cell
+    c.CSSHTMLHeaderPreprocessor.enabled = False
+    c.NbTagPreprocessor.remove_cell_tags = ("remove_cell", "skip")
+    c.NbTagPreprocessor.remove_all_outputs_tags = ("remove_output",)
+    c.NbTagPreprocessor.remove_input_tags = ("remove_input",)
+    c.NbTagPreprocessor.enabled = True
+    c.ImageAttachmentPreprocessor.enabled = True
+
+    return ConfluenceHTMLExporter(config=c)
+
+
+def get_template_hash() -> str:
+    """Hash the template files, so that rendered output can be tied to the templates that produced it."""
+    digest = hashlib.sha256()
+    for path in sorted(Path(template_path).rglob("*")):
+        if path.is_file():
+            digest.update(path.relative_to(template_path).as_posix().encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def get_page_name(output_path: Path | str) -> str:
+    """Derive a page name from the output file name."""
+    return Path(output_path).stem.replace("_", " ").replace("-", " ").replace(".", " ").title()
+
+
+def get_page_url(page_id: str) -> str:
+    config = load_configuration()
+    return f"{get_confluence_url()}/wiki/spaces/{config.confluence_space_key}/pages/{page_id}"
+
+
+def get_attachments_dir(output_path: Path | str) -> Path:
+    """Get the directory holding the attachments of a rendered notebook."""
+    output_path = Path(output_path)
+    return output_path.with_name(f"{output_path.stem}_files")
 
-c.TagRemovePreprocessor.remove_cell_tags = ("remove_cell", "skip")
-c.TagRemovePreprocessor.remove_all_outputs_tags = ("remove_output",)
-c.TagRemovePreprocessor.remove_input_tags = ("remove_input",)
-c.TagRemovePreprocessor.enabled = True
 
-exporter = HTMLExporter(config=c)
-exporter.register_preprocessor(TagRemovePreprocessor(config=c), True)
+async def aupload_to_confluence(text: str, page_name: str, attachments_dir: Path) -> tuple[str, int]:
+    """Create or update a page and upload its new attachments, returning its id and the number of attachments."""
+    async with ConfluenceClient() as client:
+        page_id = await client.upload_page(text, page_name)
+        return page_id, await client.upload_attachments(page_id, attachments_dir)
 
 
 def upload_to_confluence(output_path: Path | str, page_name: str | None = None) -> str:
@@ -39,87 +119,68 @@ def upload_to_confluence(output_path: Path | str, page_name: str | None = None)
         text = f.read()
 
     print(page_name)
-    if not page_name:
-        path = Path(output_path) if isinstance(output_path, str) else output_path
-        page_name = path.stem.replace("_", " ").replace("-", " ").replace(".", " ").title()
-
-    confluence = Confluence(
-        url=f"https://{config.confluence_domain}/",
-        cloud=True,
-        username=config.confluence_username,
-        password=config.confluence_api_key,
-    )
+    page_name = page_name or get_page_name(output_path)
 
     print(f"Uploading {output_path} to Confluence")
+    page_id, uploaded = asyncio.run(aupload_to_confluence(text, page_name, get_attachments_dir(output_path)))
+    print(f"Uploaded {output_path} to Confluence, with {uploaded} new attachments")
+    return get_page_url(page_id)
 
-    # Try to find existing page first
-    existing_page = confluence.get_page_by_title(space=config.confluence_space_key, title=page_name)
-    assert isinstance(existing_page, dict)
-    assert "id" in existing_page
-
-    if existing_page:
-        # Update existing page
-        page = confluence.update_page(
-            page_id=existing_page["id"],
-            title=page_name,
-            body=text,
-            type="page",
-            representation="storage",
-            full_width=False,
-        )
-    else:
-        # Create new page
-        page = confluence.create_page(
-            space=config.confluence_space_key,
-            title=page_name,
-            body=text,
-            type="page",
-            representation="storage",
-            full_width=False,
-            editor="v2",
-        )
-    assert isinstance(page, dict)
-    assert "id" in page
-    print(f"Uploaded {output_path} to Confluence")
-    return f"https://{config.confluence_domain}/wiki/spaces/{config.confluence_space_key}/pages/{page['id']}"
 
+def render_notebook(
+    notebook_path: str | Path, output_path: str | Path | None = None, batch_size: int = RENDER_BATCH_SIZE
+) -> tuple[Path, str | None]:
+    """Render a notebook to Confluence storage format.
 
-def convert_to_confluence(
-    notebook_path: str | Path, output_path: str | Path | None = None, dry_run: bool = False
-) -> str | Path | None:
+    The output is written to `output_path`, in it if it is a directory, or in a temporary directory if not given.
+    Returns the output path and the page name, taken from the notebook's first markdown cell.
+
+    The notebook is read and rendered `batch_size` characters of cells at a time, straight to the output file, so
+    memory use is bounded by the larger of a batch and the largest cell rather than by the notebook. Removed outputs
+    are skipped without being decoded. Images are written to the attachments directory next to the output.
+    """
     notebook_path = Path(notebook_path)
     output_path = Path(output_path) if output_path else None
 
-    with open(notebook_path) as f:
-        nb = nbformat.read(f, as_version=4)
-
-    page_name = None
-
-    for cell in nb.cells:
-        if cell.cell_type == "markdown" and page_name is None:
-            page_name = re.sub(r"[^a-zA-Z0-9\s]", "", cell.source.split("\n")[0]).strip()
-        if cell.source.startswith("#|nb_tag:"):
-            c = cell.source.split("\n")[0]
-            cell.source = cell.source.replace(c, "").strip()
-            tag_name = c.replace("#|nb_tag:", "").strip()
-            if "tags" not in cell.metadata:
-                cell.metadata["tags"] = []
-            cell.metadata["tags"].append(tag_name)
-            cell.metadata["tags"] = list(set(cell.metadata["tags"]))
-
-    output = exporter.from_notebook_node(nb)
-
     if output_path and output_path.is_dir():
         output_path = output_path / notebook_path.name.replace(".ipynb", ".html")
 
-    if output_path:
-        with open(output_path, "w") as f:
-            f.write(output[0])
-    else:
+    if not output_path:
         tmp_dir = Path(tempfile.mkdtemp())
         output_path = tmp_dir / notebook_path.name.replace(".ipynb", ".html")
-        with open(output_path, "w") as f:
-            f.write(output[0])
+
+    attachments_dir = get_attachments_dir(output_path)
+    shutil.rmtree(attachments_dir, ignore_errors=True)
+
+    exporter = get_exporter()
+    reader = NotebookReader(notebook_path, skip_outputs=NbTagPreprocessor(parent=exporter).removes_outputs)
+    page_name = None
+    with open(output_path, "w") as f:
+        for cells in reader.iter_batches(batch_size):
+            nb = nbformat.from_dict(
+                {
+                    "cells": cells,
+                    "metadata": reader.notebook.get("metadata", {}),
+                    "nbformat": 4,
+                    "nbformat_minor": 5 if all("id" in cell for cell in cells) else 4,
+                }
+            )
+            body, resources = exporter.from_notebook_node(nb)
+            if page_name is None:
+                page_name = resources["page_name"]
+            f.write(body)
+            for name, data in resources.get("outputs", {}).items():
+                attachments_dir.mkdir(exist_ok=True)
+                if not (attachments_dir / name).exists():
+                    (attachments_dir / name).write_bytes(data)
+
+    return output_path, page_name
+
+
+def convert_to_confluence(
+    notebook_path: str | Path, output_path: str | Path | None = None, dry_run: bool = False
+) -> str | Path | None:
+    output_path, page_name = render_notebook(notebook_path, output_path)
 
     if not dry_run:
         upload_to_confluence(output_path, page_name)
@@ -1,117 +1,319 @@
-from typing import Dict, Optional, Union, cast
+"""Convert HTML to Atlassian Storage Format (ASF) in a single streaming pass.
 
-from bs4 import BeautifulSoup
-from bs4.element import NavigableString, Tag
+Parsers emit start tag, end tag and text events into an `AsfWriter`, which keeps the open elements on an explicit
+stack and writes the output into a single list of fragments, so the conversion neither recurses nor copies the
+content of an element once per ancestor. The events reproduce the tree BeautifulSoup builds with `html.parser`, so
+the output is the same as converting that tree. lxml's HTML parser is faster, but it repairs malformed HTML the way
+browsers do, so it is only used when asked for.
+"""
 
+import re
+from collections import Counter
+from html.parser import HTMLParser
+from typing import Dict, Optional, Union
 
-def html_to_asf(el: Union[BeautifulSoup, NavigableString, Tag, str], ctx: Optional[Dict] = None) -> str:
-    """Convert HTML (bs4) element to Atlassian Storage Format `el`"""
-    if ctx is None:
-        ctx = {}
+from bs4 import BeautifulSoup
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+from bs4.element import NavigableString, Tag
 
-    # Handle string nodes
-    if isinstance(el, (str, NavigableString)):
-        return str(el)
+try:
+    from lxml import etree
+except ImportError:  # pragma: no cover
+    etree = None
 
-    # Get tag name and attributes
-    tag = el.name if isinstance(el, (Tag, BeautifulSoup)) else None
-    attrs = el.attrs if isinstance(el, (Tag, BeautifulSoup)) else {}
+# Elements that never have content, see `bs4.builder.HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS`
+VOID_ELEMENTS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "keygen",
+    "link",
+    "menuitem",
+    "meta",
+    "param",
+    "source",
+    "track",
+    "wbr",
+    "basefont",
+    "bgsound",
+    "command",
+    "frame",
+    "image",
+    "isindex",
+    "nextid",
+    "spacer",
+}
+PRESERVE_WHITESPACE_ELEMENTS = {"pre", "textarea"}
+ASCII_SPACES = " \n\t\x0c\r"
+SIMPLE_ELEMENTS = {
+    "h1": "h1",
+    "h2": "h2",
+    "h3": "h3",
+    "h4": "h4",
+    "h5": "h5",
+    "h6": "h6",
+    "strong": "strong",
+    "b": "strong",
+    "em": "em",
+    "i": "em",
+    "u": "u",
+    "sup": "sup",
+    "sub": "sub",
+    "code": "code",
+    "pre": "pre",
+    "small": "small",
+    "big": "big",
+    "ul": "ul",
+    "ol": "ol",
+    "li": "li",
+}
+DECIMAL_REFERENCE_PATTERN = re.compile(r"^([0-9]+)(.*)")
+HEX_REFERENCE_PATTERN = re.compile(r"^([0-9a-f]+)(.*)")
 
-    # Process children first
-    inner = (
-        "".join(html_to_asf(cast(Union[BeautifulSoup, NavigableString, Tag, str], c), ctx) for c in el.children)
-        if hasattr(el, "children")
-        else ""
-    )
 
-    # Handle different HTML elements
-    if tag is None:
-        return inner
+def open_element(tag: str, attrs: Dict) -> tuple[str, str]:
+    """Get the ASF written before and after the content of an element."""
+    if tag in SIMPLE_ELEMENTS:
+        name = SIMPLE_ELEMENTS[tag]
+        return f"<{name}>", f"</{name}>"
 
     elif tag == "p":
-        style = cast(str, attrs.get("style", ""))
+        style = attrs.get("style", "")
         align = style.replace("text-align: ", "") if "style" in attrs else ""
         if align in ("center", "right"):
-            return f'<p style="text-align: {align}">{inner}</p>'
-        return f"<p>{inner}</p>"
+            return f'<p style="text-align: {align}">', "</p>"
+        return "<p>", "</p>"
 
-    elif tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
-        return f"<{tag}>{inner}</{tag}>"
+    elif tag == "strike" or tag == "s":
+        return '<span style="text-decoration: line-through;">', "</span>"
 
-    elif tag == "strong" or tag == "b":
-        return f"<strong>{inner}</strong>"
+    elif tag == "blockquote":
+        return "<blockquote><p>", "</p></blockquote>"
 
-    elif tag == "em" or tag == "i":
-        return f"<em>{inner}</em>"
+    elif tag == "br":
+        return "<br />", ""
 
-    elif tag == "u":
-        return f"<u>{inner}</u>"
+    elif tag == "hr":
+        return "<hr />", ""
 
-    elif tag == "strike" or tag == "s":
-        return f'<span style="text-decoration: line-through;">{inner}</span>'
+    elif tag == "a":
+        href = attrs.get("href", "")
+        if href.startswith("http"):
+            return f'<a href="{href}">', "</a>"
+        return (
+            f'<ac:link><ri:page ri:content-title="{href}"/><ac:plain-text-link-body><![CDATA[',
+            "]]></ac:plain-text-link-body></ac:link>",
+        )
 
-    elif tag == "sup":
-        return f"<sup>{inner}</sup>"
+    elif tag == "img":
+        src = attrs.get("src", "")
+        if src.startswith("http"):
+            return f'<ac:image><ri:url ri:value="{src}"/></ac:image>', ""
+        return f'<ac:image><ri:attachment ri:filename="{src}"/></ac:image>', ""
 
-    elif tag == "sub":
-        return f"<sub>{inner}</sub>"
+    elif tag == "span":
+        style = attrs.get("style", "")
+        if "color:" in style:
+            color = style.split("color:")[1].split(";")[0].strip()
+            return f'<span style="color: {color}">', "</span>"
 
-    elif tag == "code":
-        return f"<code>{inner}</code>"
+    # Default case - pass the content through unchanged
+    return "", ""
 
-    elif tag == "pre":
-        return f"<pre>{inner}</pre>"
 
-    elif tag == "blockquote":
-        return f"<blockquote><p>{inner}</p></blockquote>"
+class AsfWriter:
+    """Write ASF from a stream of start tag, end tag and text events."""
 
-    elif tag == "small":
-        return f"<small>{inner}</small>"
+    def __init__(self) -> None:
+        self.parts: list[str] = []
+        # Open elements, with the ASF to write once they are closed and where their content starts in `parts`
+        self.stack: list[tuple[str, str, int]] = []
+        self.open_counts: Counter[str] = Counter()
+        self.preserve_whitespace = 0
+        self.text: list[str] = []
 
-    elif tag == "big":
-        return f"<big>{inner}</big>"
+    def data(self, text: str) -> None:
+        """Buffer text, consecutive text events make up a single string."""
+        self.text.append(text)
 
-    elif tag == "br":
-        return "<br />"
+    def flush(self) -> None:
+        """Write the buffered string, collapsing it to a single space or newline if it is only whitespace."""
+        if not self.text:
+            return
+        text = "".join(self.text)
+        self.text = []
+        if not self.preserve_whitespace and not text.strip(ASCII_SPACES):
+            text = "\n" if "\n" in text else " "
+        self.parts.append(text)
 
-    elif tag == "hr":
-        return "<hr />"
+    def start(self, tag: str, attrs: Dict) -> None:
+        self.flush()
+        prefix, suffix = open_element(tag, attrs)
+        self.parts.append(prefix)
+        self.stack.append((tag, suffix, len(self.parts)))
+        self.open_counts[tag] += 1
+        if tag in PRESERVE_WHITESPACE_ELEMENTS:
+            self.preserve_whitespace += 1
 
-    elif tag == "ul":
-        return f"<ul>{inner}</ul>"
+    def end(self, tag: str) -> None:
+        """Close the most recently opened `tag` and the elements opened after it, ignoring unmatched end tags."""
+        self.flush()
+        if not self.open_counts[tag]:
+            return
+        while self.stack:
+            if self.pop() == tag:
+                break
 
-    elif tag == "ol":
-        return f"<ol>{inner}</ol>"
+    def pop(self) -> str:
+        tag, suffix, content_start = self.stack.pop()
+        self.open_counts[tag] -= 1
+        if tag in PRESERVE_WHITESPACE_ELEMENTS:
+            self.preserve_whitespace -= 1
+        if tag == "a" and "".join(self.parts[content_start:]) == "¶":
+            # Drop the permalinks nbconvert adds to headings
+            del self.parts[content_start - 1 :]
+        elif tag not in VOID_ELEMENTS:
+            self.parts.append(suffix)
+        else:
+            # Void elements are written whole, whatever they contain
+            del self.parts[content_start:]
+        return tag
 
-    elif tag == "li":
-        return f"<li>{inner}</li>"
+    def close(self) -> str:
+        """Close the elements left open and get the ASF."""
+        self.flush()
+        while self.stack:
+            self.pop()
+        return "".join(self.parts)
 
-    elif tag == "a":
-        href = cast(str, attrs.get("href", ""))
-        if inner == "¶":
-            return ""
-        if href.startswith("http"):
-            return f'<a href="{href}">{inner}</a>'
-        return f'<ac:link><ri:page ri:content-title="{href}"/><ac:plain-text-link-body><![CDATA[{inner}]]></ac:plain-text-link-body></ac:link>'  # noqa: E501
 
-    elif tag == "img":
-        src = cast(str, attrs.get("src", ""))
-        if src.startswith("http"):
-            return f'<ac:image><ri:url ri:value="{src}"/></ac:image>'
-        return f'<ac:image><ri:attachment ri:filename="{src}"/></ac:image>'
+def dereference_numeric_reference(name: str) -> str:
+    """Get the character of a numeric character reference followed by any data after its digits, like bs4."""
+    base, pattern = (16, HEX_REFERENCE_PATTERN) if name[:1] in ("x", "X") else (10, DECIMAL_REFERENCE_PATTERN)
+    digits = name[1:] if base == 16 else name
+    try:
+        return UnicodeDammit.numeric_character_reference(int(digits, base))[0]
+    except ValueError:
+        match = pattern.match(digits)
+        if match is None:
+            return digits
+        return UnicodeDammit.numeric_character_reference(int(match[1], base))[0] + match[2]
 
-    elif tag == "span":
-        style = cast(str, attrs.get("style", ""))
-        if "color:" in style:
-            color = style.split("color:")[1].split(";")[0].strip()
-            return f'<span style="color: {color}">{inner}</span>'
-        return inner
 
-    # Default case - pass through unchanged
-    return inner
+class AsfHTMLParser(HTMLParser):
+    """`html.parser` adapter feeding an `AsfWriter` the events BeautifulSoup's `html.parser` builder would use."""
+
+    def __init__(self, writer: AsfWriter) -> None:
+        super().__init__(convert_charrefs=False)
+        self.writer = writer
+        # Void elements closed on their start tag, whose explicit end tag should be ignored
+        self.closed_void_elements: list[str] = []
+
+    @staticmethod
+    def get_attrs(attrs: list[tuple[str, Optional[str]]]) -> Dict[str, str]:
+        return {key: value or "" for key, value in attrs}
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]) -> None:
+        self.writer.start(tag, self.get_attrs(attrs))
+        if tag in VOID_ELEMENTS:
+            self.writer.end(tag)
+            self.closed_void_elements.append(tag)
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, Optional[str]]]) -> None:
+        self.writer.start(tag, self.get_attrs(attrs))
+        self.writer.end(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self.closed_void_elements:
+            self.closed_void_elements.remove(tag)
+        else:
+            self.writer.end(tag)
+
+    def handle_data(self, data: str) -> None:
+        self.writer.data(data)
+
+    def handle_charref(self, name: str) -> None:
+        self.writer.data(dereference_numeric_reference(name))
+
+    def handle_entityref(self, name: str) -> None:
+        self.writer.data(EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name, f"&{name}"))
+
+    def handle_comment(self, data: str) -> None:
+        self.writer.flush()
+        self.writer.data(data)
+        self.writer.flush()
+
+    def handle_decl(self, decl: str) -> None:
+        self.handle_comment(decl[len("DOCTYPE ") :])
+
+    def unknown_decl(self, data: str) -> None:
+        self.handle_comment(data[len("CDATA[") :] if data.upper().startswith("CDATA[") else data)
+
+    def handle_pi(self, data: str) -> None:
+        self.handle_comment(data)
+
+
+class AsfLxmlTarget:
+    """lxml parser target feeding an `AsfWriter`."""
+
+    def __init__(self, writer: AsfWriter) -> None:
+        self.writer = writer
+
+    def start(self, tag: str, attrib: Dict[str, str]) -> None:
+        self.writer.start(tag, attrib)
+
+    def end(self, tag: str) -> None:
+        self.writer.end(tag)
+
+    def data(self, data: str) -> None:
+        self.writer.data(data)
+
+    def comment(self, text: str) -> None:
+        self.writer.flush()
+        self.writer.data(text)
+        self.writer.flush()
+
+    def close(self) -> str:
+        return self.writer.close()
+
+
+def html_to_asf(el: Union[BeautifulSoup, NavigableString, Tag, str], ctx: Optional[Dict] = None) -> str:
+    """Convert HTML (bs4) element to Atlassian Storage Format `el`"""
+    if isinstance(el, (str, NavigableString)):
+        return str(el)
+
+    writer = AsfWriter()
+    # Walk the tree depth first with an explicit stack, a None entry closes the element below it
+    nodes: list = [el]
+    while nodes:
+        node = nodes.pop()
+        if node is None:
+            writer.pop()
+        elif isinstance(node, Tag):
+            writer.start(node.name, node.attrs)
+            nodes.append(None)
+            nodes.extend(reversed(node.contents))
+        else:
+            writer.parts.append(str(node))
+    return writer.close()
+
 
+def convert_html_str_to_asf(html_str: str, parser: str = "html.parser") -> str:
+    """Convert HTML string to Atlassian Storage Format string
 
-def convert_html_str_to_asf(html_str: str) -> str:
-    """Convert HTML string to Atlassian Storage Format string"""
-    soup = BeautifulSoup(html_str, "html.parser")
-    return html_to_asf(soup)
+    `parser` is "html.parser" (same output as parsing with BeautifulSoup) or "lxml" (faster, needs lxml installed).
+    """
+    writer = AsfWriter()
+    if parser == "lxml":
+        lxml_parser = etree.HTMLParser(target=AsfLxmlTarget(writer))
+        lxml_parser.feed(html_str)
+        return lxml_parser.close()
+    html_parser = AsfHTMLParser(writer)
+    html_parser.feed(html_str)
+    html_parser.close()
+    return writer.close()
@@ -0,0 +1,62 @@
+"""Local manifest of published notebooks, used to skip unchanged ones."""
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from handy_utils.configuration import get_cache_dir
+
+
+@dataclass
+class ManifestEntry:
+    """What was last published for a notebook."""
+
+    space_key: str
+    page_id: str
+    source_hash: str
+    body_hash: str
+
+
+def hash_file(path: Path, template_hash: str = "") -> str:
+    """Hash a file's content, without loading it all in memory, along with the hash of the templates if given."""
+    digest = hashlib.sha256(template_hash.encode())
+    with open(path, "rb") as f:
+        while chunk := f.read(2**20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PublishManifest:
+    """Map of notebook path to its Confluence page id, notebook source hash and rendered body hash."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[str, ManifestEntry] = {}
+        if path.exists():
+            self.entries = {key: ManifestEntry(**entry) for key, entry in json.loads(path.read_text()).items()}
+
+    @staticmethod
+    def get_key(notebook_path: Path) -> str:
+        return str(notebook_path.resolve())
+
+    def get(self, notebook_path: Path, space_key: str) -> ManifestEntry | None:
+        """Get what was last published for a notebook to the given space."""
+        entry = self.entries.get(self.get_key(notebook_path))
+        return entry if entry is not None and entry.space_key == space_key else None
+
+    def set(self, notebook_path: Path, entry: ManifestEntry) -> None:
+        self.entries[self.get_key(notebook_path)] = entry
+
+    def save(self) -> None:
+        """Write the manifest atomically, so an interrupted publish never leaves it corrupted."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({key: asdict(entry) for key, entry in self.entries.items()}, indent=2))
+        os.replace(tmp_path, self.path)
+
+
+def get_manifest_path() -> Path:
+    """Get the path to the manifest of published notebooks."""
+    return get_cache_dir() / "nb2conf_manifest.json"
@@ -0,0 +1,199 @@
+"""Read the cells of a notebook one at a time, without loading the whole notebook in memory."""
+
+import re
+from pathlib import Path
+from typing import Callable, Iterator
+
+import nbformat
+
+from handy_utils.utils import json_codec
+
+WHITESPACE_PATTERN = re.compile(r"[ \t\n\r]*")
+SCALAR_PATTERN = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?|true|false|null")
+# Characters that change the nesting of a value, or start a string that may contain them
+STRUCTURE_PATTERN = re.compile(r'[\[\]{}"]')
+
+
+class NotebookReader:
+    """Incremental reader of the cells of a notebook (nbformat 4) file.
+
+    The file is read in chunks and scanned for the boundaries of JSON values, so that only the values of the cell
+    being read are decoded and held in memory. The outputs of a cell are decoded last, and only if
+    `skip_outputs(cell)` is false for the rest of the cell. Top level values other than the cells, such as the
+    notebook metadata, are available in `notebook` once read, which is usually after the cells.
+
+    Older notebooks are read whole and converted to nbformat 4.
+    """
+
+    def __init__(
+        self, path: str | Path, skip_outputs: Callable[[dict], bool] | None = None, chunk_size: int = 2**20
+    ) -> None:
+        self.path = Path(path)
+        self.skip_outputs = skip_outputs
+        self.chunk_size = chunk_size
+        self.notebook: dict = {}
+        self.buffer = ""
+        self.pos = 0
+        # Size of the JSON text of the last cell read
+        self.cell_size = 0
+
+    def __iter__(self) -> Iterator[nbformat.NotebookNode]:
+        with open(self.path, encoding="utf-8") as file:
+            self.file, self.buffer, self.pos = file, "", 0
+            self.expect("{")
+            for key in self.iter_members():
+                if key == "cells":
+                    for _ in self.iter_items():
+                        if self.pos > self.chunk_size:
+                            # Forget the cells already read
+                            self.buffer, self.pos = self.buffer[self.pos :], 0
+                        start = self.pos
+                        cell = self.read_cell()
+                        self.cell_size = self.pos - start
+                        yield cell
+                elif key == "worksheets":
+                    yield from self.read_whole()
+                    return
+                else:
+                    self.notebook[key] = self.read_value()
+
+    def iter_batches(self, max_size: int) -> Iterator[list[nbformat.NotebookNode]]:
+        """Group the cells into batches of at most `max_size` characters of JSON, or a single larger cell."""
+        batch: list[nbformat.NotebookNode] = []
+        batch_size = 0
+        for cell in self:
+            if batch and batch_size + self.cell_size > max_size:
+                yield batch
+                batch, batch_size = [], 0
+            batch.append(cell)
+            batch_size += self.cell_size
+        if batch:
+            yield batch
+
+    def read_whole(self) -> Iterator[nbformat.NotebookNode]:
+        """Read a notebook of an older format whole, converting it to nbformat 4."""
+        nb = nbformat.read(self.path, as_version=4)
+        self.notebook = {key: value for key, value in nb.items() if key != "cells"}
+        yield from nb.cells
+
+    def read_cell(self) -> nbformat.NotebookNode:
+        self.expect("{")
+        cell = {}
+        outputs = None
+        for key in self.iter_members():
+            if key == "outputs":
+                outputs = self.scan_value()
+            else:
+                cell[key] = self.read_value()
+        if outputs is not None:
+            cell["outputs"] = [] if self.skip_outputs and self.skip_outputs(cell) else json_codec.loads(outputs)
+        # Join multiline strings and drop transient values as `nbformat.read` does
+        nb = nbformat.v4.to_notebook_json({"cells": [cell], "metadata": {}}, minor=5 if "id" in cell else 4)
+        return nb.cells[0]
+
+    def fill(self) -> bool:
+        """Read more of the file into the buffer, at least doubling what is left to scan so rescanning stays linear."""
+        chunk = self.file.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        self.buffer += chunk
+        return bool(chunk)
+
+    def skip_whitespace(self) -> None:
+        while True:
+            self.pos = WHITESPACE_PATTERN.match(self.buffer, self.pos).end()  # type: ignore[union-attr]
+            if self.pos < len(self.buffer) or not self.fill():
+                return
+
+    def peek(self) -> str:
+        self.skip_whitespace()
+        if self.pos >= len(self.buffer):
+            raise ValueError(f"Unexpected end of notebook {self.path}")
+        return self.buffer[self.pos]
+
+    def expect(self, character: str) -> None:
+        if self.peek() != character:
+            raise ValueError(f"Expected {character!r} at {self.pos} in notebook {self.path}")
+        self.pos += 1
+
+    def iter_members(self) -> Iterator[str]:
+        """Iterate over the keys of an object, the caller reading the value of each key before the next one."""
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(":")
+            yield key
+            if self.peek() == "}":
+                self.pos += 1
+                return
+            self.expect(",")
+
+    def iter_items(self) -> Iterator[None]:
+        """Iterate over the items of an array, the caller reading each item before the next one."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == "]":
+                self.pos += 1
+                return
+            self.expect(",")
+
+    def read_value(self):
+        return json_codec.loads(self.scan_value())
+
+    def scan_value(self) -> str:
+        """Find the end of the next value and return its JSON text without decoding it."""
+        self.skip_whitespace()
+        start = self.pos
+        if start >= len(self.buffer):
+            raise ValueError(f"Unexpected end of notebook {self.path}")
+        if self.buffer[start] == '"':
+            end = self.scan_string(start)
+        elif self.buffer[start] in "[{":
+            end = self.scan_container(start)
+        else:
+            while (match := SCALAR_PATTERN.match(self.buffer, start)) is None or match.end() == len(self.buffer):
+                if not self.fill():
+                    break
+            if match is None:
+                raise ValueError(f"Invalid value at {start} in notebook {self.path}")
+            end = match.end()
+        self.pos = end
+        return self.buffer[start:end]
+
+    def scan_string(self, start: int) -> int:
+        pos = start + 1
+        while True:
+            end = self.buffer.find('"', pos)
+            if end == -1:
+                if not self.fill():
+                    raise ValueError(f"Unterminated string at {start} in notebook {self.path}")
+                continue
+            # The quote is escaped if it follows an odd number of backslashes
+            escape = end
+            while self.buffer[escape - 1] == "\\":
+                escape -= 1
+            if (end - escape) % 2 == 0:
+                return end + 1
+            pos = end + 1
+
+    def scan_container(self, start: int) -> int:
+        depth = 0
+        pos = start
+        while True:
+            match = STRUCTURE_PATTERN.search(self.buffer, pos)
+            if match is None:
+                if not self.fill():
+                    raise ValueError(f"Unterminated value at {start} in notebook {self.path}")
+                continue
+            character = match.group()
+            if character == '"':
+                pos = self.scan_string(match.start())
+                continue
+            depth += 1 if character in "[{" else -1
+            pos = match.end()
+            if depth == 0:
+                return pos
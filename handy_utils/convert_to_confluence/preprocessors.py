@@ -0,0 +1,104 @@
+"""nbconvert preprocessors for rendering notebooks to Confluence."""
+
+import base64
+import hashlib
+import mimetypes
+import re
+
+from nbconvert.preprocessors import Preprocessor, TagRemovePreprocessor
+
+NB_TAG_PREFIX = "#|nb_tag:"
+# Image types extracted into attachments, in order of preference
+IMAGE_MIMETYPES = ("image/png", "image/jpeg", "image/gif", "image/svg+xml")
+DATA_URI_PATTERN = re.compile(r"data:(image/[\w.+-]+);base64,([A-Za-z0-9+/=]+)")
+
+
+def get_title(markdown: str) -> str:
+    """Derive a page title from the first line of a markdown cell."""
+    return re.sub(r"[^a-zA-Z0-9\s]", "", markdown.split("\n", 1)[0]).strip()
+
+
+def split_nb_tag(source: str) -> tuple[str | None, str]:
+    """Split the tag of a `#|nb_tag: <tag>` first line from the rest of a cell source."""
+    if not source.startswith(NB_TAG_PREFIX):
+        return None, source
+    tag_line, _, source = source.partition("\n")
+    return tag_line[len(NB_TAG_PREFIX) :].strip(), source.strip()
+
+
+class NbTagPreprocessor(TagRemovePreprocessor):
+    """Apply `#|nb_tag: <tag>` lines and remove tagged cells, inputs and outputs in a single pass over the cells.
+
+    A `#|nb_tag:` first line is stripped from the cell source and its tag added to the cell tags, before the tag
+    removal rules of `TagRemovePreprocessor` apply. Removed cells are dropped with their outputs before any other
+    preprocessor or the templates see them. The page name, taken from the first markdown cell, removed or not, is
+    stored in `resources["page_name"]`.
+    """
+
+    def preprocess(self, nb, resources):
+        resources["page_name"] = None
+        cells = []
+        for index, cell in enumerate(nb.cells):
+            tag, cell.source = split_nb_tag(cell.source)
+            if tag is not None and tag not in cell.metadata.setdefault("tags", []):
+                cell.metadata.tags.append(tag)
+            if cell.cell_type == "markdown" and resources["page_name"] is None:
+                resources["page_name"] = get_title(cell.source)
+            if self.check_cell_conditions(cell, resources, index):
+                cells.append(self.preprocess_cell(cell, resources, index)[0])
+        nb.cells = cells
+        return nb, resources
+
+    def removes_outputs(self, cell: dict) -> bool:
+        """Whether the outputs of a cell, as read from the notebook file, are removed, so readers can skip them."""
+        source = cell.get("source", "")
+        tag, _ = split_nb_tag("".join(source) if isinstance(source, list) else source)
+        tags = {*cell.get("metadata", {}).get("tags", []), tag}
+        return bool(
+            self.remove_cell_tags.intersection(tags)
+            or (cell.get("cell_type") == "code" and self.remove_all_outputs_tags.intersection(tags))
+        )
+
+
+def get_attachment_name(data: bytes, mimetype: str) -> str:
+    """Name an attachment after a hash of its content."""
+    return hashlib.sha256(data).hexdigest()[:32] + (mimetypes.guess_extension(mimetype) or "")
+
+
+def decode_image(data: str, mimetype: str) -> bytes:
+    """Decode an image of a notebook, base64 encoded unless it is SVG."""
+    return data.encode() if mimetype == "image/svg+xml" else base64.b64decode(data)
+
+
+class ImageAttachmentPreprocessor(Preprocessor):
+    """Extract images into attachments named after their content, stored by name in `resources["outputs"]`.
+
+    Image outputs without an HTML representation get the attachment name of their preferred image type in
+    `output.metadata.filenames`. Image attachments of markdown cells and `data:` image URIs in their source are
+    replaced by the attachment name. The same image used several times is extracted once.
+    """
+
+    def preprocess_cell(self, cell, resources, index):
+        outputs = resources.setdefault("outputs", {})
+
+        def extract(data: bytes, mimetype: str) -> str:
+            name = get_attachment_name(data, mimetype)
+            outputs[name] = data
+            return name
+
+        if cell.cell_type == "markdown":
+            for name, bundle in list(cell.get("attachments", {}).items()):
+                mimetype = next((mimetype for mimetype in IMAGE_MIMETYPES if mimetype in bundle), None)
+                if mimetype is not None:
+                    filename = extract(decode_image(bundle[mimetype], mimetype), mimetype)
+                    cell.source = cell.source.replace(f"attachment:{name}", filename)
+                    del cell.attachments[name]
+            cell.source = DATA_URI_PATTERN.sub(lambda match: extract(base64.b64decode(match[2]), match[1]), cell.source)
+
+        for output in cell.get("outputs", []):
+            data = output.get("data", {})
+            mimetype = next((mimetype for mimetype in IMAGE_MIMETYPES if mimetype in data), None)
+            if mimetype is not None and "text/html" not in data:
+                filename = extract(decode_image(data[mimetype], mimetype), mimetype)
+                output.metadata.setdefault("filenames", {})[mimetype] = filename
+        return cell, resources
@@ -0,0 +1,172 @@
+"""Convert and publish many notebooks to Confluence in parallel."""
+
+import asyncio
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import nbformat
+from loguru import logger
+
+from handy_utils.configuration import load_configuration
+from handy_utils.convert_to_confluence.confluence_client import ConfluenceClient
+from handy_utils.convert_to_confluence.convert_to_confluence import (
+    get_attachments_dir,
+    get_exporter,
+    get_page_name,
+    get_page_url,
+    get_template_hash,
+    render_notebook,
+)
+from handy_utils.convert_to_confluence.manifest import ManifestEntry, PublishManifest, get_manifest_path, hash_file
+
+
+@dataclass
+class PublishResult:
+    """Outcome of publishing a notebook."""
+
+    notebook_path: Path
+    status: str = "failed"
+    output_path: Path | None = None
+    url: str | None = None
+    error: str | None = None
+
+
+def find_notebooks(patterns: list[str]) -> list[Path]:
+    """Expand notebook files, directories (searched recursively) and glob patterns into notebook paths."""
+    notebooks: dict[Path, None] = {}
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            matches = sorted(path.rglob("*.ipynb"))
+        elif path.exists():
+            matches = [path]
+        else:
+            matches = sorted(Path(match) for match in glob.glob(pattern, recursive=True))
+        notebooks.update((match, None) for match in matches if ".ipynb_checkpoints" not in match.parts)
+    return list(notebooks)
+
+
+def get_output_paths(notebook_paths: list[Path], output_path: Path | None) -> dict[Path, Path | None]:
+    """Mirror the notebooks under the output directory, relative to the directory they all are in.
+
+    Notebooks with the same name in different directories so get different outputs. A single notebook is rendered
+    to the output path itself when it is an `.html` file. Without an output path, every notebook is rendered in its
+    own temporary directory.
+    """
+    if output_path is None:
+        return {notebook_path: None for notebook_path in notebook_paths}
+    if len(notebook_paths) == 1 and output_path.suffix == ".html" and not output_path.is_dir():
+        return {notebook_paths[0]: output_path}
+    resolved = [notebook_path.resolve() for notebook_path in notebook_paths]
+    base_dir = Path(os.path.commonpath([path.parent for path in resolved]))
+    return {
+        notebook_path: output_path / path.relative_to(base_dir).with_suffix(".html")
+        for notebook_path, path in zip(notebook_paths, resolved)
+    }
+
+
+def warm_exporter() -> None:
+    """Build the exporter of a worker process and compile its templates before the first notebook arrives."""
+    get_exporter().from_notebook_node(nbformat.v4.new_notebook())
+
+
+async def apublish_notebooks(
+    notebook_paths: list[Path],
+    output_path: Path | None = None,
+    dry_run: bool = False,
+    max_workers: int | None = None,
+    manifest: PublishManifest | None = None,
+) -> list[PublishResult]:
+    """Convert notebooks across a pool of worker processes and upload each one as soon as it is converted.
+
+    Every worker builds and warms its own exporter once. Uploads of pages and their new attachments run
+    concurrently on a single Confluence client, at most `confluence_max_concurrent_uploads` at a time and
+    `confluence_requests_per_second` per second. When more than one notebook has no known page, the pages of the
+    space are listed once, while converting, rather than looked up by title one by one.
+
+    Unless it is a dry run, the manifest of published notebooks is used to skip notebooks whose source (and the
+    templates) did not change since they were last published, without converting them. Notebooks whose rendered
+    body did not change are not uploaded, and changed ones update their known page without looking it up by title.
+    """
+    config = load_configuration()
+    manifest = manifest or PublishManifest(get_manifest_path())
+    template_hash = get_template_hash()
+    max_workers = max_workers or config.confluence_max_workers or os.cpu_count() or 1
+    client = ConfluenceClient(config.confluence_space_key)
+    if not dry_run and sum(manifest.get(path, config.confluence_space_key) is None for path in notebook_paths) > 1:
+        client.load_pages()
+    output_paths = get_output_paths(notebook_paths, output_path)
+    loop = asyncio.get_running_loop()
+    # A single notebook is converted in this process rather than paying for a worker's startup. Workers are spawned
+    # rather than forked, which is unsafe from a process running an event loop and threads
+    pool = (
+        ProcessPoolExecutor(
+            min(max_workers, len(notebook_paths)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_exporter,
+        )
+        if len(notebook_paths) > 1
+        else None
+    )
+
+    async def publish(notebook_path: Path) -> PublishResult:
+        result = PublishResult(notebook_path)
+        try:
+            source_hash = await asyncio.to_thread(hash_file, notebook_path, template_hash)
+            entry = None if dry_run else manifest.get(notebook_path, config.confluence_space_key)
+            if entry is not None and entry.source_hash == source_hash:
+                result.status, result.url = "unchanged", get_page_url(entry.page_id)
+                return result
+
+            output_file = output_paths[notebook_path]
+            if output_file is not None:
+                output_file.parent.mkdir(parents=True, exist_ok=True)
+            result.output_path, page_name = await loop.run_in_executor(
+                pool, render_notebook, notebook_path, output_file
+            )
+            if dry_run:
+                result.status = "converted"
+                return result
+
+            body_hash = await asyncio.to_thread(hash_file, result.output_path)
+            if entry is not None and entry.body_hash == body_hash:
+                result.status, page_id = "up to date", entry.page_id
+            else:
+                text = await asyncio.to_thread(result.output_path.read_text)
+                page_name = page_name or get_page_name(result.output_path)
+                page_id = await client.upload_page(text, page_name, entry.page_id if entry else None)
+                await client.upload_attachments(page_id, get_attachments_dir(result.output_path))
+                result.status = "published"
+            manifest.set(notebook_path, ManifestEntry(config.confluence_space_key, page_id, source_hash, body_hash))
+            result.url = get_page_url(page_id)
+        except Exception as e:
+            logger.error(f"Failed to publish {notebook_path}: {e!r}")
+            result.error = repr(e)
+        return result
+
+    try:
+        return await asyncio.gather(*(publish(notebook_path) for notebook_path in notebook_paths))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        await client.aclose()
+        if not dry_run:
+            manifest.save()
+
+
+def publish_notebooks(
+    patterns: list[str], output_path: str | Path | None = None, dry_run: bool = False, max_workers: int | None = None
+) -> list[PublishResult]:
+    """Convert and publish every notebook matching `patterns` (files, directories or globs).
+
+    `output_path` is the `.html` output file of a single notebook, or else the directory mirroring the notebooks.
+    """
+    notebook_paths = find_notebooks(patterns)
+    if not notebook_paths:
+        return []
+    output_path = Path(output_path) if output_path else None
+    return asyncio.run(apublish_notebooks(notebook_paths, output_path, dry_run, max_workers))
@@ -1,3 +1,3 @@
-from handy_utils.generate_commit.generate_commit import generate_llm_commit_message, perform_commit
+from handy_utils.generate_commit.generate_commit import describe_usage, generate_llm_commit_message, perform_commit
 
-__all__ = ["generate_llm_commit_message", "perform_commit"]
+__all__ = ["describe_usage", "generate_llm_commit_message", "perform_commit"]
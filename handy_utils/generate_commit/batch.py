@@ -0,0 +1,103 @@
+"""Generate commit messages for many repositories or commits concurrently."""
+
+import asyncio
+import json
+import subprocess
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Iterator, TextIO
+
+from loguru import logger
+
+from handy_utils.configuration import load_configuration
+from handy_utils.generate_commit.diff_reader import FileRecord, git_command, read_commit_changes, read_staged_changes
+from handy_utils.generate_commit.generate_commit import agenerate_commit_message
+
+
+@dataclass
+class BatchItem:
+    """A repository's staged changes, or one of its commits if `rev` is set."""
+
+    repo: str
+    rev: str | None = None
+
+    def read_changes(self, max_file_bytes: int) -> Iterator[FileRecord]:
+        if self.rev is None:
+            return read_staged_changes(self.repo, max_file_bytes)
+        return read_commit_changes(self.rev, self.repo, max_file_bytes)
+
+    def __str__(self) -> str:
+        return f"{self.repo}@{self.rev[:12]}" if self.rev else self.repo
+
+
+def list_commits(rev_range: str, repo: str | Path | None = None) -> list[str]:
+    """List the commits in a `git rev-list` range, oldest first."""
+    return subprocess.check_output(git_command(["rev-list", "--reverse", rev_range], repo)).decode().split()
+
+
+def get_batch_items(repos: list[str], rev_range: str | None = None) -> list[BatchItem]:
+    """Get the staged changes of each repository, or each of their commits in `rev_range`."""
+    if rev_range is None:
+        return [BatchItem(repo) for repo in repos]
+    return [BatchItem(repo, rev) for repo in repos for rev in list_commits(rev_range, repo)]
+
+
+async def generate_batch(
+    items: list[BatchItem],
+    concurrency: int,
+    jira_ticket: str | None = None,
+    additional_message: str | None = None,
+) -> AsyncIterator[dict]:
+    """Generate commit messages for `items`, at most `concurrency` at a time, yielding results as they complete.
+
+    Each result holds the repository, the commit, the commit message or the error raised, and the latency in seconds.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    max_file_bytes = load_configuration().commit_max_file_bytes
+
+    async def generate(item: BatchItem) -> dict:
+        async with semaphore:
+            result: dict = {"repo": item.repo, "rev": item.rev}
+            start = time.perf_counter()
+            try:
+                message = await agenerate_commit_message(
+                    item.read_changes(max_file_bytes), jira_ticket, additional_message
+                )
+                result["message"] = str(message)
+            except Exception as e:
+                result["error"] = repr(e)
+            result["latency"] = round(time.perf_counter() - start, 3)
+            return result
+
+    for next_result in asyncio.as_completed([generate(item) for item in items]):
+        yield await next_result
+
+
+async def write_batch(
+    items: list[BatchItem],
+    output: TextIO,
+    concurrency: int,
+    jira_ticket: str | None = None,
+    additional_message: str | None = None,
+) -> int:
+    """Write the commit messages for `items` to `output` as JSON lines, logging progress.
+
+    Returns the number of items that failed.
+    """
+    done = failed = 0
+    start = time.perf_counter()
+    async for result in generate_batch(items, concurrency, jira_ticket, additional_message):
+        done += 1
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+        item = BatchItem(result["repo"], result["rev"])
+        if "error" in result:
+            failed += 1
+            logger.error(f"[{done}/{len(items)}] {item} failed after {result['latency']:.2f}s: {result['error']}")
+        else:
+            logger.info(f"[{done}/{len(items)}] {item} done in {result['latency']:.2f}s")
+    logger.info(
+        f"Generated {len(items) - failed} of {len(items)} commit messages in {time.perf_counter() - start:.2f}s"
+    )
+    return failed
@@ -0,0 +1,46 @@
+"""Persistent memo of generated commit messages, keyed on the staged tree."""
+
+import functools
+import hashlib
+import json
+import subprocess
+from pathlib import Path
+
+from diskcache import Cache
+
+from handy_utils.configuration import get_cache_dir, load_configuration
+from handy_utils.generate_commit.diff_reader import git_command
+
+
+def get_staged_tree(repo: str | Path | None = None) -> str:
+    """Get the hash of the tree object for the staged changes, which identifies them without reading the diff."""
+    return subprocess.check_output(git_command(["write-tree"], repo)).decode().strip()
+
+
+class CommitMessageCache:
+    """Cache of generated commit messages, evicting the least recently used once past `size_limit` bytes."""
+
+    def __init__(self, directory: Path, size_limit: int) -> None:
+        self.cache = Cache(directory, size_limit=size_limit, eviction_policy="least-recently-used")
+
+    @staticmethod
+    def get_key(tree: str, jira_ticket: str | None, additional_message: str | None, models: list[str]) -> str:
+        """Get the cache key of a commit message from the staged tree and the inputs of its generation."""
+        canonical = json.dumps([tree, jira_ticket, additional_message, models], separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        """Get the fields of the cached commit message for a key."""
+        return self.cache.get(key)
+
+    def set(self, key: str, message: dict) -> None:
+        """Cache the fields of a commit message."""
+        self.cache.set(key, message)
+
+
+@functools.cache
+def get_commit_message_cache() -> CommitMessageCache:
+    """Build the commit message cache from the configuration on first use."""
+    return CommitMessageCache(
+        get_cache_dir() / "commit_messages", size_limit=load_configuration().commit_cache_size_limit
+    )
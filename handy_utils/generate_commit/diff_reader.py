@@ -0,0 +1,107 @@
+"""Streaming reader for the changes in a git repository, one file at a time."""
+
+import os
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+STAGED_DIFF_ARGS = ["diff", "--cached", "-M"]
+
+
+@dataclass
+class FileRecord:
+    """The changes made to a single file."""
+
+    path: str
+    status: str
+    added: int | None = None
+    removed: int | None = None
+    hunks: str = ""
+    truncated: bool = False
+    old_path: str | None = None
+
+    @property
+    def is_binary(self) -> bool:
+        return self.added is None
+
+
+def git_command(args: list[str], repo: str | Path | None = None) -> list[str]:
+    """Build a git command, run in `repo` if given."""
+    return ["git", "-C", str(repo), *args] if repo is not None else ["git", *args]
+
+
+def parse_numstat(output: bytes) -> Iterator[tuple[int | None, int | None, str, str | None]]:
+    """Parse `--numstat -z` output into (added, removed, path, old path) tuples, with no counts for binaries."""
+    fields = iter(output.split(b"\0"))
+    for field in fields:
+        if not field:
+            continue
+        added, removed, path = field.split(b"\t", 2)
+        old_path = None
+        if not path:
+            # Renames and copies are followed by the old and new paths
+            old_path, path = os.fsdecode(next(fields)), next(fields)
+        yield (
+            None if added == b"-" else int(added),
+            None if removed == b"-" else int(removed),
+            os.fsdecode(path),
+            old_path,
+        )
+
+
+def parse_name_status(output: bytes) -> dict[str, str]:
+    """Parse `--name-status -z` output into a mapping of path to status letter."""
+    statuses = {}
+    fields = iter(output.split(b"\0"))
+    for status in fields:
+        if not status:
+            continue
+        path = next(fields)
+        if status[:1] in (b"R", b"C"):
+            path = next(fields)
+        statuses[os.fsdecode(path)] = status[:1].decode()
+    return statuses
+
+
+def read_capped(command: list[str], max_bytes: int) -> tuple[str, bool]:
+    """Read at most `max_bytes` of a command's output, stopping the command early if it has more.
+
+    Returns the output cut at the last complete line and whether it was truncated.
+    """
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        assert process.stdout is not None
+        data = process.stdout.read(max_bytes + 1)
+        truncated = len(data) > max_bytes
+        if truncated:
+            process.kill()
+            data = data[: data.rfind(b"\n", 0, max_bytes) + 1]
+    return data.decode("utf-8", errors="replace"), truncated
+
+
+def read_changes(
+    diff_args: list[str], repo: str | Path | None = None, max_file_bytes: int = 2**20
+) -> Iterator[FileRecord]:
+    """Lazily read the changes listed by a `git diff` like command, one file at a time.
+
+    Per file stats come from a single `--numstat` call, then each text file's diff is read on its own, capped at
+    `max_file_bytes`. The diff of binary files is never read.
+    """
+    numstat = subprocess.check_output(git_command([*diff_args, "--numstat", "-z"], repo))
+    statuses = parse_name_status(subprocess.check_output(git_command([*diff_args, "--name-status", "-z"], repo)))
+    for added, removed, path, old_path in parse_numstat(numstat):
+        record = FileRecord(path, statuses.get(path, "M"), added, removed, old_path=old_path)
+        if not record.is_binary:
+            paths = [old_path, path] if old_path else [path]
+            record.hunks, record.truncated = read_capped(git_command([*diff_args, "--", *paths], repo), max_file_bytes)
+        yield record
+
+
+def read_staged_changes(repo: str | Path | None = None, max_file_bytes: int = 2**20) -> Iterator[FileRecord]:
+    """Lazily read the staged changes of a repository, one file at a time."""
+    return read_changes(STAGED_DIFF_ARGS, repo, max_file_bytes)
+
+
+def read_commit_changes(rev: str, repo: str | Path | None = None, max_file_bytes: int = 2**20) -> Iterator[FileRecord]:
+    """Lazily read the changes made by a commit relative to its first parent, one file at a time."""
+    return read_changes(["show", "--format=", "-M", "--diff-merges=first-parent", rev], repo, max_file_bytes)
@@ -1,18 +1,33 @@
 """Generate a commit message for the changes."""
 
+import asyncio
+import functools
 import subprocess
-from typing import Any
+from typing import Any, Iterable, Iterator
 
-from pydantic import BaseModel, Field, field_validator
-from pydantic_ai import Agent, RunContext
+from loguru import logger
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from pydantic_ai import Agent
 from pydantic_ai.models.openai import OpenAIModel
+from pydantic_ai.usage import Usage
 
+from handy_utils import configure_logfire
 from handy_utils.configuration import load_configuration
-from handy_utils.generate_commit.prompts import CONVENTIONAL_COMMIT_SPEC, PROMPT
+from handy_utils.generate_commit.commit_cache import get_commit_message_cache, get_staged_tree
+from handy_utils.generate_commit.diff_reader import FileRecord, read_staged_changes
+from handy_utils.generate_commit.large_diff import prepare_changes
+from handy_utils.generate_commit.prompts import CHANGES_PROMPT, SYSTEM_PROMPT
+from handy_utils.generate_commit.repair import MAX_DESCRIPTION_LENGTH, LenientCommitMessage, repair_commit_message
 from handy_utils.utils.unified_provider import UnifiedProvider
 
-config = load_configuration()
-model = OpenAIModel("gemini-2.5-flash", provider=UnifiedProvider())
+COMMIT_MESSAGE_MODEL = "gemini-2.5-flash"
+
+
+@functools.cache
+def get_model() -> OpenAIModel:
+    """Build the commit message model on first use and reuse it for the rest of the process."""
+    configure_logfire()
+    return OpenAIModel(COMMIT_MESSAGE_MODEL, provider=UnifiedProvider())
 
 
 class ConventionalCommitMessage(BaseModel):
@@ -35,8 +50,8 @@ class ConventionalCommitMessage(BaseModel):
     @field_validator("description")
     def description_validator(cls, value: str) -> str:
         """Validate the description length."""
-        if len(value) > 100:
-            raise ValueError("Description too long, must be less than 100 characters.")
+        if len(value) > MAX_DESCRIPTION_LENGTH:
+            raise ValueError(f"Description too long, must be less than {MAX_DESCRIPTION_LENGTH} characters.")
         return value
 
     @field_validator("body")
@@ -81,43 +96,131 @@ class CommitMessageInput(BaseModel):
             raise ValueError("Changes cannot be empty.")
         return value
 
+    def to_prompt(self) -> str:
+        """Render the user prompt, which follows the static instructions."""
+        return CHANGES_PROMPT.format(changes=self.changes, additional_message=self.additional_message or "")
+
 
 commit_message_gen_agent = Agent(
-    model=model,
-    deps_type=CommitMessageInput,
+    instructions=SYSTEM_PROMPT,
     output_type=ConventionalCommitMessage,
 )
 
 
-@commit_message_gen_agent.instructions
-def system_prompt(ctx: RunContext[CommitMessageInput]) -> str:
-    return PROMPT.format(
-        changes=ctx.deps.changes,
-        additional_message=ctx.deps.additional_message or "",
-        conventional_commit_spec=CONVENTIONAL_COMMIT_SPEC,
-    )
+def get_changes() -> Iterator[FileRecord]:
+    """Lazily read the changes to be committed, one file at a time."""
+    return read_staged_changes(max_file_bytes=load_configuration().commit_max_file_bytes)
+
 
+def validate_candidate(candidate: LenientCommitMessage, repair: bool = True) -> ConventionalCommitMessage | None:
+    """Validate a candidate commit message, repairing cheap violations if `repair` is set."""
+    try:
+        return ConventionalCommitMessage.model_validate(candidate.model_dump())
+    except ValidationError:
+        if not repair:
+            return None
+    try:
+        return ConventionalCommitMessage.model_validate(repair_commit_message(candidate))
+    except ValidationError:
+        return None
 
-def get_changes() -> str:
-    """Get the changes to be committed."""
-    return subprocess.check_output(["git", "diff", "--cached"]).decode("utf-8")
 
+async def generate_candidates(
+    deps: CommitMessageInput, candidates: int, repair: bool = True, usage: Usage | None = None
+) -> ConventionalCommitMessage | None:
+    """Request `candidates` commit messages in parallel and return the first one valid after local validation.
 
-def generate_llm_commit_message(jira_ticket: str | None = None, additional_message: str | None = None) -> str:
-    """Generate a commit message for the changes."""
-    response = commit_message_gen_agent.run_sync(
-        "begin!",
-        deps=CommitMessageInput(
-            changes=get_changes(),
-            jira_ticket=jira_ticket,
-            additional_message=additional_message,
-        ),
-    ).output
+    The remaining requests are cancelled once a valid message is found. Returns None if no candidate is valid.
+    """
+    tasks = [
+        asyncio.create_task(
+            commit_message_gen_agent.run(
+                deps.to_prompt(), model=get_model(), output_type=LenientCommitMessage, usage=usage
+            )
+        )
+        for _ in range(candidates)
+    ]
+    try:
+        for next_candidate in asyncio.as_completed(tasks):
+            try:
+                candidate = (await next_candidate).output
+            except Exception as e:
+                logger.warning(f"Commit message candidate failed: {e!r}")
+                continue
+            if (message := validate_candidate(candidate, repair)) is not None:
+                return message
+            logger.warning(f"Discarding invalid commit message candidate: {candidate!r}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return None
+
+
+async def agenerate_commit_message(
+    changes: Iterable[FileRecord],
+    jira_ticket: str | None = None,
+    additional_message: str | None = None,
+    candidates: int = 1,
+    repair: bool = True,
+    usage: Usage | None = None,
+) -> ConventionalCommitMessage:
+    """Generate a commit message for the changes, summarizing them first if they do not fit the token budget.
+
+    With more than one candidate, candidates are generated in parallel and validated locally (see
+    `generate_candidates`), falling back to a single generation with model retries if none is valid. The tokens
+    used by every model call are added to `usage` if given.
+    """
+    deps = CommitMessageInput(
+        changes=await prepare_changes(changes, usage),
+        jira_ticket=jira_ticket,
+        additional_message=additional_message,
+    )
+    response = await generate_candidates(deps, candidates, repair, usage) if candidates > 1 else None
+    if response is None:
+        response = (await commit_message_gen_agent.run(deps.to_prompt(), model=get_model(), usage=usage)).output
     if jira_ticket:
         response.jira_ticket = jira_ticket
+    return response
+
+
+def generate_llm_commit_message(
+    jira_ticket: str | None = None,
+    additional_message: str | None = None,
+    use_cache: bool = True,
+    candidates: int = 1,
+    usage: Usage | None = None,
+) -> str:
+    """Generate a commit message for the changes.
+
+    Messages are memoized on the staged tree and the generation inputs, so generating one again for the same staged
+    changes (say after a dry run) needs no model call. With `use_cache=False` a new message is generated regardless.
+    The tokens used, including those read from the provider's prompt cache, are added to `usage` if given.
+    """
+    cache = get_commit_message_cache()
+    models = [COMMIT_MESSAGE_MODEL, load_configuration().commit_summary_model]
+    key = cache.get_key(get_staged_tree(), jira_ticket, additional_message, models)
+    if use_cache and (cached := cache.get(key)) is not None:
+        return str(ConventionalCommitMessage.model_validate(cached))
+    response = asyncio.run(
+        agenerate_commit_message(get_changes(), jira_ticket, additional_message, candidates, usage=usage)
+    )
+    cache.set(key, response.model_dump())
     return str(response)
 
 
+def describe_usage(usage: Usage) -> str:
+    """Describe the tokens used to generate a commit message, including the share read from the prompt cache."""
+    if not usage.requests:
+        return "Served from the commit message cache, no model call was made."
+    cached_tokens = (usage.details or {}).get("cached_tokens", 0)
+    cached_share = cached_tokens / usage.request_tokens if usage.request_tokens else 0
+    return (
+        f"Model calls: {usage.requests}, prompt tokens: {usage.request_tokens} "
+        f"({cached_tokens} cached, {cached_share:.0%}), completion tokens: {usage.response_tokens}"
+    )
+
+
 def perform_commit(commit_message):
     """Perform the commit."""
     subprocess.run(["git", "commit", "-m", commit_message])
@@ -0,0 +1,189 @@
+"""Map-reduce summarization of diffs too large for a single commit message prompt."""
+
+import asyncio
+import fnmatch
+import functools
+import itertools
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+from loguru import logger
+from pydantic_ai import Agent
+from pydantic_ai.models.openai import OpenAIModel
+from pydantic_ai.usage import Usage
+
+from handy_utils import configure_logfire
+from handy_utils.configuration import load_configuration
+from handy_utils.generate_commit.diff_reader import FileRecord
+from handy_utils.generate_commit.prompts import CHUNK_SUMMARY_PROMPT
+from handy_utils.utils.unified_provider import UnifiedProvider
+
+GENERATED_FILE_PATTERNS = (
+    "*.lock",
+    "package-lock.json",
+    "npm-shrinkwrap.json",
+    "pnpm-lock.yaml",
+    "go.sum",
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "*.snap",
+    "*_pb2.py",
+    "*_pb2.pyi",
+    "*.pb.go",
+    "dist/*",
+    "build/*",
+    "vendor/*",
+    "node_modules/*",
+)
+HUNK_HEADER_PATTERN = re.compile(r"^@@ ", re.MULTILINE)
+TRUNCATION_MARKER = "\n... (truncated)\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens in a text, at about four characters per token."""
+    return len(text) // 4
+
+
+def is_generated(record: FileRecord) -> bool:
+    """Whether a file is a lock file or generated artifact, which is described by rule instead."""
+    name = record.path.rsplit("/", 1)[-1]
+    return any(
+        fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(record.path, pattern) for pattern in GENERATED_FILE_PATTERNS
+    )
+
+
+def describe(record: FileRecord) -> str:
+    """Describe the changes made to a file from its stats alone."""
+    if record.is_binary:
+        return f"- {record.path}: binary file changed"
+    kind = "generated or lock file" if is_generated(record) else "file"
+    return f"- {record.path}: {kind} changed (+{record.added} -{record.removed})"
+
+
+def render(record: FileRecord) -> str:
+    """Render the changes made to a file for the prompt."""
+    if not record.hunks:
+        return describe(record) + "\n"
+    return record.hunks + TRUNCATION_MARKER if record.truncated else record.hunks
+
+
+def split_hunks(record: FileRecord, max_chars: int) -> list[str]:
+    """Split a file's diff into parts of at most `max_chars`, each repeating the file header.
+
+    Large files are split per hunk, and hunks larger than `max_chars` on their own are truncated.
+    """
+    text = render(record)
+    if len(text) <= max_chars:
+        return [text]
+    starts = [match.start() for match in HUNK_HEADER_PATTERN.finditer(text)] or [0]
+    header = text[: starts[0]]
+    parts = [header + text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+    return [
+        part if len(part) <= max_chars else part[: max_chars - len(TRUNCATION_MARKER)] + TRUNCATION_MARKER
+        for part in parts
+    ]
+
+
+@dataclass
+class DiffChunk:
+    """Parts of one or more file diffs, summarized together."""
+
+    records: list[FileRecord] = field(default_factory=list)
+    text: str = ""
+
+    def add(self, record: FileRecord, part: str) -> None:
+        if not self.records or self.records[-1] is not record:
+            self.records.append(record)
+        self.text += part
+
+    def describe(self) -> str:
+        return "\n".join(describe(record) for record in self.records)
+
+
+@functools.cache
+def get_summary_model() -> OpenAIModel:
+    """Build the small model summarizing diff chunks on first use."""
+    configure_logfire()
+    return OpenAIModel(load_configuration().commit_summary_model, provider=UnifiedProvider())
+
+
+chunk_summary_agent = Agent(output_type=str, instructions=CHUNK_SUMMARY_PROMPT)
+
+
+async def summarize_chunk(
+    chunk: DiffChunk, semaphore: asyncio.Semaphore, timeout: float, usage: Usage | None = None
+) -> str:
+    """Summarize a diff chunk with the small model, falling back to its file stats on failure.
+
+    The caller acquires `semaphore`, which is released once the chunk is summarized.
+    """
+    try:
+        result = await asyncio.wait_for(
+            chunk_summary_agent.run(chunk.text, model=get_summary_model(), usage=usage), timeout
+        )
+    except Exception as e:
+        logger.warning(f"Failed to summarize a diff chunk, using its file stats instead: {e!r}")
+        return chunk.describe()
+    finally:
+        semaphore.release()
+    return result.output.strip()
+
+
+async def summarize_changes(records: Iterator[FileRecord], usage: Usage | None = None) -> str:
+    """Summarize changes too large for one prompt by summarizing chunks of them concurrently.
+
+    Records are read and packed into chunks of about `commit_chunk_tokens` as earlier chunks are being summarized,
+    so at most `commit_max_concurrency` chunks are held in memory. Binary, generated and lock files are described
+    from their stats without a model call. At most `commit_max_chunks` chunks are summarized, each within
+    `commit_chunk_timeout` seconds, so the time taken is bounded however large the diff is. Chunks over the limit
+    are described from their stats.
+    """
+    config = load_configuration()
+    max_chars = config.commit_chunk_tokens * 4
+    semaphore = asyncio.Semaphore(config.commit_max_concurrency)
+    tasks: list[asyncio.Task[str]] = []
+    notes: list[str] = []
+
+    async def submit(chunk: DiffChunk) -> None:
+        if len(tasks) >= config.commit_max_chunks:
+            notes.append(chunk.describe())
+            return
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(summarize_chunk(chunk, semaphore, config.commit_chunk_timeout, usage)))
+
+    chunk = DiffChunk()
+    # Reading the next file's diff runs git, keep it off the event loop
+    while (record := await asyncio.to_thread(next, records, None)) is not None:
+        if record.is_binary or is_generated(record):
+            notes.append(describe(record))
+            continue
+        for part in split_hunks(record, max_chars):
+            if chunk.text and len(chunk.text) + len(part) > max_chars:
+                await submit(chunk)
+                chunk = DiffChunk()
+            chunk.add(record, part)
+    if chunk.text:
+        await submit(chunk)
+
+    logger.info(f"Summarizing {len(tasks)} diff chunks, describing {len(notes)} files or chunks from their stats.")
+    summaries = await asyncio.gather(*tasks)
+    return "\n".join(summary for summary in [*summaries, *notes] if summary)
+
+
+async def prepare_changes(records: Iterable[FileRecord], usage: Usage | None = None) -> str:
+    """Render the changes for the commit message prompt, summarizing them if they exceed `commit_token_budget`.
+
+    Records are read lazily, so no more than the token budget of diff text is held in memory.
+    """
+    budget = load_configuration().commit_token_budget
+    records = iter(records)
+    head: list[FileRecord] = []
+    tokens = 0
+    while (record := await asyncio.to_thread(next, records, None)) is not None:
+        head.append(record)
+        tokens += estimate_tokens(render(record))
+        if tokens > budget:
+            return await summarize_changes(itertools.chain(head, records), usage)
+    return "".join(render(record) for record in head)
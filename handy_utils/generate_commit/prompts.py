@@ -19,13 +19,22 @@ The key words “MUST”, “MUST NOT”, “REQUIRED”, “SHALL”, “SHALL
 16. BREAKING-CHANGE MUST be synonymous with BREAKING CHANGE, when used as a token in a footer.
 """  # noqa: E501
 
-PROMPT = """
+# The rules and the spec never change between runs, so they form the prompt prefix that providers can cache. The
+# changes and the additional message go last, in the user prompt.
+SYSTEM_PROMPT = f"""
 You are a git commit message generator. When generating the commit message adhere to the following rules:
-1. Use the conventional commits specification to generate the commit message.
-2. Use the changes mentioned below to generate a contextual commit message.
+1. Use the conventional commits specification below to generate the commit message.
+2. Use the changes given by the user to generate a contextual commit message.
 3. Make sure the commit message is concise and to the point.
 4. If user provides an additional message, use it as reference to generate the commit message.
+5. If the changes are summaries of parts of a large diff, write one commit message covering all of them.
 
+<conventional_commit_spec>
+{CONVENTIONAL_COMMIT_SPEC}
+</conventional_commit_spec>
+"""
+
+CHANGES_PROMPT = """
 <changes>
 
 ```diff
@@ -34,9 +43,12 @@ You are a git commit message generator. When generating the commit message adher
 
 </changes>
 
-<conventional_commit_spec>
-{conventional_commit_spec}
-</conventional_commit_spec>
-
 {additional_message}
 """
+
+CHUNK_SUMMARY_PROMPT = """
+You summarize one part of a large git diff, so that a commit message can later be written for the whole diff.
+1. Describe what changed and why it likely changed, in at most five short bullet points.
+2. Mention the files or components touched, but do not repeat the code.
+3. Only describe the changes in the given part of the diff.
+"""
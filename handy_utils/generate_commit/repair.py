@@ -0,0 +1,49 @@
+"""Lenient commit message output and local repair of cheap validation failures."""
+
+import textwrap
+
+from pydantic import BaseModel, Field
+
+MAX_DESCRIPTION_LENGTH = 100
+COMMIT_TYPE_SYNONYMS = {
+    "feature": "feat",
+    "features": "feat",
+    "bug": "fix",
+    "bugfix": "fix",
+    "hotfix": "fix",
+    "doc": "docs",
+    "documentation": "docs",
+    "format": "style",
+    "formatting": "style",
+    "refactoring": "refactor",
+    "performance": "perf",
+    "tests": "test",
+    "testing": "test",
+    "build": "chore",
+    "ci": "chore",
+    "chores": "chore",
+}
+
+
+class LenientCommitMessage(BaseModel):
+    """Commit message as generated by the model, validated locally rather than by another model round trip."""
+
+    type: str = Field(description="The type of the commit message")
+    description: str = Field(description="The description of the commit message", default="")
+    body: str = Field(description="The body of the commit message", default="")
+    footer: str = Field(description="The footer of the commit message", default="")
+
+
+def repair_commit_message(message: LenientCommitMessage) -> dict:
+    """Fix cheap violations of the commit message rules.
+
+    Maps commit type synonyms (`feature`, `bugfix`, ...) and stray scopes or `!` to the bare type, collapses the
+    description and body onto a single line and shortens the description to its maximum length.
+    """
+    commit_type = message.type.strip().lower().split("(", 1)[0].rstrip("!:")
+    return {
+        "type": COMMIT_TYPE_SYNONYMS.get(commit_type, commit_type),
+        "description": textwrap.shorten(message.description, width=MAX_DESCRIPTION_LENGTH, placeholder="..."),
+        "body": " ".join(message.body.split()),
+        "footer": message.footer,
+    }
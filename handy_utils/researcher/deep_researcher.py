@@ -1,61 +1,83 @@
+import functools
+
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.mcp import MCPServerStdio
 from pydantic_ai.models.anthropic import AnthropicModel
 
+from handy_utils import configure_logfire
 from handy_utils.configuration import load_configuration
 from handy_utils.researcher.prompts import JUNIOR_RESEARCHER_SYSTEM_PROMPT, LEAD_RESARCHER_SYSTEM_PROMPT
 from handy_utils.utils.anthropic_provider import AnthropicAIGatewayProvider
 
-provider = AnthropicAIGatewayProvider()
-lg_model = AnthropicModel(provider=provider, model_name="claude-sonnet-4@20250514")
-sm_model = AnthropicModel(provider=provider, model_name="claude-3-7-sonnet@20250219")
-config = load_configuration()
+
+@functools.cache
+def get_provider() -> AnthropicAIGatewayProvider:
+    """Build the AI Gateway provider on first use and reuse it for the rest of the process."""
+    configure_logfire()
+    return AnthropicAIGatewayProvider()
+
+
+@functools.cache
+def get_lg_model() -> AnthropicModel:
+    """Model used by the lead researcher."""
+    return AnthropicModel(provider=get_provider(), model_name="claude-sonnet-4@20250514")
+
+
+@functools.cache
+def get_sm_model() -> AnthropicModel:
+    """Model used by the junior researcher."""
+    return AnthropicModel(provider=get_provider(), model_name="claude-3-7-sonnet@20250219")
 
 
 lead_researcher = Agent(
     name="Lead Researcher",
-    model=lg_model,
     system_prompt=LEAD_RESARCHER_SYSTEM_PROMPT,
 )
 
-junior_researcher = Agent(
-    name="Junior Researcher",
-    model=sm_model,
-    system_prompt=JUNIOR_RESEARCHER_SYSTEM_PROMPT,
-    mcp_servers=[
-        MCPServerStdio(
-            "uvx",
-            args=[
-                "--from",
-                "atlassian-code-navigator-mcp",
-                "code-navigator-mcp",
-                "--email",
-                "avempali@atlassian.com",
-                "--api-key",
-                config.confluence_api_key,
-            ],
-        ),
-        MCPServerStdio(
-            "uvx",
-            args=[
-                "--from",
-                "atlassian-mcp-scout",
-                "scout",
-            ],
-        ),
-    ],
-)
+
+@functools.cache
+def get_junior_researcher() -> Agent:
+    """Build the junior researcher and its MCP server definitions on first use."""
+    config = load_configuration()
+    return Agent(
+        name="Junior Researcher",
+        model=get_sm_model(),
+        system_prompt=JUNIOR_RESEARCHER_SYSTEM_PROMPT,
+        mcp_servers=[
+            MCPServerStdio(
+                "uvx",
+                args=[
+                    "--from",
+                    "atlassian-code-navigator-mcp",
+                    "code-navigator-mcp",
+                    "--email",
+                    "avempali@atlassian.com",
+                    "--api-key",
+                    config.confluence_api_key,
+                ],
+            ),
+            MCPServerStdio(
+                "uvx",
+                args=[
+                    "--from",
+                    "atlassian-mcp-scout",
+                    "scout",
+                ],
+            ),
+        ],
+    )
 
 
 @lead_researcher.tool
 async def delegate_research_task(ctx: RunContext[None], task: str) -> str:
     """Delegate a research task to a junior researcher."""
-    response = await junior_researcher.run(task)
+    response = await get_junior_researcher().run(task)
     return response.output
 
 
 async def run_lead_researcher(query: str) -> str:
     """Run the lead researcher agent with the given query."""
+    junior_researcher = get_junior_researcher()
     async with lead_researcher.run_mcp_servers(), junior_researcher.run_mcp_servers():
-        response = await lead_researcher.run(query)
+        response = await lead_researcher.run(query, model=get_lg_model())
     return response.output
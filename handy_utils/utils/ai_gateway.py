@@ -1,17 +1,24 @@
 """AI Gateway utilities."""
 
+import asyncio
 import base64
+import concurrent.futures
+import functools
 import os
 import subprocess
+import threading
+import time
 from urllib.parse import unquote
 import json
 
 from diskcache import Cache
 from httpx import URL, Request
+from loguru import logger
 from pathlib import Path
 
-CACHE_DIR = Path.home() / ".handy_utils" / "cache"
-cache = Cache(CACHE_DIR / "slauth_token")
+from handy_utils.configuration import get_cache_dir
+
+CACHE_DIR = get_cache_dir()
 
 # Load configuration environment variables
 LLM_CACHING = os.getenv("LLM_CACHING", "false").lower() in ["true", "1", "yes"]
@@ -32,23 +39,165 @@ if headers_str := os.getenv("AI_GATEWAY_HEADERS"):
     AI_GATEWAY_HEADERS = json.loads(headers_str)
 
 
-@cache.memoize(expire=60 * 40)
+SLAUTH_TOKEN_COMMAND = ["atlas", "slauth", "token", "--aud=ai-gateway", "--env=staging", "--groups=atlassian-all"]
+SLAUTH_TOKEN_TTL = 60 * 60
+SLAUTH_TOKEN_REFRESH_MARGIN = 20 * 60
+
+
+def get_token_expiry(token: str) -> float | None:
+    """Read the `exp` claim of a JWT token without verifying it.
+
+    Returns:
+        The expiry as a unix timestamp, or None if the token is not a JWT with an `exp` claim.
+    """
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class SlauthTokenManager:
+    """Single-flight manager for slauth tokens generated with the Atlas CLI.
+
+    Tokens are kept in memory and in a disk cache shared by every process on the machine. A token is
+    refreshed in the background once less than `refresh_margin` seconds of its real TTL (read from the
+    token's `exp` claim) remain. Synchronous and async callers that find no valid token all wait on the
+    same `atlas slauth token` invocation, which runs in a worker thread so it does not block an event loop.
+    """
+
+    cache_key = "token"
+
+    def __init__(
+        self,
+        command: list[str] = SLAUTH_TOKEN_COMMAND,
+        ttl: int = SLAUTH_TOKEN_TTL,
+        refresh_margin: int = SLAUTH_TOKEN_REFRESH_MARGIN,
+        cache_dir: Path = CACHE_DIR / "slauth_token",
+    ) -> None:
+        """Create a token manager."""
+        self.command = command
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.cache_dir = cache_dir
+        self.token: str | None = None
+        self.expires_at = 0.0
+        # The refresh in flight, shared by synchronous and async callers
+        self._refresh_future: concurrent.futures.Future[str] | None = None
+        self._refresh_lock = threading.Lock()
+
+    @functools.cached_property
+    def cache(self) -> Cache:
+        """Disk cache shared across processes."""
+        return Cache(self.cache_dir)
+
+    @property
+    def _token_command(self) -> list[str]:
+        return [*self.command, "--ttl", f"{self.ttl // 60}m"]
+
+    def _needs_refresh(self) -> bool:
+        return self.expires_at - time.time() < self.refresh_margin
+
+    def _current_token(self) -> str | None:
+        """Return a valid token from memory, falling back to the disk cache when the in-memory one is stale."""
+        if self.token is not None and not self._needs_refresh():
+            return self.token
+        cached = self.cache.get(self.cache_key)
+        if cached is not None and cached[1] > self.expires_at:
+            self.token, self.expires_at = cached
+        if self.token is not None and self.expires_at > time.time():
+            return self.token
+        return None
+
+    def _store(self, token: str) -> str:
+        now = time.time()
+        self.token = token
+        self.expires_at = get_token_expiry(token) or now + self.ttl
+        self.cache.set(self.cache_key, (self.token, self.expires_at), expire=max(self.expires_at - now, 1))
+        return token
+
+    async def get_token(self) -> str:
+        """Get a valid token without blocking the event loop.
+
+        Returns:
+            str: The token for AI Gateway authentication.
+        """
+        token = self._current_token()
+        if token is None:
+            return await self.refresh()
+        if self._needs_refresh():
+            self.refresh_in_background()
+        return token
+
+    def get_token_sync(self) -> str:
+        """Get a valid token from synchronous code.
+
+        Returns:
+            str: The token for AI Gateway authentication.
+        """
+        token = self._current_token()
+        if token is None:
+            return self._start_refresh().result()
+        if self._needs_refresh():
+            self.refresh_in_background()
+        return token
+
+    async def refresh(self) -> str:
+        """Refresh the token, joining the refresh that is already in flight if there is one."""
+        # Shielded, so that a cancelled caller does not cancel the refresh other callers wait on
+        return await asyncio.shield(asyncio.wrap_future(self._start_refresh()))
+
+    def refresh_in_background(self) -> None:
+        """Start a refresh without waiting for it, unless one is already in flight."""
+        self._start_refresh()
+
+    def _start_refresh(self) -> concurrent.futures.Future[str]:
+        """Start a refresh in a worker thread unless one is already in flight, and return the refresh in flight."""
+        with self._refresh_lock:
+            if self._refresh_future is None or self._refresh_future.done():
+                self._refresh_future = concurrent.futures.Future()
+                threading.Thread(target=self._run_refresh, args=(self._refresh_future,), daemon=True).start()
+            return self._refresh_future
+
+    def _run_refresh(self, future: concurrent.futures.Future[str]) -> None:
+        try:
+            future.set_result(self._refresh())
+        except Exception as e:
+            logger.warning(f"slauth token refresh failed: {getattr(e, 'stderr', None) or e!r}")
+            future.set_exception(e)
+
+    def _refresh(self) -> str:
+        cached = self.cache.get(self.cache_key)
+        if cached is not None and cached[1] - time.time() >= self.refresh_margin:
+            # Another process already refreshed the token
+            self.token, self.expires_at = cached
+            return self.token
+        token_result = subprocess.run(self._token_command, check=True, capture_output=True, text=True)
+        return self._store(token_result.stdout.strip())
+
+
+slauth_token_manager = SlauthTokenManager()
+
+
 def generate_ai_gateway_token() -> str:
-    """Use the Atlas CLI to generate a new slauth token.
+    """Get a slauth token generated with the Atlas CLI.
+
+    Tokens are cached in memory and on disk, and refreshed once less than 20 minutes of their TTL remain.
+
+    Returns:
+        str: The generated token for AI Gateway authentication.
+    """
+    return slauth_token_manager.get_token_sync()
 
-    Tokens are cached for 40 minutes before being refreshed
+
+async def agenerate_ai_gateway_token() -> str:
+    """Async version of `generate_ai_gateway_token` that does not block the event loop.
 
     Returns:
         str: The generated token for AI Gateway authentication.
     """
-    token_result = subprocess.run(
-        "atlas slauth token --aud=ai-gateway --env=staging --groups=atlassian-all --ttl 60m",
-        shell=True,
-        check=True,
-        capture_output=True,
-        text=True,
-    )
-    return token_result.stdout.strip()
+    return await slauth_token_manager.get_token()
 
 
 def get_base_url() -> str:
@@ -78,7 +227,18 @@ def get_ai_gateway_headers() -> dict[str, str]:
     Returns:
         AI Gateway headers.
     """
+    return build_ai_gateway_headers(generate_ai_gateway_token() if uses_slauth() else None)
+
 
+def build_ai_gateway_headers(slauth_token: str | None = None) -> dict[str, str]:
+    """Build the AI Gateway headers from an already obtained slauth token, without fetching one.
+
+    Args:
+        slauth_token: Token for the `SLAUTH` authorization, required when `uses_slauth()`.
+
+    Returns:
+        AI Gateway headers.
+    """
     headers = {}
     if AI_GATEWAY_HEADERS:
         headers = AI_GATEWAY_HEADERS
@@ -108,7 +268,7 @@ def get_ai_gateway_headers() -> dict[str, str]:
             "X-Atlassian-CloudId": CLOUD_ID,
             "X-Atlassian-UserId": os.environ["USER"],
             "X-Atlassian-UseCaseId": USE_CASE_ID,
-            "Authorization": "SLAUTH " + generate_ai_gateway_token(),
+            "Authorization": f"SLAUTH {slauth_token}",
         }
     elif AUTH_METHOD == "api_token":
         encoded_token = base64.b64encode(f"{USER_EMAIL}:{USER_API_TOKEN}".encode("utf-8")).decode("utf-8")
@@ -123,6 +283,53 @@ def get_ai_gateway_headers() -> dict[str, str]:
     return headers
 
 
+def uses_slauth() -> bool:
+    """Whether AI Gateway headers carry a slauth token that needs refreshing."""
+    return AUTH_METHOD == "slauth" and not AI_GATEWAY_HEADERS and not MESH_DEPENDENCY_AI_GATEWAY_BASE_URL
+
+
+class GatewayHeaderProvider:
+    """Resolves AI Gateway headers and base URL once per client.
+
+    Headers are only recomputed when the underlying credential (the slauth token) rotates. `hits` and
+    `recomputes` count how often the cached headers were reused or rebuilt.
+    """
+
+    def __init__(self, extra_headers: dict[str, str] | None = None) -> None:
+        """Create a header provider, resolving the base URL and the initial headers."""
+        self.base_url = get_base_url()
+        self.extra_headers = extra_headers or {}
+        self.hits = 0
+        self.recomputes = 0
+        self._credential: str | None = None
+        self._headers = self._resolve(generate_ai_gateway_token() if uses_slauth() else None, force=True)
+
+    def _resolve(self, credential: str | None, force: bool = False) -> dict[str, str]:
+        if not force and credential == self._credential:
+            self.hits += 1
+            return self._headers
+        self._credential = credential
+        self._headers = build_ai_gateway_headers(credential) | self.extra_headers
+        self.recomputes += 1
+        return self._headers
+
+    def get(self) -> dict[str, str]:
+        """Get the AI Gateway headers.
+
+        Returns:
+            AI Gateway headers.
+        """
+        return self._resolve(generate_ai_gateway_token() if uses_slauth() else None)
+
+    async def aget(self) -> dict[str, str]:
+        """Async version of `get` that refreshes slauth tokens without blocking the event loop.
+
+        Returns:
+            AI Gateway headers.
+        """
+        return self._resolve(await agenerate_ai_gateway_token() if uses_slauth() else None)
+
+
 def format_proxy_url(request: Request) -> Request:
     """Format the proxy URL for our AI Gateway proxy.
 
@@ -1,17 +1,61 @@
 """Integration module for Anthropic AI models through AI Gateway."""
 
 import abc
-from copy import deepcopy
+import json
+from dataclasses import dataclass
 from typing import Any, Literal
 
 from anthropic import AsyncAnthropic
 from anthropic._streaming import ServerSentEvent, SSEBytesDecoder, SSEDecoder
-from httpx import Request
+from httpx import Request, Response
+from loguru import logger
 from pydantic_ai.providers.anthropic import AnthropicProvider
 
-from handy_utils.utils.ai_gateway import format_proxy_url, get_ai_gateway_headers, get_base_url
+from handy_utils.utils.ai_gateway import GatewayHeaderProvider, format_proxy_url
+from handy_utils.utils.http_client import get_gateway_timeout, get_shared_transport
+from handy_utils.utils.resilience import ResilientAsyncClient
 
-PromptCachingStrategy = Literal["last_4", "first_4", "last_4_exclude_last"] | None
+PromptCachingStrategy = Literal["auto", "last_4", "first_4", "last_4_exclude_last"] | None
+
+MAX_CACHE_BREAKPOINTS = 4
+# Prefixes shorter than this are not cached by Anthropic models
+MIN_CACHEABLE_TOKENS = 1024
+# Content blocks that cannot carry a cache_control breakpoint
+UNCACHEABLE_BLOCK_TYPES = ("thinking", "redacted_thinking")
+
+
+def with_cache_control(blocks: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Copy a list of blocks, adding a cache breakpoint to a copy of the last one."""
+    return [*blocks[:-1], {**blocks[-1], "cache_control": {"type": "ephemeral"}}]
+
+
+def estimate_tokens(value: Any) -> int:
+    """Roughly estimate the number of tokens in a JSON value (~4 characters per token)."""
+    return len(json.dumps(value, ensure_ascii=False)) // 4
+
+
+@dataclass
+class PromptCacheUsage:
+    """Prompt caching usage reported by the gateway, accumulated over the calls made by a client."""
+
+    calls: int = 0
+    input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+
+    def record(self, usage: dict[str, Any]) -> None:
+        """Record the usage of a single call."""
+        input_tokens = usage.get("input_tokens") or 0
+        cache_creation = usage.get("cache_creation_input_tokens") or 0
+        cache_read = usage.get("cache_read_input_tokens") or 0
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.cache_creation_input_tokens += cache_creation
+        self.cache_read_input_tokens += cache_read
+        logger.info(
+            f"Prompt cache usage: {cache_read} tokens read from cache, {cache_creation} tokens written to cache, "
+            f"{input_tokens} uncached input tokens."
+        )
 
 
 class SSEDecoderAIGateway(SSEDecoder):
@@ -20,11 +64,17 @@ class SSEDecoderAIGateway(SSEDecoder):
     AI Gateway removes the "event" line from the SSE stream, so we need a custom decoder to handle this.
     """
 
+    def __init__(self, prompt_cache_usage: PromptCacheUsage | None = None) -> None:
+        super().__init__()
+        self.prompt_cache_usage = prompt_cache_usage
+
     def decode(self, line: str) -> ServerSentEvent | None:
         """Decode a line from the SSE stream."""
         sse = super().decode(line)
         if sse and sse.event is None:
             sse._event = sse.json().get("type")
+        if sse and sse.event == "message_start" and self.prompt_cache_usage is not None:
+            self.prompt_cache_usage.record(sse.json()["message"].get("usage", {}))
         return sse
 
 
@@ -39,23 +89,36 @@ class AsyncAnthropicAIGateway(AsyncAnthropic, abc.ABC):
         self,
         *args: Any,
         base_url: str,
+        header_provider: GatewayHeaderProvider,
         prompt_caching_strategy: PromptCachingStrategy = None,
         **kwargs: Any,
     ) -> None:
         """Initialize the Anthropic AI-Gateway client."""
         self.prompt_caching_strategy = prompt_caching_strategy
+        self.header_provider = header_provider
+        self.prompt_cache_usage = PromptCacheUsage()
         super().__init__(
             *args,
             base_url=base_url,
-            default_headers=get_ai_gateway_headers(),
+            default_headers=header_provider.get(),
             api_key="NA",
+            # Retries are handled by ResilientAsyncClient
             max_retries=0,
+            timeout=get_gateway_timeout(),
+            http_client=ResilientAsyncClient(
+                transport=get_shared_transport(),
+                timeout=get_gateway_timeout(),
+                event_hooks={"response": [self._record_prompt_cache_usage]},
+            ),
             **kwargs,
         )
 
     async def _prepare_options(self, options):
-        """Prepare the options for the AI Gateway request."""
-        options = deepcopy(options)
+        """Prepare the options for the AI Gateway request.
+
+        `options` is already a shallow copy made by the Anthropic client for this attempt. The request body is
+        adapted copy-on-write, so the message history is shared with the caller instead of being copied.
+        """
         options.url = self._adapt_url_path(options.url, options.json_data)
         options.json_data = self._adapt_request_body(options.json_data)
         return options
@@ -70,41 +133,104 @@ class AsyncAnthropicAIGateway(AsyncAnthropic, abc.ABC):
     async def _prepare_request(self, request: Request) -> None:
         """Prepare the request for AI Gateway."""
         request = format_proxy_url(request)
+        request.headers.update(await self.header_provider.aget())
         request.headers["anthropic_version"] = self.anthropic_version
 
     def _adapt_request_body(self, request_body: Any) -> Any:
-        request_body.pop("stream", None)
-        request_body.pop("model", None)
-        for message in request_body["messages"]:
-            if isinstance(message["content"], str):
-                message["content"] = [{"type": "text", "text": message["content"]}]
-        if self.prompt_caching_strategy:
+        """Adapt the request body without mutating it, only copying the parts that change."""
+        request_body = {key: value for key, value in request_body.items() if key not in ("stream", "model")}
+        request_body["messages"] = [
+            {**message, "content": [{"type": "text", "text": message["content"]}]}
+            if isinstance(message["content"], str)
+            else message
+            for message in request_body["messages"]
+        ]
+        if self.prompt_caching_strategy == "auto":
+            self._add_auto_prompt_caching_breakpoints(request_body)
+        elif self.prompt_caching_strategy:
             request_body["messages"] = self._add_prompt_caching_breakpoints(request_body["messages"])
         request_body["anthropic_version"] = self.anthropic_version
         return request_body
 
     def _add_prompt_caching_breakpoints(self, messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
         """Add prompt caching breakpoints to the messages."""
-        user_msgs = [msg for msg in messages if msg["role"] == "user"]
+        user_indexes = [i for i, msg in enumerate(messages) if msg["role"] == "user"]
         if self.prompt_caching_strategy == "last_4":
-            messages_iter = user_msgs[::-1]
+            indexes_iter = user_indexes[::-1]
         elif self.prompt_caching_strategy == "last_4_exclude_last":
-            messages_iter = user_msgs[:-1][::-1]
+            indexes_iter = user_indexes[:-1][::-1]
         elif self.prompt_caching_strategy == "first_4":
-            messages_iter = user_msgs
+            indexes_iter = user_indexes
         else:
             raise ValueError(f"Unsupported prompt caching strategy: {self.prompt_caching_strategy}.")
+        messages = list(messages)
         breakpoints_added = 0
-        for msg in messages_iter:
-            if msg["role"] == "user" and msg["content"]:
-                msg["content"][-1]["cache_control"] = {"type": "ephemeral"}
+        for i in indexes_iter:
+            if messages[i]["content"]:
+                messages[i] = {**messages[i], "content": with_cache_control(messages[i]["content"])}
                 breakpoints_added += 1
-                if breakpoints_added == 4:
+                if breakpoints_added == MAX_CACHE_BREAKPOINTS:
                     break
         return messages
 
+    def _add_auto_prompt_caching_breakpoints(self, request_body: dict[str, Any]) -> None:
+        """Place the allowed breakpoints after the prefixes that are worth caching.
+
+        Tool definitions and the system prompt are stable across calls, so they get a breakpoint as soon as the
+        prefix they end is long enough to be cached. The remaining breakpoints go to the latest messages of a
+        multi-turn conversation: one on the last message writes the conversation so far for the next turn, and
+        the earlier ones read back what previous turns wrote. A single message that changes on every call (e.g.
+        a one-shot prompt) is never worth a cache write.
+        """
+        if isinstance(request_body.get("system"), str):
+            request_body["system"] = [{"type": "text", "text": request_body["system"]}]
+
+        prefix_tokens = 0
+        stable: list[tuple[int, str]] = []
+        for section in ("tools", "system"):
+            if request_body.get(section):
+                prefix_tokens += estimate_tokens(request_body[section])
+                stable.append((prefix_tokens, section))
+        stable_tokens = prefix_tokens
+
+        turns: list[tuple[int, int]] = []
+        for i, message in enumerate(request_body["messages"]):
+            prefix_tokens += estimate_tokens(message["content"])
+            if message["content"] and message["content"][-1].get("type") not in UNCACHEABLE_BLOCK_TYPES:
+                turns.append((prefix_tokens, i))
+
+        sections = [section for tokens, section in stable if tokens >= MIN_CACHEABLE_TOKENS]
+        message_indexes = []
+        if len(request_body["messages"]) > 1:
+            # Walk back from the latest message, spacing breakpoints so that each one covers enough new tokens
+            floor_tokens = stable_tokens if sections else 0
+            previous_tokens = None
+            for tokens, i in reversed(turns):
+                if len(sections) + len(message_indexes) == MAX_CACHE_BREAKPOINTS:
+                    break
+                if tokens - floor_tokens < MIN_CACHEABLE_TOKENS:
+                    break
+                if previous_tokens is None or previous_tokens - tokens >= MIN_CACHEABLE_TOKENS:
+                    message_indexes.append(i)
+                    previous_tokens = tokens
+
+        for section in sections:
+            request_body[section] = with_cache_control(request_body[section])
+        for i in message_indexes:
+            message = request_body["messages"][i]
+            request_body["messages"][i] = {**message, "content": with_cache_control(message["content"])}
+
+    async def _record_prompt_cache_usage(self, response: Response) -> None:
+        """Record the prompt cache usage of a non-streaming response."""
+        if response.status_code != 200 or "text/event-stream" in response.headers.get("Content-Type", ""):
+            return
+        await response.aread()
+        usage = response.json().get("usage")
+        if usage:
+            self.prompt_cache_usage.record(usage)
+
     def _make_sse_decoder(self) -> SSEDecoder | SSEBytesDecoder:
-        return SSEDecoderAIGateway()
+        return SSEDecoderAIGateway(self.prompt_cache_usage)
 
 
 class AsyncAnthropicVertexAIGateway(AsyncAnthropicAIGateway):
@@ -116,7 +242,10 @@ class AsyncAnthropicVertexAIGateway(AsyncAnthropicAIGateway):
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         """Initialize the Anthropic Vertex AI-Gateway client."""
-        super().__init__(*args, base_url=get_base_url() + "/v1/google/v1", **kwargs)
+        header_provider = GatewayHeaderProvider()
+        super().__init__(
+            *args, base_url=header_provider.base_url + "/v1/google/v1", header_provider=header_provider, **kwargs
+        )
 
 
 class AsyncAnthropicBedrockAIGateway(AsyncAnthropicAIGateway):
@@ -128,7 +257,10 @@ class AsyncAnthropicBedrockAIGateway(AsyncAnthropicAIGateway):
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         """Initialize the Anthropic Vertex AI-Gateway client."""
-        super().__init__(*args, base_url=get_base_url() + "/v1/bedrock", **kwargs)
+        header_provider = GatewayHeaderProvider()
+        super().__init__(
+            *args, base_url=header_provider.base_url + "/v1/bedrock", header_provider=header_provider, **kwargs
+        )
 
 
 class AnthropicAIGatewayProvider(AnthropicProvider):
@@ -0,0 +1,63 @@
+"""Shared HTTP transport for AI Gateway and Confluence clients."""
+
+import asyncio
+import functools
+import importlib.util
+import weakref
+
+from httpx import AsyncBaseTransport, AsyncHTTPTransport, Limits, Request, Response, Timeout
+from loguru import logger
+
+from handy_utils.configuration import load_configuration
+
+
+class SharedAsyncHTTPTransport(AsyncBaseTransport):
+    """Connection pools shared by every AI Gateway and Confluence client in the process, one per event loop.
+
+    Pooled connections belong to the event loop that opened them, so requests are sent through the pool of the
+    running loop, and each `asyncio.run` gets a pool of its own. Clients close their transport when they are closed,
+    so `aclose` is a no-op here.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        self.transport_kwargs = kwargs
+        self.pools: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncHTTPTransport] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def get_pool(self) -> AsyncHTTPTransport:
+        """Get the connection pool of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self.pools:
+            self.pools[loop] = AsyncHTTPTransport(**self.transport_kwargs)
+        return self.pools[loop]
+
+    async def handle_async_request(self, request: Request) -> Response:
+        return await self.get_pool().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Keep the pool open when a client using it is closed."""
+
+
+@functools.cache
+def get_shared_transport() -> SharedAsyncHTTPTransport:
+    """Build the process-wide pooled transport from the configuration on first use."""
+    config = load_configuration()
+    http2 = config.http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("http2 is enabled but the h2 package is not installed, falling back to HTTP/1.1.")
+        http2 = False
+    return SharedAsyncHTTPTransport(
+        http2=http2,
+        limits=Limits(
+            max_connections=config.http_max_connections,
+            max_keepalive_connections=config.http_max_keepalive_connections,
+            keepalive_expiry=config.http_keepalive_expiry,
+        ),
+    )
+
+
+def get_gateway_timeout() -> Timeout:
+    """Get the configured connect and read timeouts for AI Gateway requests."""
+    config = load_configuration()
+    return Timeout(config.http_read_timeout, connect=config.http_connect_timeout)
@@ -0,0 +1,70 @@
+"""Persistent, content-addressed cache of LLM responses."""
+
+import functools
+import hashlib
+import json
+from pathlib import Path
+
+from diskcache import Cache
+from httpx import Request, Response
+
+from handy_utils.configuration import get_cache_dir, load_configuration
+from handy_utils.utils import ai_gateway, json_codec
+
+
+class LLMResponseCache:
+    """Cache of successful, non-streaming LLM responses keyed on a canonical hash of the request.
+
+    The key covers the endpoint and the full request body (model, messages, tools and parameters) but not the
+    headers, so rotating credentials do not invalidate it. Entries expire after `ttl` seconds and the least
+    recently used ones are evicted once the cache grows past `size_limit` bytes.
+    """
+
+    def __init__(self, directory: Path, size_limit: int, ttl: int) -> None:
+        self.cache = Cache(directory, size_limit=size_limit, eviction_policy="least-recently-used")
+        self.cache.stats(enable=True)
+        self.ttl = ttl
+
+    @staticmethod
+    def get_key(request: Request) -> str | None:
+        """Get the cache key of a request, or None if the request cannot be cached."""
+        try:
+            body = json_codec.loads(request.content)
+        except ValueError:
+            return None
+        if not isinstance(body, dict) or body.get("stream") or body.get("request_payload", {}).get("stream"):
+            return None
+        canonical = json.dumps([request.method, request.url.path, body], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, request: Request) -> Response | None:
+        """Get the cached response for a key."""
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        status_code, content_type, content = cached
+        return Response(status_code, headers={"Content-Type": content_type}, content=content, request=request)
+
+    async def set(self, key: str, response: Response) -> None:
+        """Cache a successful response."""
+        if response.status_code != 200:
+            return
+        content = await response.aread()
+        content_type = response.headers.get("Content-Type", "application/json")
+        self.cache.set(key, (response.status_code, content_type, content), expire=self.ttl)
+
+    def stats(self) -> dict[str, int]:
+        """Get the hit and miss counts and the current size of the cache in bytes."""
+        hits, misses = self.cache.stats()
+        return {"hits": hits, "misses": misses, "size": self.cache.volume()}
+
+
+@functools.cache
+def get_llm_cache() -> LLMResponseCache | None:
+    """Build the response cache from the configuration if `LLM_CACHING` is enabled."""
+    if not ai_gateway.LLM_CACHING:
+        return None
+    config = load_configuration()
+    return LLMResponseCache(
+        get_cache_dir() / "llm_responses", size_limit=config.llm_cache_size_limit, ttl=config.llm_cache_ttl
+    )
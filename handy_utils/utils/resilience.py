@@ -0,0 +1,186 @@
+"""Retry, backoff and rate limiting for AI Gateway clients."""
+
+import asyncio
+import contextlib
+import functools
+import random
+import re
+import time
+import weakref
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator
+
+from httpx import AsyncClient, ConnectError, ConnectTimeout, RemoteProtocolError, Request, Response
+from loguru import logger
+
+from handy_utils.configuration import load_configuration
+from handy_utils.utils.llm_cache import LLMResponseCache, get_llm_cache
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = (ConnectError, ConnectTimeout, RemoteProtocolError)
+MODEL_PATH_PATTERN = re.compile(r"/models?/([^/:]+)")
+
+
+def get_retry_after(response: Response) -> float | None:
+    """Read the delay requested by the server through `retry-after-ms` or `Retry-After`, in seconds."""
+    if retry_after_ms := response.headers.get("retry-after-ms"):
+        with contextlib.suppress(ValueError):
+            return float(retry_after_ms) / 1000
+    retry_after = response.headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    with contextlib.suppress(TypeError, ValueError):
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+    return None
+
+
+@dataclass
+class RetryPolicy:
+    """Jittered exponential backoff that honors `Retry-After`."""
+
+    max_retries: int = 5
+    initial_delay: float = 0.5
+    max_delay: float = 30.0
+
+    def get_delay(self, attempt: int, response: Response | None = None) -> float:
+        """Get how long to wait before retrying after the given (zero based) attempt."""
+        retry_after = get_retry_after(response) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Full jitter, see https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+        return random.uniform(0, min(self.max_delay, self.initial_delay * 2**attempt))
+
+
+class TokenBucket:
+    """Token bucket rate limiter, allowing `rate` requests per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        # Reserve a token right away, waiting for the refill if the bucket is in debt
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class GatewayLimiter:
+    """Process-wide concurrency limit per model and request rate limit for AI Gateway calls.
+
+    asyncio semaphores are bound to the event loop that first waits on them, so every event loop gets its own
+    semaphores and token bucket.
+    """
+
+    def __init__(self, max_concurrency_per_model: int, requests_per_second: float | None = None) -> None:
+        self.max_concurrency_per_model = max_concurrency_per_model
+        self.requests_per_second = requests_per_second
+        # Event loop to the semaphore of each model and the token bucket
+        self.loop_limits: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, tuple[dict[str, asyncio.Semaphore], TokenBucket | None]
+        ] = weakref.WeakKeyDictionary()
+
+    def get_loop_limits(self) -> tuple[dict[str, asyncio.Semaphore], TokenBucket | None]:
+        """Get the semaphores and token bucket of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self.loop_limits:
+            bucket = TokenBucket(self.requests_per_second) if self.requests_per_second else None
+            self.loop_limits[loop] = ({}, bucket)
+        return self.loop_limits[loop]
+
+    @contextlib.asynccontextmanager
+    async def limit(self, model: str) -> AsyncIterator[None]:
+        """Hold a concurrency slot for `model` and a rate limit token for the duration of a request."""
+        semaphores, bucket = self.get_loop_limits()
+        if model not in semaphores:
+            semaphores[model] = asyncio.Semaphore(self.max_concurrency_per_model)
+        async with semaphores[model]:
+            if bucket is not None:
+                await bucket.acquire()
+            yield
+
+
+@functools.cache
+def get_gateway_limiter() -> GatewayLimiter:
+    """Build the limiter shared by every AI Gateway client from the configuration on first use."""
+    config = load_configuration()
+    return GatewayLimiter(config.gateway_max_concurrency_per_model, config.gateway_requests_per_second or None)
+
+
+def get_retry_policy() -> RetryPolicy:
+    """Get the configured retry policy for AI Gateway requests."""
+    return RetryPolicy(max_retries=load_configuration().gateway_max_retries)
+
+
+class ResilientAsyncClient(AsyncClient):
+    """HTTP client that retries transient AI Gateway failures and applies the shared limiter.
+
+    Retryable responses (429, 5xx, ...) and connection errors are retried with jittered exponential backoff.
+    Once retries are exhausted the last response is returned as is, so the SDK using this client raises its
+    own typed status error. When LLM caching is enabled, cached responses are returned without a gateway call.
+    """
+
+    def __init__(
+        self,
+        *args,
+        retry_policy: RetryPolicy | None = None,
+        limiter: GatewayLimiter | None = None,
+        response_cache: LLMResponseCache | None = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.retry_policy = retry_policy or get_retry_policy()
+        self.limiter = limiter or get_gateway_limiter()
+        self.response_cache = response_cache or get_llm_cache()
+
+    @staticmethod
+    def get_model(request: Request) -> str:
+        """Get the model a request is for from its URL, falling back to the URL path."""
+        match = MODEL_PATH_PATTERN.search(request.url.path)
+        return match.group(1) if match else request.url.path
+
+    async def send(self, request: Request, *args, model: str | None = None, **kwargs) -> Response:
+        """Send a request, serving it from the response cache or retrying transient failures."""
+        cache_key = None
+        if self.response_cache is not None and not kwargs.get("stream"):
+            cache_key = self.response_cache.get_key(request)
+        if cache_key is not None and (cached := self.response_cache.get(cache_key, request)) is not None:
+            return cached
+        resp = await self._send_with_retries(request, *args, model=model, **kwargs)
+        if cache_key is not None:
+            await self.response_cache.set(cache_key, resp)
+        return resp
+
+    async def _send_with_retries(self, request: Request, *args, model: str | None = None, **kwargs) -> Response:
+        model = model or self.get_model(request)
+        attempt = 0
+        while True:
+            try:
+                async with self.limiter.limit(model):
+                    resp = await super().send(request, *args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.retry_policy.max_retries:
+                    raise
+                delay = self.retry_policy.get_delay(attempt)
+                logger.warning(f"AI Gateway request for {model} failed with {e!r}, retrying in {delay:.2f}s.")
+            else:
+                if resp.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.retry_policy.max_retries:
+                    return resp
+                await resp.aclose()
+                delay = self.retry_policy.get_delay(attempt, resp)
+                logger.warning(
+                    f"AI Gateway request for {model} failed with status {resp.status_code}, retrying in {delay:.2f}s."
+                )
+            await asyncio.sleep(delay)
+            attempt += 1
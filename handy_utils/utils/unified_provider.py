@@ -1,41 +1,100 @@
-import json
 import time
+from typing import AsyncIterator
 
-from httpx import AsyncClient, Request, Response
+from httpx import AsyncByteStream, Request, Response
+from openai import AsyncOpenAI
 from pydantic_ai.providers.openai import OpenAIProvider
 
-from handy_utils.utils.ai_gateway import get_ai_gateway_headers, get_base_url
+from handy_utils.utils import json_codec
+from handy_utils.utils.ai_gateway import GatewayHeaderProvider
+from handy_utils.utils.http_client import get_gateway_timeout, get_shared_transport
+from handy_utils.utils.resilience import ResilientAsyncClient
 
+# Headers describing the gateway's encoding of the body, which no longer apply once it has been translated
+STALE_RESPONSE_HEADERS = ("content-length", "content-encoding", "transfer-encoding")
+# Gateway usage keys holding the prompt tokens read from the provider's prompt cache, depending on the provider
+CACHED_TOKENS_USAGE_KEYS = ("cached_tokens", "cached_input_tokens", "cache_read_input_tokens", "cached_content_tokens")
 
-class UnifiedProviderHttpClient(AsyncClient):
+
+class UnifiedStreamTranslator(AsyncByteStream):
+    """Translate a streaming unified gateway response into OpenAI `chat.completion.chunk` server-sent events.
+
+    Events are translated line by line as they arrive, the gateway response body is never buffered.
+    Both SSE (`data: {...}`) and newline-delimited JSON streams are accepted.
+    """
+
+    def __init__(self, client: "UnifiedProviderHttpClient", resp: Response, model: str | None) -> None:
+        self.client = client
+        self.resp = resp
+        self.model = model
+        self.created = int(time.time())
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for line in self.resp.aiter_lines():
+            data = line.removeprefix("data:").strip()
+            if not data or not data.startswith(("{", "[DONE]")):
+                # Blank separators, comments, `event:` and `id:` lines
+                continue
+            if data == "[DONE]":
+                break
+            yield b"data: " + json_codec.dumps(self._prep_chunk(json_codec.loads(data))) + b"\n\n"
+        yield b"data: [DONE]\n\n"
+
+    async def aclose(self) -> None:
+        await self.resp.aclose()
+
+    def _prep_chunk(self, event: dict) -> dict:
+        """Prepare a single gateway event as an OpenAI compatible chunk"""
+        chunk = event.get("response_payload", event)
+        for choice in chunk.get("choices", []):
+            content = choice.get("delta", {}).get("content", None)
+            if content and isinstance(content, list):
+                choice["delta"]["content"] = self.client._process_content(content)
+        chunk = {"object": "chat.completion.chunk", "created": self.created, "model": self.model, **chunk}
+        if "platform_attributes" in event:
+            chunk.update(self.client._process_usage(event["platform_attributes"]))
+        return chunk
+
+
+class UnifiedProviderHttpClient(ResilientAsyncClient):
     """
     Unified AI Gateway HTTP Client,
     refer: https://developer.atlassian.com/platform/ai-gateway/rest/v2/api-group-v-/#api-v2-beta-chat-post
     """
 
     def __init__(self, *args, **kwargs):
-        super().__init__(headers=get_ai_gateway_headers(), base_url=get_base_url(), *args, **kwargs)
+        self.header_provider = GatewayHeaderProvider(
+            extra_headers={
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            }
+        )
+        super().__init__(headers=self.header_provider.get(), base_url=self.header_provider.base_url, *args, **kwargs)
+        self.chat_url = self.header_provider.base_url + "/v2/beta/chat"
         self.model = None
+        self.stream = False
+
+    def _prep_request(self, req: Request, headers: dict[str, str]) -> Request:
+        """Prepare modified request with unified gateway format
 
-    def _prep_request(self, req: Request) -> Request:
-        """Prepare modified request with unified gateway format"""
-        payload = json.loads(req.content)
+        The OpenAI payload is parsed once and the wrapped gateway payload is serialized once, straight to bytes.
+        """
+        payload = json_codec.loads(req.content)
         self.model = payload.pop("model", None)
-        headers = get_ai_gateway_headers() | {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        }
 
         assert self.model is not None, "Model is required"
         self.platform_attrs = {
             "model": self.model,
         }
+        self.stream = payload.get("stream", False)
+        if self.stream:
+            headers = headers | {"Accept": "text/event-stream"}
 
         return Request(
             method=req.method,
-            url=get_base_url() + "/v2/beta/chat",
+            url=self.chat_url,
             headers=headers,
-            json={"request_payload": payload, "platform_attributes": self.platform_attrs},
+            content=json_codec.dumps({"request_payload": payload, "platform_attributes": self.platform_attrs}),
         )
 
     def _process_content(self, content: list) -> str | list:
@@ -47,19 +106,27 @@ class UnifiedProviderHttpClient(AsyncClient):
         return "\n\n".join(c["text"] for c in content)
 
     def _process_usage(self, platform_attrs: dict) -> dict:
-        """Gets usage and returns as an OpenAI response compatible dict"""
+        """Gets usage and returns as an OpenAI response compatible dict
+
+        Prompt tokens read from the provider's prompt cache are reported as `prompt_tokens_details.cached_tokens`.
+        """
         usage_dict = platform_attrs.get("metrics", {}).get("usage", {})
+        cached_tokens = next((usage_dict[key] for key in CACHED_TOKENS_USAGE_KEYS if usage_dict.get(key)), 0)
         return dict(
             usage=dict(
                 total_tokens=usage_dict.get("total_tokens", 0),
                 prompt_tokens=usage_dict.get("input_tokens", 0),
                 completion_tokens=usage_dict.get("output_tokens", 0),
+                prompt_tokens_details=dict(cached_tokens=cached_tokens),
             )
         )
 
-    def _prep_response(self, resp: Response, mod_req: Request) -> Response:
-        """Prepare modified response in OpenAI format"""
-        resp_data = json.loads(resp.content)
+    def _prep_response(self, resp: Response, mod_req: Request, model: str | None) -> Response:
+        """Prepare modified response in OpenAI format
+
+        The gateway payload is parsed once, edited in place and serialized once, straight to bytes.
+        """
+        resp_data = json_codec.loads(resp.content)
         payload = resp_data["response_payload"]
 
         # Process message content for each choice
@@ -68,27 +135,47 @@ class UnifiedProviderHttpClient(AsyncClient):
             if content and isinstance(content, list):
                 choice["message"]["content"] = self._process_content(content)
 
+        headers = resp.headers.copy()
+        for header in STALE_RESPONSE_HEADERS:
+            headers.pop(header, None)
+
+        return Response(
+            status_code=resp.status_code,
+            content=json_codec.dumps(
+                {
+                    "created": int(time.time()),
+                    "model": model,
+                    **payload,
+                    **self._process_usage(resp_data.get("platform_attributes", {})),
+                }
+            ),
+            headers=headers,
+            extensions=resp.extensions,
+            request=mod_req,
+        )
+
+    def _prep_stream_response(self, resp: Response, mod_req: Request, model: str | None) -> Response:
+        """Prepare a streaming response that yields OpenAI chunks as the gateway sends them"""
         return Response(
             status_code=resp.status_code,
-            json={
-                "created": int(time.time()),
-                "model": self.model,
-                **payload,
-                **self._process_usage(resp_data.get("platform_attributes", {})),
-            },
-            headers=resp.headers,
+            headers={"Content-Type": "text/event-stream"},
+            stream=UnifiedStreamTranslator(self, resp, model),
             extensions=resp.extensions,
             request=mod_req,
         )
 
     async def send(self, request: Request, *args, **kwargs) -> Response:
         """Send request through unified gateway and process response"""
-        mod_req = self._prep_request(request)
-        resp = await super().send(mod_req, *args, **kwargs)
-        assert resp.status_code == 200, (
-            f"Unified AI Gateway Error, with status code {resp.status_code}, and content {resp.content!r}"
-        )
-        return self._prep_response(resp, mod_req)
+        mod_req = self._prep_request(request, await self.header_provider.aget())
+        model, streaming = self.model, self.stream
+        resp = await super().send(mod_req, *args, model=model, **(kwargs | {"stream": streaming}))
+        if resp.status_code != 200:
+            # Hand the gateway error back untranslated so the OpenAI client raises its typed status error
+            await resp.aread()
+            return resp
+        if streaming:
+            return self._prep_stream_response(resp, mod_req, model)
+        return self._prep_response(resp, mod_req, model)
 
 
 class UnifiedProvider(OpenAIProvider):
@@ -99,10 +186,11 @@ class UnifiedProvider(OpenAIProvider):
         return "unified"
 
     def __init__(self, *args, **kwargs):
-        super().__init__(
+        # Retries are handled by UnifiedProviderHttpClient
+        openai_client = AsyncOpenAI(
             api_key="NA",
             base_url="NA",
-            http_client=UnifiedProviderHttpClient(timeout=900),
-            *args,
-            **kwargs,
+            max_retries=0,
+            http_client=UnifiedProviderHttpClient(transport=get_shared_transport(), timeout=get_gateway_timeout()),
         )
+        super().__init__(openai_client=openai_client, *args, **kwargs)
@@ -0,0 +1,48 @@
+"""Shared fixtures for handy-utils tests."""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import yaml
+
+from handy_utils.configuration import get_config_path
+from handy_utils.utils.resilience import get_gateway_limiter
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    """Keep tests away from the user's configuration and caches."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def configure(home):
+    """Write a configuration file, rebuilding the shared AI Gateway limiter from it."""
+
+    def write(**values):
+        get_config_path().parent.mkdir(parents=True)
+        get_config_path().write_text(yaml.dump({"openai_api_key": "XXX", **values}))
+        get_gateway_limiter.cache_clear()
+
+    yield write
+    get_gateway_limiter.cache_clear()
+
+
+@pytest.fixture
+def http_server():
+    """Start local HTTP servers for a request handler class and return their base URL."""
+    servers = []
+
+    def start(handler: type[BaseHTTPRequestHandler]) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,134 @@
+"""Tests for the AI Gateway utilities."""
+
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+import pytest
+
+from handy_utils.utils import ai_gateway
+from handy_utils.utils.ai_gateway import GatewayHeaderProvider, SlauthTokenManager, get_token_expiry
+
+FAKE_ATLAS = """#!{python}
+import base64, json, sys, time
+
+with open({calls!r}, "a") as f:
+    f.write(" ".join(sys.argv[1:]) + "\\n")
+time.sleep(0.2)
+claims = base64.urlsafe_b64encode(json.dumps({{"exp": time.time() + 3600}}).encode()).decode().rstrip("=")
+print(f"header.{{claims}}.signature")
+"""
+
+
+def make_jwt(claims: dict) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+@pytest.fixture
+def fake_atlas(tmp_path, monkeypatch):
+    """Put a fake `atlas` executable on the PATH that records every invocation."""
+    calls = tmp_path / "calls.txt"
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    atlas = bin_dir / "atlas"
+    atlas.write_text(FAKE_ATLAS.format(python=sys.executable, calls=str(calls)))
+    atlas.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    calls.touch()
+    return calls
+
+
+def test_get_token_expiry():
+    assert get_token_expiry(make_jwt({"exp": 1700000000})) == 1700000000
+    assert get_token_expiry("not-a-jwt") is None
+    assert get_token_expiry(make_jwt({"sub": "user"})) is None
+
+
+def test_concurrent_requests_share_one_refresh(fake_atlas, tmp_path):
+    manager = SlauthTokenManager(cache_dir=tmp_path / "cache")
+
+    async def request_tokens():
+        return await asyncio.gather(*(manager.get_token() for _ in range(100)))
+
+    tokens = asyncio.run(request_tokens())
+
+    assert len(set(tokens)) == 1
+    assert len(fake_atlas.read_text().splitlines()) == 1
+    assert manager.expires_at == pytest.approx(time.time() + 3600, abs=60)
+
+
+def test_token_is_shared_across_processes_through_disk_cache(fake_atlas, tmp_path):
+    token = SlauthTokenManager(cache_dir=tmp_path / "cache").get_token_sync()
+    other_process_token = asyncio.run(SlauthTokenManager(cache_dir=tmp_path / "cache").get_token())
+
+    assert other_process_token == token
+    assert len(fake_atlas.read_text().splitlines()) == 1
+
+
+def test_token_is_refreshed_in_background_before_expiry(fake_atlas, tmp_path):
+    manager = SlauthTokenManager(cache_dir=tmp_path / "cache")
+    manager.token, manager.expires_at = "old-token", time.time() + 60
+
+    async def request_token():
+        token = await manager.get_token()
+        await asyncio.wrap_future(manager._refresh_future)
+        return token
+
+    assert asyncio.run(request_token()) == "old-token"
+    assert manager.token != "old-token"
+    assert len(fake_atlas.read_text().splitlines()) == 1
+
+
+def test_sync_and_async_callers_share_one_refresh(fake_atlas, tmp_path):
+    manager = SlauthTokenManager(cache_dir=tmp_path / "cache")
+    manager.token, manager.expires_at = "old-token", time.time() + 300
+
+    async def request_token():
+        token = await manager.get_token()
+        await manager.refresh()
+        return token
+
+    assert manager.get_token_sync() == "old-token"
+    assert asyncio.run(request_token()) == "old-token"
+    assert manager.token != "old-token"
+    assert len(fake_atlas.read_text().splitlines()) == 1
+
+
+def test_header_provider_recomputes_only_when_token_rotates(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_gateway, "AUTH_METHOD", "slauth")
+    monkeypatch.setenv("USER", "tester")
+    manager = SlauthTokenManager(cache_dir=tmp_path / "cache")
+    manager.token, manager.expires_at = "first-token", time.time() + 3600
+    monkeypatch.setattr(ai_gateway, "slauth_token_manager", manager)
+
+    provider = GatewayHeaderProvider(extra_headers={"Accept": "application/json"})
+    for _ in range(10):
+        headers = provider.get()
+    assert asyncio.run(provider.aget()) is headers
+    assert headers["Authorization"] == "SLAUTH first-token"
+    assert headers["Accept"] == "application/json"
+    assert (provider.hits, provider.recomputes) == (11, 1)
+
+    manager.token = "second-token"
+    assert provider.get()["Authorization"] == "SLAUTH second-token"
+    assert (provider.hits, provider.recomputes) == (11, 2)
+
+
+def test_header_provider_aget_builds_headers_from_the_awaited_token(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_gateway, "AUTH_METHOD", "slauth")
+    monkeypatch.setenv("USER", "tester")
+    manager = SlauthTokenManager(cache_dir=tmp_path / "cache")
+    manager.token, manager.expires_at = "first-token", time.time() + 3600
+    monkeypatch.setattr(ai_gateway, "slauth_token_manager", manager)
+    provider = GatewayHeaderProvider()
+
+    def get_token_sync():
+        raise AssertionError("aget fetched the token synchronously")
+
+    monkeypatch.setattr(manager, "get_token_sync", get_token_sync)
+    manager.token = "second-token"
+    assert asyncio.run(provider.aget())["Authorization"] == "SLAUTH second-token"
@@ -0,0 +1,113 @@
+"""Tests for the Anthropic AI Gateway clients."""
+
+import asyncio
+import copy
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from anthropic._models import FinalRequestOptions
+
+from handy_utils.utils import ai_gateway
+from handy_utils.utils.anthropic_provider import AsyncAnthropicVertexAIGateway
+
+LONG_TEXT = "lorem ipsum " * 500
+
+
+@pytest.fixture
+def vertex_gateway(http_server, monkeypatch):
+    """Local Vertex AI gateway that records request bodies and reports prompt cache usage."""
+    requests = []
+
+    class VertexGateway(BaseHTTPRequestHandler):
+        def do_POST(self):
+            requests.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            body = json.dumps(
+                {
+                    "id": "msg_1",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": "claude",
+                    "content": [{"type": "text", "text": "ok"}],
+                    "stop_reason": "end_turn",
+                    "usage": {
+                        "input_tokens": 10,
+                        "output_tokens": 2,
+                        "cache_creation_input_tokens": 1500,
+                        "cache_read_input_tokens": 3000,
+                    },
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    monkeypatch.setattr(ai_gateway, "MESH_DEPENDENCY_AI_GATEWAY_BASE_URL", http_server(VertexGateway))
+    return requests
+
+
+def cached_blocks(body: dict) -> list[str]:
+    """List the sections and message indexes carrying a cache breakpoint."""
+    blocks = [f"tools[{i}]" for i, tool in enumerate(body.get("tools", [])) if "cache_control" in tool]
+    blocks += [f"system[{i}]" for i, block in enumerate(body.get("system", [])) if "cache_control" in block]
+    for i, message in enumerate(body["messages"]):
+        blocks += [f"messages[{i}]" for block in message["content"] if "cache_control" in block]
+    return blocks
+
+
+def create_message(messages: list[dict], **kwargs) -> AsyncAnthropicVertexAIGateway:
+    client = AsyncAnthropicVertexAIGateway(prompt_caching_strategy="auto")
+    asyncio.run(client.messages.create(model="claude", max_tokens=10, messages=messages, **kwargs))
+    return client
+
+
+def test_auto_caches_stable_prefix_but_not_one_shot_prompt(vertex_gateway):
+    tools = [{"name": "search", "description": "Search the docs", "input_schema": {"type": "object"}}]
+    create_message([{"role": "user", "content": LONG_TEXT}], system=LONG_TEXT, tools=tools)
+
+    # Tools alone are too short to be cached, the system prompt ends the stable prefix
+    assert cached_blocks(vertex_gateway[0]) == ["system[0]"]
+
+
+def test_auto_caches_latest_turns_of_a_conversation(vertex_gateway):
+    messages = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": LONG_TEXT if i % 3 == 0 else "short"}
+        for i in range(9)
+    ]
+    create_message(messages, system="You are helpful.")
+
+    assert cached_blocks(vertex_gateway[0]) == ["messages[2]", "messages[5]", "messages[8]"]
+
+
+def test_prompt_cache_usage_is_reported(vertex_gateway):
+    client = create_message([{"role": "user", "content": "hi"}])
+
+    assert client.prompt_cache_usage.calls == 1
+    assert client.prompt_cache_usage.cache_read_input_tokens == 3000
+    assert client.prompt_cache_usage.cache_creation_input_tokens == 1500
+
+
+def test_prepare_options_does_not_mutate_the_callers_messages(vertex_gateway):
+    client = AsyncAnthropicVertexAIGateway(prompt_caching_strategy="last_4")
+    messages = [
+        {"role": "user", "content": "question"},
+        {"role": "assistant", "content": [{"type": "text", "text": "answer"}]},
+        {"role": "user", "content": [{"type": "text", "text": "follow up"}]},
+    ]
+    options = FinalRequestOptions.construct(
+        method="post",
+        url="/v1/messages",
+        json_data={"model": "claude", "max_tokens": 10, "messages": messages},
+    )
+    original = copy.deepcopy(options.json_data)
+
+    prepared = asyncio.run(client._prepare_options(options.model_copy()))
+
+    assert options.json_data == original
+    assert prepared.json_data["messages"][0]["content"] == [
+        {"type": "text", "text": "question", "cache_control": {"type": "ephemeral"}}
+    ]
+    assert prepared.json_data["messages"][1] is messages[1]
+    assert "model" not in prepared.json_data and "stream" not in prepared.json_data
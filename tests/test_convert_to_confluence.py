@@ -0,0 +1,422 @@
+"""Tests for converting and publishing notebooks to Confluence."""
+
+import asyncio
+import base64
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import nbformat
+import pytest
+from click.testing import CliRunner
+
+from handy_utils.cli import main
+from handy_utils.configuration import get_cache_dir
+from handy_utils.convert_to_confluence import notebook_reader
+from handy_utils.convert_to_confluence.confluence_client import ConfluenceClient
+from handy_utils.convert_to_confluence.convert_to_confluence import (
+    ConfluenceHTMLExporter,
+    get_exporter,
+    render_notebook,
+)
+from handy_utils.convert_to_confluence.notebook_reader import NotebookReader
+from handy_utils.convert_to_confluence.preprocessors import NbTagPreprocessor, get_attachment_name
+from handy_utils.convert_to_confluence.publish import find_notebooks, publish_notebooks
+
+
+def write_notebook(path: Path, title: str, code: str = "print('hi')") -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [
+        nbformat.v4.new_markdown_cell(f"# {title}\n\nSome **bold** text."),
+        nbformat.v4.new_code_cell(code, outputs=[nbformat.v4.new_output("stream", text="hi\n")]),
+        nbformat.v4.new_code_cell("#|nb_tag: skip\nsecret = 42"),
+    ]
+    nbformat.write(nb, path)
+    return path
+
+
+class FakeConfluence:
+    """In-memory Confluence serving the REST API used to publish pages, with listings `list_limit` results long."""
+
+    def __init__(self, list_limit: int = 2, delay: float = 0.0) -> None:
+        self.list_limit = list_limit
+        self.delay = delay
+        self.pages: dict[str, dict] = {}
+        self.attachments: dict[str, list[str]] = {}
+        # Method, path and query of every request
+        self.requests: list[tuple[str, str, dict]] = []
+        # Statuses to reply with instead of handling the next requests
+        self.failures: list[int] = []
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def add_page(self, title: str, space_key: str = "DOC", version: int = 1, body: str = "") -> str:
+        page_id = str(100 + len(self.pages))
+        self.pages[page_id] = {"id": page_id, "title": title, "space": space_key, "version": version, "body": body}
+        self.attachments[page_id] = []
+        return page_id
+
+    def get_content(self, page_id: str) -> dict:
+        page = self.pages[page_id]
+        return {"id": page_id, "type": "page", "title": page["title"], "version": {"number": page["version"]}}
+
+    def get_listing(self, path: str, query: dict, results: list) -> dict:
+        start = int(query.get("start", 0))
+        limit = min(int(query.get("limit", 25)), self.list_limit)
+        links = {"context": "/wiki"}
+        if start + limit < len(results):
+            links["next"] = path.removeprefix("/wiki") + "?" + urlencode({**query, "start": start + limit})
+        return {"results": results[start : start + limit], "_links": links}
+
+    def handle(self, method: str, path: str, query: dict, body: bytes, headers) -> tuple[int, dict]:
+        if self.failures:
+            return self.failures.pop(0), {}
+        parts = path.removeprefix("/wiki/rest/api/content").strip("/").split("/")
+        if parts == [""] and method == "GET":
+            pages = [
+                self.get_content(page_id)
+                for page_id, page in self.pages.items()
+                if page["space"] == query["spaceKey"] and query.get("title", page["title"]) == page["title"]
+            ]
+            return 200, self.get_listing(path, query, pages)
+        if parts == [""] and method == "POST":
+            data = json.loads(body)
+            page_id = self.add_page(data["title"], data["space"]["key"], body=data["body"]["storage"]["value"])
+            return 200, self.get_content(page_id)
+        page_id = parts[0]
+        if page_id not in self.pages:
+            return 404, {}
+        if len(parts) == 1 and method == "GET":
+            return 200, self.get_content(page_id)
+        if len(parts) == 1 and method == "PUT":
+            data = json.loads(body)
+            page = self.pages[page_id]
+            if data["version"]["number"] != page["version"] + 1:
+                return 409, {}
+            page.update(title=data["title"], version=data["version"]["number"], body=data["body"]["storage"]["value"])
+            return 200, self.get_content(page_id)
+        if parts[1:] == ["child", "attachment"] and method == "GET":
+            return 200, self.get_listing(path, query, [{"title": name} for name in self.attachments[page_id]])
+        if parts[1:] == ["child", "attachment"] and method == "POST":
+            assert headers["X-Atlassian-Token"] == "no-check"
+            self.attachments[page_id].append(re.search(rb'filename="(.+?)"', body)[1].decode())
+            return 200, {"results": []}
+        return 404, {}
+
+    def get_handler(self) -> type[BaseHTTPRequestHandler]:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.reply()
+
+            do_POST = do_PUT = do_GET
+
+            def reply(self):
+                url = urlsplit(self.path)
+                query = dict(parse_qsl(url.query))
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with fake.lock:
+                    fake.requests.append((self.command, url.path, query))
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                time.sleep(fake.delay)
+                with fake.lock:
+                    fake.in_flight -= 1
+                    status, data = fake.handle(self.command, url.path, query, body, self.headers)
+                content = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        return Handler
+
+
+@pytest.fixture
+def confluence(configure, http_server):
+    """Start a fake Confluence and point the configuration at its DOC space."""
+
+    def start(list_limit: int = 2, delay: float = 0.0, **values) -> FakeConfluence:
+        fake = FakeConfluence(list_limit, delay)
+        url = http_server(fake.get_handler())
+        configure(confluence_domain=url, confluence_space_key="DOC", confluence_requests_per_second=0, **values)
+        return fake
+
+    return start
+
+
+def test_nb_tags_remove_cells_inputs_and_outputs_in_one_pass():
+    image = nbformat.v4.new_output("display_data", data={"image/png": "iVBORw0KGgo" * 1000})
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [
+        nbformat.v4.new_markdown_cell("#|nb_tag: skip\n# Hidden title"),
+        nbformat.v4.new_markdown_cell("# The *Title*\n\ntext"),
+        nbformat.v4.new_code_cell("#|nb_tag: remove_output\nplot()", outputs=[image]),
+        nbformat.v4.new_code_cell("#|nb_tag: remove_input\n\nshow()", metadata={"tags": ["remove_input"]}),
+        nbformat.v4.new_code_cell("#|nb_tag: remove_cell\nplot()", outputs=[image]),
+    ]
+    preprocessor = NbTagPreprocessor(
+        enabled=True,
+        remove_cell_tags={"skip", "remove_cell"},
+        remove_all_outputs_tags={"remove_output"},
+        remove_input_tags={"remove_input"},
+    )
+
+    nb, resources = preprocessor(nb, {})
+
+    # The page name comes from the first markdown cell, even a removed one
+    assert resources["page_name"] == "Hidden title"
+    assert [cell.source for cell in nb.cells] == ["# The *Title*\n\ntext", "plot()", "show()"]
+    assert nb.cells[1].outputs == [] and nb.cells[1].metadata.tags == ["remove_output"]
+    assert nb.cells[2].metadata.tags == ["remove_input"]
+    assert nb.cells[2].metadata.transient == {"remove_source": True}
+
+
+def test_notebook_reader_reads_cells_incrementally_and_skips_removed_outputs(tmp_path, monkeypatch):
+    nb = nbformat.v4.new_notebook(metadata={"language_info": {"name": "python"}})
+    nb.cells = [
+        nbformat.v4.new_markdown_cell('# Title with "quotes", \\ and ]}'),
+        nbformat.v4.new_code_cell("x = [1, {2: 3}]", outputs=[nbformat.v4.new_output("stream", text="a\nb\n")]),
+        nbformat.v4.new_code_cell(
+            "#|nb_tag: skip\nplot()",
+            outputs=[nbformat.v4.new_output("display_data", data={"image/png": "REMOVED" * 1000})],
+        ),
+    ]
+    nbformat.write(nb, tmp_path / "notebook.ipynb")
+    decoded = []
+    loads = notebook_reader.json_codec.loads
+    monkeypatch.setattr(notebook_reader.json_codec, "loads", lambda data: decoded.append(data) or loads(data))
+
+    reader = NotebookReader(tmp_path / "notebook.ipynb", chunk_size=16)
+    assert list(reader) == nbformat.read(tmp_path / "notebook.ipynb", as_version=4).cells
+    assert reader.notebook["metadata"] == nb.metadata
+
+    decoded.clear()
+    nb_tags = NbTagPreprocessor(remove_cell_tags={"skip"})
+    cells = list(NotebookReader(tmp_path / "notebook.ipynb", skip_outputs=nb_tags.removes_outputs, chunk_size=16))
+    assert cells[1].outputs[0].text == "a\nb\n" and cells[2].outputs == []
+    assert not any("REMOVED" in data for data in decoded)
+
+
+def test_notebooks_are_rendered_in_batches_to_the_same_output(tmp_path):
+    notebook_path = write_notebook(tmp_path / "notebook.ipynb", "Title")
+    nb = nbformat.read(notebook_path, as_version=4)
+    nb.cells.extend(nbformat.v4.new_markdown_cell(f"## Section {i}\n\n*text*") for i in range(20))
+    nbformat.write(nb, notebook_path)
+    expected, _ = get_exporter().from_notebook_node(nbformat.read(notebook_path, as_version=4))
+
+    for batch_size in (1, 300, 2**22):
+        output_path, page_name = render_notebook(notebook_path, tmp_path / "notebook.html", batch_size)
+        assert output_path.read_text() == expected
+        assert page_name == "Title"
+
+
+def test_find_notebooks_expands_directories_and_globs(tmp_path):
+    docs = tmp_path / "docs"
+    first = write_notebook(docs / "a.ipynb", "A")
+    second = write_notebook(docs / "guides" / "b.ipynb", "B")
+    write_notebook(docs / ".ipynb_checkpoints" / "a-checkpoint.ipynb", "A")
+    other = write_notebook(tmp_path / "other" / "c.ipynb", "C")
+
+    assert find_notebooks([str(docs)]) == [first, second]
+    assert find_notebooks([str(tmp_path / "**" / "c.ipynb"), str(first), str(docs)]) == [other, first, second]
+
+
+def test_images_of_execute_results_are_referenced(tmp_path):
+    image = b"returned figure"
+    name = get_attachment_name(image, "image/png")
+    nb = nbformat.v4.new_notebook()
+    result = nbformat.v4.new_output("execute_result", data={"image/png": base64.b64encode(image).decode()})
+    nb.cells = [nbformat.v4.new_markdown_cell("# Figure"), nbformat.v4.new_code_cell("figure", outputs=[result])]
+    nbformat.write(nb, tmp_path / "figure.ipynb")
+
+    output_path, _ = render_notebook(tmp_path / "figure.ipynb", tmp_path / "figure.html")
+
+    assert f'<ri:attachment ri:filename="{name}">' in output_path.read_text()
+    assert [path.name for path in (tmp_path / "figure_files").iterdir()] == [name]
+
+
+def test_notebooks_with_the_same_name_get_their_own_output(tmp_path):
+    first = write_notebook(tmp_path / "docs" / "a" / "index.ipynb", "First")
+    second = write_notebook(tmp_path / "docs" / "b" / "index.ipynb", "Second")
+
+    results = publish_notebooks([str(first), str(second)], tmp_path / "out", dry_run=True, max_workers=2)
+
+    out = tmp_path / "out"
+    assert [result.output_path for result in results] == [out / "a" / "index.html", out / "b" / "index.html"]
+    assert "First" in results[0].output_path.read_text() and "Second" in results[1].output_path.read_text()
+
+
+def test_notebooks_are_converted_in_parallel_and_uploaded_under_limit(confluence, tmp_path):
+    fake = confluence(delay=0.05, confluence_max_concurrent_uploads=2)
+    existing_id = fake.add_page("Notebook 1", version=3)
+    fake.add_page("Notebook 1", space_key="OTHER")
+    for i in range(6):
+        fake.add_page(f"Unrelated {i}")
+        write_notebook(tmp_path / "docs" / f"notebook_{i}.ipynb", f"Notebook {i}")
+
+    results = publish_notebooks([str(tmp_path / "docs")], tmp_path / "out", max_workers=2)
+
+    page_ids = [result.url.rsplit("/", 1)[-1] for result in results]
+    assert [fake.pages[page_id]["title"] for page_id in page_ids] == [f"Notebook {i}" for i in range(6)]
+    assert page_ids[1] == existing_id and fake.pages[existing_id]["version"] == 4
+    assert [result.output_path for result in results] == [tmp_path / "out" / f"notebook_{i}.html" for i in range(6)]
+    assert fake.max_in_flight == 2
+    body = fake.pages[page_ids[0]]["body"]
+    assert "<strong>bold</strong>" in body and "print('hi')" in body
+    assert "secret" not in body
+    # The space is listed once rather than each page looked up by title
+    lookups = [query for method, path, query in fake.requests if method == "GET" and path == "/wiki/rest/api/content"]
+    assert sum("start" not in query for query in lookups) == 1 and not any("title" in query for query in lookups)
+
+
+def test_unchanged_notebooks_are_not_converted_or_uploaded_again(confluence, tmp_path):
+    fake = confluence()
+    notebooks = [write_notebook(tmp_path / "docs" / f"notebook_{i}.ipynb", f"Notebook {i}") for i in range(3)]
+    docs = str(tmp_path / "docs")
+
+    results = publish_notebooks([docs], max_workers=2)
+    assert {result.status for result in results} == {"published"}
+    assert sorted(page["title"] for page in fake.pages.values()) == ["Notebook 0", "Notebook 1", "Notebook 2"]
+    page_ids = [result.url.rsplit("/", 1)[-1] for result in results]
+
+    fake.requests.clear()
+    results = publish_notebooks([docs], max_workers=2)
+    assert [result.status for result in results] == ["unchanged"] * 3
+    assert all(result.output_path is None for result in results)
+    assert fake.requests == []
+
+    # Changing only the source of a removed cell re-renders the notebook to the same body
+    nb = nbformat.read(notebooks[0], as_version=4)
+    nb.cells[2].source = "#|nb_tag: skip\nsecret = 43"
+    nbformat.write(nb, notebooks[0])
+    nb = nbformat.read(notebooks[1], as_version=4)
+    nb.cells[0].source += " Edited."
+    nbformat.write(nb, notebooks[1])
+
+    results = publish_notebooks([docs], max_workers=2)
+    assert [result.status for result in results] == ["up to date", "published", "unchanged"]
+    # The known page is updated without being looked up by title
+    page_url = f"/wiki/rest/api/content/{page_ids[1]}"
+    assert [(method, path) for method, path, _ in fake.requests] == [("GET", page_url), ("PUT", page_url)]
+    assert fake.pages[page_ids[1]]["version"] == 2
+
+
+def test_cli_skips_an_unchanged_single_notebook_written_to_an_output_file(confluence, tmp_path):
+    fake = confluence()
+    notebook = str(write_notebook(tmp_path / "notebook.ipynb", "Notebook"))
+    output_path = tmp_path / "out" / "page.html"
+    args = ["nb2conf", notebook, "--output-path", str(output_path)]
+
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0, result.output
+    assert f"{notebook}: published" in result.output
+    assert "<strong>bold</strong>" in output_path.read_text()
+    assert [page["title"] for page in fake.pages.values()] == ["Notebook"]
+
+    fake.requests.clear()
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0, result.output
+    assert f"{notebook}: unchanged" in result.output
+    assert fake.requests == []
+
+
+def test_compiled_templates_are_cached_on_disk(home):
+    get_exporter.cache_clear()
+    stale_dir = get_cache_dir() / "nbconvert_templates" / "stale"
+    stale_dir.mkdir(parents=True)
+    nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_markdown_cell("# Title")])
+    get_exporter().from_notebook_node(nb)
+
+    [cache_dir] = (get_cache_dir() / "nbconvert_templates").iterdir()
+    cached_templates = sorted(path.name for path in cache_dir.iterdir())
+    assert cache_dir.name != "stale" and cached_templates
+
+    # A new exporter loads the compiled templates rather than compiling them again
+    exporter = ConfluenceHTMLExporter(config=get_exporter().config)
+    body, _ = exporter.from_notebook_node(nb)
+    assert "<h1>Title</h1>" in body
+    assert sorted(path.name for path in cache_dir.iterdir()) == cached_templates
+
+
+def test_images_are_uploaded_once_as_attachments(confluence, tmp_path):
+    images = [f"image {i}".encode() for i in range(4)]
+    names = [get_attachment_name(image, "image/png") for image in images]
+    fake = confluence(list_limit=1, delay=0.05, confluence_max_concurrent_uploads=2)
+    page_id = fake.add_page("Plots")
+    # The first image is already attached to the page, on the second page of the listing
+    fake.attachments[page_id] = ["other.png", names[0]]
+
+    def image_output(image: bytes):
+        return nbformat.v4.new_output("display_data", data={"image/png": base64.b64encode(image).decode()})
+
+    nb = nbformat.v4.new_notebook()
+    markdown = nbformat.v4.new_markdown_cell(
+        f"# Plots\n\n![a](attachment:a.png) ![b](data:image/png;base64,{base64.b64encode(images[3]).decode()})"
+    )
+    markdown.attachments = {"a.png": {"image/png": base64.b64encode(images[2]).decode()}}
+    nb.cells = [
+        markdown,
+        nbformat.v4.new_code_cell("plot()", outputs=[image_output(images[0]), image_output(images[1])]),
+        nbformat.v4.new_code_cell("plot()", outputs=[image_output(images[1])]),
+    ]
+    nbformat.write(nb, tmp_path / "plots.ipynb")
+
+    [result] = publish_notebooks([str(tmp_path / "plots.ipynb")], tmp_path / "out")
+
+    assert result.status == "published"
+    body = result.output_path.read_text()
+    assert "base64" not in body
+    for name in names:
+        assert f'<ri:attachment ri:filename="{name}">' in body
+    assert sorted(fake.attachments[page_id][2:]) == sorted(names[1:])
+    assert fake.max_in_flight == 2
+
+
+def test_confluence_client_caches_page_ids_per_space(confluence):
+    fake = confluence(list_limit=2)
+    page_ids = [fake.add_page(f"Page {i}", version=i + 1) for i in range(5)]
+    other_id = fake.add_page("Page 0", space_key="OTHER")
+
+    async def publish():
+        async with ConfluenceClient() as client:
+            ids = await client.upload_pages([("<p>0</p>", "Page 0", None), ("<p>4</p>", "Page 4", None)])
+            ids.append(await client.upload_page("<p>new</p>", "New page"))
+            listing = list(fake.requests)
+
+            # Cached versions are used without looking the pages up again
+            fake.requests.clear()
+            await client.upload_page("<p>0 again</p>", "Page 0")
+            assert [method for method, _, _ in fake.requests] == ["PUT"]
+
+            # A page edited since its version was cached is updated once its version is read again
+            fake.pages[page_ids[4]]["version"] += 1
+            fake.failures.append(429)
+            ids.append(await client.upload_page("<p>4 again</p>", "Page 4"))
+
+            # Other spaces have their own cache
+            ids.append(await client.upload_page("<p>other</p>", "Page 0", space_key="OTHER"))
+        return ids, listing
+
+    ids, listing = asyncio.run(publish())
+
+    assert ids == [page_ids[0], page_ids[4], ids[2], page_ids[4], other_id]
+    # A single listing of the space, in pages, instead of a lookup by title for each page
+    assert sorted((method, query.get("start", "0")) for method, _, query in listing) == [
+        ("GET", "0"),
+        ("GET", "2"),
+        ("GET", "4"),
+        ("POST", "0"),
+        ("PUT", "0"),
+        ("PUT", "0"),
+    ]
+    assert [fake.pages[page_id]["version"] for page_id in (page_ids[0], page_ids[4], ids[2], other_id)] == [3, 8, 1, 2]
+    assert fake.pages[page_ids[4]]["body"] == "<p>4 again</p>" and fake.pages[other_id]["body"] == "<p>other</p>"
@@ -0,0 +1,267 @@
+"""Tests for commit message generation."""
+
+import asyncio
+import json
+import subprocess
+
+from click.testing import CliRunner
+from pydantic_ai.messages import ModelMessage, ModelResponse, TextPart, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+from pydantic_ai.usage import Usage
+
+from handy_utils.cli import main
+from handy_utils.generate_commit import generate_commit, large_diff
+from handy_utils.generate_commit.commit_cache import get_commit_message_cache
+from handy_utils.generate_commit.diff_reader import FileRecord, read_staged_changes
+from handy_utils.generate_commit.large_diff import is_generated, split_hunks
+from handy_utils.generate_commit.prompts import SYSTEM_PROMPT
+
+
+def file_record(path: str, hunks: int, lines_per_hunk: int = 10) -> FileRecord:
+    diff = f"diff --git a/{path} b/{path}\nindex 1111111..2222222 100644\n--- a/{path}\n+++ b/{path}\n"
+    for hunk in range(hunks):
+        diff += f"@@ -{hunk * 100},0 +{hunk * 100},{lines_per_hunk} @@\n"
+        diff += "".join(f"+line {hunk}-{line} of {path}\n" for line in range(lines_per_hunk))
+    return FileRecord(path, "M", added=hunks * lines_per_hunk, removed=0, hunks=diff)
+
+
+def git(repo, *args: str) -> None:
+    subprocess.run(["git", "-C", str(repo), "-c", "user.name=a", "-c", "user.email=a@b.c", *args], check=True)
+
+
+def test_staged_changes_are_read_per_file(tmp_path):
+    repo = tmp_path / "repo"
+    git(tmp_path, "init", "-q", str(repo))
+    (repo / "old.py").write_text("".join(f"line {i}\n" for i in range(20)))
+    (repo / "removed.txt").write_text("bye\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-q", "-m", "init")
+    git(repo, "mv", "old.py", "new.py")
+    git(repo, "rm", "-q", "removed.txt")
+    (repo / "image.png").write_bytes(bytes(range(256)) * 4)
+    (repo / "big.txt").write_text("".join(f"big line {i}\n" for i in range(1000)))
+    git(repo, "add", ".")
+
+    records = {record.path: record for record in read_staged_changes(repo, max_file_bytes=1000)}
+
+    assert {path: (r.status, r.added, r.removed) for path, r in records.items()} == {
+        "big.txt": ("A", 1000, 0),
+        "image.png": ("A", None, None),
+        "new.py": ("R", 0, 0),
+        "removed.txt": ("D", 0, 1),
+    }
+    assert records["new.py"].old_path == "old.py"
+    assert "rename from old.py" in records["new.py"].hunks
+    assert records["image.png"].is_binary and not records["image.png"].hunks
+    assert records["big.txt"].truncated
+    assert len(records["big.txt"].hunks) <= 1000 and records["big.txt"].hunks.endswith("\n")
+
+
+def test_large_files_are_split_per_hunk_and_lock_files_left_out():
+    record = file_record("src/app.py", hunks=3)
+
+    assert not is_generated(record) and is_generated(file_record("uv.lock", hunks=1))
+    parts = split_hunks(record, max_chars=400)
+    assert len(parts) == 3
+    assert all(part.startswith("diff --git a/src/app.py b/src/app.py\n") for part in parts)
+
+
+def test_large_diff_is_summarized_concurrently_then_reduced(configure, monkeypatch):
+    configure(commit_token_budget=1_000, commit_chunk_tokens=500, commit_max_chunks=6, commit_max_concurrency=3)
+    records = [file_record(f"src/module_{i}.py", hunks=4) for i in range(10)] + [file_record("uv.lock", 1, 5000)]
+    stats = {"calls": 0, "in_flight": 0, "max_in_flight": 0}
+    reduce_prompts = []
+
+    async def summarize(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        stats["calls"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        await asyncio.sleep(0.01)
+        stats["in_flight"] -= 1
+        return ModelResponse(parts=[TextPart("- summary of a chunk")])
+
+    def reduce(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        reduce_prompts.append(messages[0].parts[-1].content)
+        args = {"type": "refactor", "description": "split modules"}
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+    monkeypatch.setattr(large_diff, "get_summary_model", lambda: FunctionModel(summarize))
+    monkeypatch.setattr(generate_commit, "get_model", lambda: FunctionModel(reduce))
+
+    message = asyncio.run(generate_commit.agenerate_commit_message(iter(records), jira_ticket="ABC-1"))
+
+    assert str(message).startswith("refactor(ABC-1): split modules")
+    assert stats["calls"] == 6
+    assert stats["max_in_flight"] == 3
+    assert reduce_prompts[0].count("- summary of a chunk") == 6
+    # Chunks over the limit and lock files are described from their stats
+    assert "- uv.lock: generated or lock file changed (+5000 -0)" in reduce_prompts[0]
+    assert "- src/module_9.py: file changed (+40 -0)" in reduce_prompts[0]
+    assert "+line" not in reduce_prompts[0]
+
+
+def test_commit_messages_are_memoized_on_the_staged_tree(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    git(tmp_path, "init", "-q", str(repo))
+    (repo / "app.py").write_text("print('hello')\n")
+    git(repo, "add", ".")
+    monkeypatch.chdir(repo)
+    get_commit_message_cache.cache_clear()
+    calls = []
+
+    def generate(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        calls.append(messages)
+        args = {"type": "feat", "description": f"say hello, take {len(calls)}"}
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+    monkeypatch.setattr(generate_commit, "get_model", lambda: FunctionModel(generate))
+
+    first = generate_commit.generate_llm_commit_message("ABC-1")
+    assert generate_commit.generate_llm_commit_message("ABC-1") == first
+    assert len(calls) == 1
+
+    assert generate_commit.generate_llm_commit_message("ABC-2") != first
+    assert generate_commit.generate_llm_commit_message("ABC-1", use_cache=False) != first
+    (repo / "app.py").write_text("print('bye')\n")
+    git(repo, "add", ".")
+    assert generate_commit.generate_llm_commit_message("ABC-1") != first
+    assert len(calls) == 4
+
+
+def test_batch_generates_messages_for_a_commit_range(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    git(tmp_path, "init", "-q", str(repo))
+    for name in ["first", "second", "third", "fourth"]:
+        (repo / f"{name}.py").write_text(f"print('{name}')\n")
+        git(repo, "add", ".")
+        git(repo, "commit", "-q", "-m", name)
+    stats = {"in_flight": 0, "max_in_flight": 0}
+
+    async def generate(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        await asyncio.sleep(0.01)
+        stats["in_flight"] -= 1
+        path = messages[0].parts[-1].content.split("+++ b/")[1].split("\n")[0]
+        args = {"type": "feat", "description": f"add {path}"}
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+    monkeypatch.setattr(generate_commit, "get_model", lambda: FunctionModel(generate))
+    output = tmp_path / "messages.jsonl"
+
+    result = CliRunner().invoke(
+        main, ["generate-commit-batch", str(repo), "--rev-range", "HEAD~3..HEAD", "-c", "2", "-o", str(output)]
+    )
+
+    assert result.exit_code == 0, result.output
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(result["message"].split("\n")[0] for result in results) == [
+        "feat: add fourth.py",
+        "feat: add second.py",
+        "feat: add third.py",
+    ]
+    assert all(result["latency"] > 0 and len(result["rev"]) == 40 for result in results)
+    assert stats["max_in_flight"] == 2
+
+
+def speculative_model(responses: list[tuple[float, dict]], finished: list[str]) -> FunctionModel:
+    """Model answering the n-th request with the n-th (delay, output) pair, recording the finished ones."""
+    calls = iter(responses)
+
+    async def generate(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        delay, args = next(calls)
+        await asyncio.sleep(delay)
+        finished.append(args["description"])
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+    return FunctionModel(generate)
+
+
+def test_first_valid_candidate_is_repaired_and_others_cancelled(monkeypatch):
+    finished = []
+    model = speculative_model(
+        [
+            (0.5, {"type": "feat", "description": "slow but valid"}),
+            (0.01, {"type": "Feature", "description": "fast " * 30, "body": "multi\nline"}),
+            (0.5, {"type": "fix", "description": "also slow"}),
+        ],
+        finished,
+    )
+    monkeypatch.setattr(generate_commit, "get_model", lambda: model)
+
+    message = asyncio.run(generate_commit.agenerate_commit_message([file_record("app.py", 1)], candidates=3))
+
+    assert message.type == "feat" and message.body == "multi line"
+    assert len(message.description) <= 100 and message.description.startswith("fast fast")
+    assert finished == ["fast " * 30]
+
+
+def test_invalid_candidates_are_skipped_without_repair(monkeypatch):
+    finished = []
+    model = speculative_model(
+        [
+            (0.01, {"type": "feature", "description": "invalid type"}),
+            (0.05, {"type": "fix", "description": "valid"}),
+        ],
+        finished,
+    )
+    monkeypatch.setattr(generate_commit, "get_model", lambda: model)
+
+    message = asyncio.run(
+        generate_commit.agenerate_commit_message([file_record("app.py", 1)], candidates=2, repair=False)
+    )
+
+    assert (message.type, message.description) == ("fix", "valid")
+    assert finished == ["invalid type", "valid"]
+
+
+def test_candidates_are_prompted_with_the_changes_and_counted_in_usage(monkeypatch):
+    prompts = []
+
+    def generate(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        prompts.append(messages[0].parts[-1].content)
+        args = {"type": "feat", "description": "add app"}
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+    monkeypatch.setattr(generate_commit, "get_model", lambda: FunctionModel(generate))
+    usage = Usage()
+
+    asyncio.run(
+        generate_commit.agenerate_commit_message(
+            [file_record("app.py", 1)], additional_message="be brief", candidates=2, usage=usage
+        )
+    )
+
+    assert prompts and all("+line 0-0 of app.py" in prompt and "be brief" in prompt for prompt in prompts)
+    assert usage.requests == len(prompts)
+
+
+def test_static_instructions_come_before_the_changes_and_cached_tokens_are_reported(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    git(tmp_path, "init", "-q", str(repo))
+    monkeypatch.chdir(repo)
+    get_commit_message_cache.cache_clear()
+    requests = []
+
+    def generate(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        requests.append(messages[0])
+        args = {"type": "feat", "description": "add app"}
+        usage = Usage(requests=1, request_tokens=2000, response_tokens=10, details={"cached_tokens": 1500})
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)], usage=usage)
+
+    monkeypatch.setattr(generate_commit, "get_model", lambda: FunctionModel(generate))
+    runner = CliRunner()
+    for content in ["first", "second"]:
+        (repo / "app.py").write_text(f"print('{content}')\n")
+        git(repo, "add", ".")
+        result = runner.invoke(main, ["generate-commit", "--dry-run", "-m", "be brief"])
+        assert result.exit_code == 0, result.output
+        assert "prompt tokens: 2000 (1500 cached, 75%)" in result.output
+
+    assert requests[0].instructions == requests[1].instructions == SYSTEM_PROMPT.strip()
+    assert "print('first')" in requests[0].parts[-1].content
+    assert requests[0].parts[-1].content.rstrip().endswith("be brief\n</additional_message>")
+
+    result = runner.invoke(main, ["generate-commit", "--dry-run", "-m", "be brief"])
+    assert "Served from the commit message cache" in result.output
+    assert len(requests) == 2
@@ -0,0 +1,34 @@
+"""Tests for converting HTML to Atlassian Storage Format."""
+
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+from handy_utils.convert_to_confluence.html_to_asf import convert_html_str_to_asf, etree, html_to_asf
+
+GOLDEN_DIR = Path(__file__).parent / "golden" / "html_to_asf"
+GOLDEN_FILES = sorted(GOLDEN_DIR.glob("*.html"))
+
+
+@pytest.mark.parametrize("html_path", GOLDEN_FILES, ids=lambda path: path.stem)
+def test_conversion_matches_golden_output(html_path):
+    html = html_path.read_text()
+    expected = html_path.with_suffix(".asf").read_text()
+
+    assert convert_html_str_to_asf(html) == expected
+    assert html_to_asf(BeautifulSoup(html, "html.parser")) == expected
+
+
+@pytest.mark.skipif(etree is None, reason="lxml is not installed")
+def test_lxml_conversion_matches_golden_output_for_well_formed_html():
+    html_path = GOLDEN_DIR / "dataframe.html"
+
+    assert convert_html_str_to_asf(html_path.read_text(), parser="lxml") == html_path.with_suffix(".asf").read_text()
+
+
+def test_deeply_nested_html_does_not_recurse():
+    depth = 5000
+    html = "<div>" * depth + "<b>deep</b>" + "</div>" * depth
+
+    assert convert_html_str_to_asf(html) == "<strong>deep</strong>"
@@ -0,0 +1,77 @@
+"""Tests for the shared AI Gateway HTTP transport."""
+
+import asyncio
+import json
+from http.server import BaseHTTPRequestHandler
+
+from httpx import AsyncClient
+
+from handy_utils.utils import ai_gateway
+from handy_utils.utils.anthropic_provider import AnthropicAIGatewayBedrockProvider, AnthropicAIGatewayProvider
+from handy_utils.utils.http_client import get_gateway_timeout, get_shared_transport
+from handy_utils.utils.unified_provider import UnifiedProvider
+
+
+def test_gateway_clients_share_one_pool(http_server, monkeypatch):
+    class Ok(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+    base_url = http_server(Ok)
+    monkeypatch.setattr(ai_gateway, "MESH_DEPENDENCY_AI_GATEWAY_BASE_URL", base_url)
+
+    unified = UnifiedProvider().client._client
+    vertex = AnthropicAIGatewayProvider().client._client
+    bedrock = AnthropicAIGatewayBedrockProvider().client._client
+    assert unified._transport is vertex._transport is bedrock._transport is get_shared_transport()
+    assert unified.timeout == get_gateway_timeout()
+    assert unified.timeout.connect == 10.0 and unified.timeout.read == 900.0
+
+    async def request_after_closing_another_client():
+        async with AsyncClient(transport=get_shared_transport()) as client:
+            await client.get(base_url)
+        async with AsyncClient(transport=get_shared_transport()) as client:
+            return await client.get(base_url)
+
+    assert asyncio.run(request_after_closing_another_client()).text == "ok"
+
+
+def test_pooled_connections_are_usable_from_a_new_event_loop(http_server, monkeypatch):
+    class KeepAliveGateway(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            body = json.dumps(
+                {
+                    "response_payload": {
+                        "id": "1",
+                        "object": "chat.completion",
+                        "choices": [
+                            {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}
+                        ],
+                    },
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    monkeypatch.setattr(ai_gateway, "MESH_DEPENDENCY_AI_GATEWAY_BASE_URL", http_server(KeepAliveGateway))
+    provider = UnifiedProvider()
+
+    async def complete() -> str:
+        completion = await provider.client.chat.completions.create(
+            model="gemini-2.5-flash", messages=[{"role": "user", "content": "hi"}]
+        )
+        return completion.choices[0].message.content
+
+    # The connection kept alive by the first event loop is not reused from the second one
+    assert [asyncio.run(complete()) for _ in range(2)] == ["ok", "ok"]
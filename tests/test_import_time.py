@@ -0,0 +1,71 @@
+"""Import-time budget for lightweight CLI commands."""
+
+import subprocess
+import sys
+
+import pytest
+
+# Cumulative import time (in microseconds) allowed for everything imported after interpreter startup.
+IMPORT_TIME_BUDGET_US = 250_000
+
+HEAVY_MODULES = ["nbconvert", "nbformat", "atlassian", "pydantic_ai", "bs4", "logfire", "anthropic", "openai"]
+
+
+def profile_imports(*args: str) -> tuple[dict[str, int], set[str]]:
+    """Run the CLI under `python -X importtime`.
+
+    Returns the cumulative time of each top-level import made after interpreter startup, and the names of all
+    modules imported after startup.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "handy_utils.cli", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports, modules = {}, set()
+    after_startup = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if after_startup:
+            modules.add(name.strip())
+        if not name.startswith("  "):
+            # `site` is the last module imported during interpreter startup
+            if after_startup:
+                imports[name.strip()] = int(cumulative)
+            after_startup = after_startup or name.strip() == "site"
+    return imports, modules
+
+
+@pytest.mark.parametrize("args", [["--help"], ["config", "path"]])
+def test_cli_import_time(args):
+    """Lightweight commands should not import heavy feature modules and should stay under the budget."""
+    imports, modules = profile_imports(*args)
+    assert "handy_utils" in imports
+    assert not [module for module in HEAVY_MODULES if module in modules]
+    assert sum(imports.values()) < IMPORT_TIME_BUDGET_US
+
+
+def test_feature_modules_import_without_side_effects():
+    """Importing feature modules should not spawn subprocesses or build models, exporters or MCP servers."""
+    script = """
+import subprocess
+
+class ForbiddenPopen(subprocess.Popen):
+    def __init__(self, *args, **kwargs):
+        raise AssertionError(f"subprocess spawned at import time: {args}")
+
+subprocess.Popen = ForbiddenPopen
+
+from handy_utils.convert_to_confluence.convert_to_confluence import get_exporter
+from handy_utils.generate_commit.generate_commit import get_model
+from handy_utils.researcher import deep_researcher
+
+assert get_exporter.cache_info().currsize == 0
+assert get_model.cache_info().currsize == 0
+assert deep_researcher.get_provider.cache_info().currsize == 0
+assert deep_researcher.get_junior_researcher.cache_info().currsize == 0
+"""
+    subprocess.run([sys.executable, "-c", script], check=True)
@@ -0,0 +1,74 @@
+"""Tests for the LLM response cache."""
+
+import asyncio
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from handy_utils.utils import ai_gateway
+from handy_utils.utils.llm_cache import get_llm_cache
+from handy_utils.utils.unified_provider import UnifiedProvider
+
+
+@pytest.fixture
+def llm_caching(monkeypatch):
+    monkeypatch.setattr(ai_gateway, "LLM_CACHING", True)
+    get_llm_cache.cache_clear()
+    yield
+    get_llm_cache.cache_clear()
+
+
+@pytest.fixture
+def echo_gateway(http_server, monkeypatch):
+    """Local gateway that echoes the prompt back and counts the requests it receives."""
+    requests = []
+
+    class EchoGateway(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            requests.append(request)
+            message = {"role": "assistant", "content": request["request_payload"]["messages"][0]["content"]}
+            body = json.dumps(
+                {
+                    "response_payload": {
+                        "id": "1",
+                        "choices": [{"index": 0, "finish_reason": "stop", "message": message}],
+                    }
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    monkeypatch.setattr(ai_gateway, "MESH_DEPENDENCY_AI_GATEWAY_BASE_URL", http_server(EchoGateway))
+    return requests
+
+
+async def complete(prompt: str, **kwargs) -> str:
+    completion = await UnifiedProvider().client.chat.completions.create(
+        model="gemini-2.5-flash", messages=[{"role": "user", "content": prompt}], **kwargs
+    )
+    return completion.choices[0].message.content
+
+
+def test_identical_requests_are_served_from_cache(llm_caching, echo_gateway):
+    assert asyncio.run(complete("first")) == "first"
+    assert asyncio.run(complete("first")) == "first"
+    assert asyncio.run(complete("second")) == "second"
+    assert asyncio.run(complete("second", temperature=0.5)) == "second"
+
+    assert len(echo_gateway) == 3
+    stats = get_llm_cache().stats()
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+    assert stats["size"] > 0
+
+
+def test_responses_are_not_cached_without_llm_caching(echo_gateway):
+    get_llm_cache.cache_clear()
+    asyncio.run(complete("first"))
+    asyncio.run(complete("first"))
+
+    assert len(echo_gateway) == 2
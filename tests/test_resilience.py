@@ -0,0 +1,129 @@
+"""Tests for the AI Gateway retry and rate limiting layer."""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import openai
+import pytest
+from httpx import Response
+
+from handy_utils.utils import ai_gateway
+from handy_utils.utils.resilience import GatewayLimiter, RetryPolicy, TokenBucket
+from handy_utils.utils.unified_provider import UnifiedProvider
+
+COMPLETION = {
+    "response_payload": {
+        "id": "1",
+        "object": "chat.completion",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+    },
+}
+
+
+@pytest.fixture
+def flaky_gateway(http_server, monkeypatch):
+    """Local gateway that throttles the first `throttled` requests with a 429."""
+
+    def start(throttled: int) -> dict:
+        stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0}
+        lock = threading.Lock()
+
+        class FlakyGateway(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                with lock:
+                    stats["requests"] += 1
+                    stats["in_flight"] += 1
+                    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+                    is_throttled = stats["requests"] <= throttled
+                time.sleep(0.02)
+                body = json.dumps({"error": "rate limited"} if is_throttled else COMPLETION).encode()
+                self.send_response(429 if is_throttled else 200)
+                if is_throttled:
+                    self.send_header("Retry-After", "0")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with lock:
+                    stats["in_flight"] -= 1
+
+        monkeypatch.setattr(ai_gateway, "MESH_DEPENDENCY_AI_GATEWAY_BASE_URL", http_server(FlakyGateway))
+        return stats
+
+    return start
+
+
+async def complete(provider: UnifiedProvider) -> str:
+    completion = await provider.client.chat.completions.create(
+        model="gemini-2.5-flash", messages=[{"role": "user", "content": "hi"}]
+    )
+    return completion.choices[0].message.content
+
+
+def test_throttled_batch_completes_within_concurrency_limit(configure, flaky_gateway):
+    configure(gateway_max_concurrency_per_model=4)
+    stats = flaky_gateway(throttled=10)
+
+    async def run_batch():
+        provider = UnifiedProvider()
+        return await asyncio.gather(*(complete(provider) for _ in range(20)))
+
+    assert asyncio.run(run_batch()) == ["ok"] * 20
+    assert stats["requests"] == 30
+    assert stats["max_in_flight"] <= 4
+
+
+def test_exhausted_retries_raise_typed_error(configure, flaky_gateway):
+    configure(gateway_max_retries=2)
+    stats = flaky_gateway(throttled=100)
+
+    with pytest.raises(openai.RateLimitError) as exc_info:
+        asyncio.run(complete(UnifiedProvider()))
+
+    assert exc_info.value.status_code == 429
+    assert stats["requests"] == 3
+
+
+def test_retry_policy_honors_retry_after():
+    policy = RetryPolicy(initial_delay=1, max_delay=10)
+
+    assert policy.get_delay(0, Response(429, headers={"Retry-After": "3"})) == 3
+    assert policy.get_delay(0, Response(429, headers={"retry-after-ms": "250"})) == 0.25
+    assert policy.get_delay(0, Response(429, headers={"Retry-After": "120"})) == 10
+    assert 0 <= policy.get_delay(2, Response(503)) <= 4
+
+
+def test_token_bucket_limits_request_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+
+    async def acquire_many():
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(acquire_many()) >= 0.09
+
+
+def test_limiter_is_shared_across_event_loops():
+    limiter = GatewayLimiter(max_concurrency_per_model=1)
+    stats = {"in_flight": 0, "max_in_flight": 0}
+
+    async def request():
+        async with limiter.limit("model"):
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            await asyncio.sleep(0.01)
+            stats["in_flight"] -= 1
+
+    async def contend():
+        await asyncio.gather(*(request() for _ in range(3)))
+
+    # Waiting on the semaphores again from a new event loop does not fail
+    for _ in range(2):
+        asyncio.run(contend())
+    assert stats["max_in_flight"] == 1
@@ -0,0 +1,182 @@
+"""Tests for the unified AI Gateway provider."""
+
+import asyncio
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from handy_utils.utils import ai_gateway
+from handy_utils.utils.unified_provider import UnifiedProvider
+
+
+@pytest.fixture
+def gateway(http_server, monkeypatch):
+    """Point the AI Gateway utilities at a local stub server."""
+
+    def start(handler: type[BaseHTTPRequestHandler]) -> str:
+        base_url = http_server(handler)
+        monkeypatch.setattr(ai_gateway, "MESH_DEPENDENCY_AI_GATEWAY_BASE_URL", base_url)
+        return base_url
+
+    return start
+
+
+def sse(event: dict) -> bytes:
+    return f"data: {json.dumps(event)}\n\n".encode()
+
+
+def test_streaming_yields_chunks_before_the_body_is_complete(gateway):
+    first_chunk_received = threading.Event()
+    last_byte_sent = threading.Event()
+    requests = []
+
+    class StreamingGateway(BaseHTTPRequestHandler):
+        def do_POST(self):
+            requests.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.write_chunk(
+                sse({"response_payload": {"id": "1", "choices": [{"index": 0, "delta": {"content": "Hel"}}]}})
+            )
+            first_chunk_received.wait(timeout=5)
+            self.write_chunk(
+                sse(
+                    {
+                        "response_payload": {
+                            "id": "1",
+                            "choices": [{"index": 0, "delta": {"content": [{"type": "text", "text": "lo"}]}}],
+                        }
+                    }
+                )
+            )
+            self.write_chunk(
+                sse(
+                    {
+                        "response_payload": {"id": "1", "choices": []},
+                        "platform_attributes": {
+                            "metrics": {"usage": {"input_tokens": 3, "output_tokens": 2, "total_tokens": 5}}
+                        },
+                    }
+                )
+            )
+            self.write_chunk(b"data: [DONE]\n\n")
+            last_byte_sent.set()
+            self.write_chunk(b"")
+
+        def write_chunk(self, data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    gateway(StreamingGateway)
+
+    async def stream_completion():
+        client = UnifiedProvider().client
+        stream = await client.chat.completions.create(
+            model="gemini-2.5-flash", messages=[{"role": "user", "content": "hi"}], stream=True
+        )
+        chunks = []
+        async for chunk in stream:
+            if not chunks:
+                assert not last_byte_sent.is_set()
+                first_chunk_received.set()
+            chunks.append(chunk)
+        return chunks
+
+    chunks = asyncio.run(stream_completion())
+
+    assert "".join(c.choices[0].delta.content for c in chunks if c.choices) == "Hello"
+    assert chunks[0].model == "gemini-2.5-flash"
+    assert chunks[-1].usage.total_tokens == 5
+    assert requests[0]["platform_attributes"] == {"model": "gemini-2.5-flash"}
+    assert requests[0]["request_payload"]["stream"] is True
+
+
+def test_completion_is_translated_to_openai_format(gateway):
+    class Gateway(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            body = gzip.compress(
+                json.dumps(
+                    {
+                        "response_payload": {
+                            "id": "1",
+                            "object": "chat.completion",
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "finish_reason": "stop",
+                                    "message": {
+                                        "role": "assistant",
+                                        "content": [
+                                            {
+                                                "type": "text",
+                                                "text": request["request_payload"]["messages"][0]["content"],
+                                            }
+                                        ],
+                                    },
+                                }
+                            ],
+                        },
+                        "platform_attributes": {
+                            "metrics": {"usage": {"input_tokens": 3, "output_tokens": 2, "total_tokens": 5}}
+                        },
+                    }
+                ).encode()
+            )
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    gateway(Gateway)
+
+    async def complete():
+        return await UnifiedProvider().client.chat.completions.create(
+            model="gemini-2.5-flash", messages=[{"role": "user", "content": "héllo"}]
+        )
+
+    completion = asyncio.run(complete())
+
+    assert completion.choices[0].message.content == "héllo"
+    assert completion.model == "gemini-2.5-flash"
+    assert completion.usage.total_tokens == 5
+
+
+def test_cached_prompt_tokens_are_reported_as_openai_usage(gateway):
+    class CachingGateway(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            usage = {"input_tokens": 2000, "output_tokens": 10, "total_tokens": 2010, "cached_input_tokens": 1500}
+            body = json.dumps(
+                {
+                    "response_payload": {
+                        "id": "1",
+                        "choices": [
+                            {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}
+                        ],
+                    },
+                    "platform_attributes": {"metrics": {"usage": usage}},
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    gateway(CachingGateway)
+    completion = asyncio.run(
+        UnifiedProvider().client.chat.completions.create(
+            model="gemini-2.5-flash", messages=[{"role": "user", "content": "hi"}]
+        )
+    )
+
+    assert completion.usage.prompt_tokens == 2000
+    assert completion.usage.prompt_tokens_details.cached_tokens == 1500